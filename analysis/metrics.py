@@ -6,20 +6,80 @@ import json
 import os
 import re
 import sys
+from typing import Any, Iterable, Iterator
 
 sys.path.append(os.getcwd())
 
+from utils.batch import OutputRecord, print_counts, read_batch_output, read_jsonl
+from utils.config import get_paths
 from utils.cost import calculate_cost_batch_input, calculate_cost_batch_output
+from utils.pack import load_packs
 
-with open('paths.json') as file:
-    paths = json.load(file)
+paths = get_paths()
 
 
-def calculate_accuracies(requests_output: list[str], targets: dict[str, list], batch_id: str) -> tuple[int, int]:
+def get_requested_pmcids(batch_id: str) -> set[str] | None:
+    """
+    Get the PMCIDs of the articles requested in a batch, including each article of packed requests.
+    :param batch_id: A unique identifier for the batch.
+    :return: The set of PMCIDs or None if the batch input file is not present.
+    """
+
+    # Read the custom ID of each request in the batch input
+    batch_input = paths['batch']['input'].format(batch_id=batch_id)
+    if not os.path.exists(batch_input):
+        return None
+    packs = load_packs(batch_id)
+    return {
+        article_pmcid
+        for request_input in read_jsonl(batch_input)
+        for article_pmcid in packs.get(request_input['custom_id'], [request_input['custom_id']])
+    }
+
+
+def get_predictions(
+    records: Iterable[OutputRecord],
+    targets: dict[str, list],
+    requested: set[str] | None
+) -> Iterator[tuple[str, Any, list | None]]:
+    """
+    Get the predicted genes of each article in a set, including articles without an output record.
+    :param records: Records read from the batch output file.
+    :param targets: A dictionary mapping article PMCIDs in the set to their expected targets.
+    :param requested: The PMCIDs of the articles requested in the batch, or None if they are unknown.
+    :return: An iterator over tuples containing the article's PMCID, the content or error of its record, and its
+    predicted genes. Predictions are None if the request failed or the article was requested but has no record, and
+    empty if the article was left out of the batch (e.g. by triage).
+    """
+
+    # Predictions from each record
+    seen = set()
+    for record in records:
+        seen.add(record.custom_id)
+        if record.error is None:
+            yield record.custom_id, record.content, record.content['genes']
+        else:
+            print(f"{record.custom_id}: {record.error}", file=sys.stderr)
+            yield record.custom_id, record.error, None
+
+    # Articles left out of the batch predict no genes, while requested articles without a record failed
+    for pmcid in targets:
+        if pmcid in seen:
+            continue
+        if requested is not None and pmcid not in requested:
+            yield pmcid, "Not requested", []
+        else:
+            print(f"{pmcid}: No output", file=sys.stderr)
+            yield pmcid, "No output", None
+
+
+def calculate_accuracies(records: Iterable[OutputRecord], targets: dict[str, list], batch_id: str) -> tuple[int, int]:
     """
     Calculate the positive accuracy (accuracy on articles containing gene signature) and negative accuracy (accuracy on
-    articles not containing gene signatures) of a batch.
-    :param requests_output: A list of output requests as strings.
+    articles not containing gene signatures) of a batch. Articles in the set that were left out of the batch input, such
+    as those skipped by triage, are scored as predicting no genes, and requested articles without an output are scored
+    as failed, so accuracies always cover the whole set.
+    :param records: Records read from the batch output file.
     :param targets: A dictionary mapping article PMCIDs in the set to their expected targets.
     :param batch_id: A unique identifier for the batch.
     :return: A tuple containing the positive and negative accuracies.
@@ -32,20 +92,9 @@ def calculate_accuracies(requests_output: list[str], targets: dict[str, list], b
     # Log request and accuracy information
     with open(paths['logs']['analysis']['accuracy'].format(batch_id=batch_id), 'w') as log:
 
-        # Load individual requests
-        for request_output in requests_output:
-            request_output = json.loads(request_output)
-
-            # Log request information and expected target
-            pmcid = request_output['custom_id']
+        # Log request information and expected target for each record, followed by each article without a record
+        for pmcid, content, prediction in get_predictions(records, targets, get_requested_pmcids(batch_id)):
             target = targets[pmcid]
-            try:
-                content = json.loads(request_output['response']['body']['choices'][0]['message']['content'])
-                prediction = content['genes']
-            except json.JSONDecodeError as exception:
-                print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
-                content = f"{type(exception).__name__}: {exception}"
-                prediction = None
             log.write(f"PMCID: {pmcid}\n")
             log.write(f"Content: {content}\n")
             log.write(f"Target: {target}\n")
@@ -71,10 +120,10 @@ def calculate_accuracies(requests_output: list[str], targets: dict[str, list], b
     return correct['positive'] / total['positive'], correct['negative'] / total['negative']
 
 
-def calculate_costs(requests_output: list[str]) -> tuple[float, float]:
+def calculate_costs(records: Iterable[OutputRecord]) -> tuple[float, float]:
     """
     Calculate the total costs of a batch.
-    :param requests_output: A list of output requests as strings.
+    :param records: Records read from the batch output file.
     :return: A tuple containing the total input and output costs.
     """
 
@@ -82,18 +131,14 @@ def calculate_costs(requests_output: list[str]) -> tuple[float, float]:
     cost_input = 0
     cost_output = 0
 
-    # Total costs from each request
-    for request_output in requests_output:
-        request_output = json.loads(request_output)
-
-        # Extract information from chat completion
-        tokens_input = request_output['response']['body']['usage']['prompt_tokens']
-        tokens_output = request_output['response']['body']['usage']['completion_tokens']
-        model = request_output['response']['body']['model']
+    # Total costs from each request that reports its usage
+    for record in records:
+        if record.usage is None or record.model is None:
+            continue
 
         # Calculate input and output costs
-        cost_input += calculate_cost_batch_input(tokens_input, model)
-        cost_output += calculate_cost_batch_output(tokens_output, model)
+        cost_input += calculate_cost_batch_input(record.usage['prompt_tokens'], record.model)
+        cost_output += calculate_cost_batch_output(record.usage['completion_tokens'], record.model)
 
     # Return costs
     return cost_input, cost_output
@@ -142,9 +187,10 @@ def save_metrics(metrics: pd.Series) -> None:
 
 
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
     """
     Calculate and save metrics.
+    :param argv: Command line arguments to parse instead of those passed to the script.
     """
 
     # Command line help messages
@@ -159,7 +205,7 @@ def main() -> None:
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--val-set', action='store_true', help=help_val_set)
     group.add_argument('--test-set', action='store_true', help=help_test_set)
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Get set-specific information
     match args.val_set, args.test_set:
@@ -172,14 +218,16 @@ def main() -> None:
                 targets = json.load(file)
             set_name = 'test'
 
-    # Read the batch file
+    # Calculate accuracies and cost, streaming the batch output file once for each
     batch_id = f'{set_name}_{args.prompt_number:02d}'
-    with open(paths['batch']['output'].format(batch_id=batch_id)) as file:
-        requests_output = file.readlines()
-
-    # Calculate and save accuracies and cost
-    positive_accuracy, negative_accuracy = calculate_accuracies(requests_output, targets, batch_id)
-    cost_input, cost_output = calculate_costs(requests_output)
+    batch_output = paths['batch']['output'].format(batch_id=batch_id)
+    counts = {}
+    records = read_batch_output(batch_output, counts)
+    positive_accuracy, negative_accuracy = calculate_accuracies(records, targets, batch_id)
+    cost_input, cost_output = calculate_costs(read_batch_output(batch_output))
+    print_counts(counts)
+
+    # Save accuracies and cost
     save_metrics(pd.Series({
         'set': set_name,
         'prompt_number': args.prompt_number,
@@ -9,3 +9,22 @@ python3 db/insert_data.py
 
 # A demonstration of inserting gene signatures (from validation results for prompt 5)
 # python3 db/insert_gene_signatures.py 5 --val-set
+
+# A demonstration of indexing gene mentions in articles and searching the index
+# python3 db/insert_gene_mentions.py --val-set
+# python3 db/search_gene_mentions.py TP53
+
+# A demonstration of searching for gene signatures similar to a set of genes
+# python3 db/search_signatures.py TP53 BRCA1 EGFR -k 5
+
+# A demonstration of listing the genes that appear most often in gene signatures alongside a gene
+# python3 db/search_gene_cooccurrences.py TP53
+
+# A demonstration of indexing article texts for full-text search and running a ranked query
+# python3 db/insert_article_texts.py --val-set
+# python3 db/search_articles.py '"gene signature" AND prognostic' -n 10
+
+# A demonstration of serving read-only lookups over HTTP while gene signatures are inserted
+# python3 db/serve.py -p 8080 &
+# curl localhost:8080/signatures/PMC1234567
+# curl localhost:8080/genes/TP53/signatures
@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.fts import create_article_text_table, get_missing_text_pmcids, insert_article_texts
+from utils.genes import load_gene_vocabulary
+from utils.regex import get_pmcid_from_filename
+from utils.sql import connect_wal
+
+paths = get_paths()
+articles_texts = paths['data']['articles']['texts']
+db = paths['db']['sqlite']
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Index article texts for full-text search.
+    :param argv: Command line arguments to parse instead of those passed to the script.
+    """
+
+    # Command line help messages
+    description = (
+        "Save the text of articles in a SQLite FTS5 table for ranked full-text search. "
+        "Articles that have already been indexed from the same source are skipped unless reindexing."
+    )
+    help_source = (
+        "Index either all lines before the references ('texts') or only lines mentioning at least two gene symbols "
+        "('relevant')."
+    )
+    help_val_set = "Index the validation set instead of the entire dataset."
+    help_test_set = "Index the test set instead of the entire dataset."
+    help_reindex = "Index all articles again, even if they have already been indexed."
+    help_max_processes = "The maximum number of processes to use for reading articles."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-s', '--source', default='texts', choices=['texts', 'relevant'], help=help_source)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--val-set', action='store_true', help=help_val_set)
+    group.add_argument('--test-set', action='store_true', help=help_test_set)
+    parser.add_argument('--reindex', action='store_true', help=help_reindex)
+    parser.add_argument('-m', '--max-processes', default=5, type=int, help=help_max_processes)
+    args = parser.parse_args(argv)
+
+    # Get the PMCIDs of articles to index
+    match args.val_set, args.test_set:
+        case False, False:
+            article_pmcids = [
+                get_pmcid_from_filename(article_filename)
+                for article_filename in os.listdir(articles_texts)
+            ]
+        case True, False:
+            with open(paths['run']['targets']['val']) as file:
+                article_pmcids = list(json.load(file).keys())
+        case False, True:
+            with open(paths['run']['targets']['test']) as file:
+                article_pmcids = list(json.load(file).keys())
+
+    # Create the full-text search table if needed
+    con = connect_wal(db)
+    try:
+        create_article_text_table(con)
+    except sqlite3.OperationalError as exception:
+        print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
+        print("Full-text search requires SQLite with FTS5.", file=sys.stderr)
+        sys.exit(1)
+
+    # Skip articles that have already been indexed
+    if not args.reindex:
+        article_pmcids = get_missing_text_pmcids(article_pmcids, args.source, con)
+    print(f"Articles to Index: {len(article_pmcids)}")
+
+    # Index article texts
+    genes_regex = load_gene_vocabulary()['genes_regex'] if args.source == 'relevant' else None
+    insert_article_texts(article_pmcids, args.source, genes_regex, args.max_processes, args.reindex, con)
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,19 @@
 import pandas as pd
 
-import json
+import os
 import sqlite3
+import sys
 
-with open('paths.json') as file:
-    paths = json.load(file)
-    articles_info = paths['data']['articles']['info']
-    genes_info = paths['data']['genes']['info']
-    db = paths['db']['sqlite']
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.instrument import stage
+from utils.sql import connect_wal
+
+paths = get_paths()
+articles_info = paths['data']['articles']['info']
+genes_info = paths['data']['genes']['info']
+db = paths['db']['sqlite']
 
 
 def insert_articles_info(con: sqlite3.Connection) -> None:
@@ -17,30 +23,39 @@ def insert_articles_info(con: sqlite3.Connection) -> None:
     """
 
     # Read data on articles
-    data = pd.read_csv(articles_info, sep='\t', dtype=object)
+    with stage('csv_load', table='Article') as event:
+        data = pd.read_csv(articles_info, sep='\t', dtype=object)
+        event['items'] = data.shape[0]
+        event['bytes'] = os.path.getsize(articles_info)
 
     # Insert article information
-    table_article = data.drop(columns=['author']).drop_duplicates(ignore_index=True)
-    table_article.to_sql('Article', con, if_exists='append', index=False)
+    with stage('db_insert', table='Article') as event:
+        table_article = data.drop(columns=['author']).drop_duplicates(ignore_index=True)
+        table_article.to_sql('Article', con, if_exists='append', index=False)
+        event['items'] = table_article.shape[0]
 
     # Insert author information
-    table_author = data['author'].dropna().drop_duplicates(ignore_index=True).to_frame(name='name')
-    table_author['id'] = table_author.index + 1
-    table_author.to_sql('Author', con, if_exists='append', index=False)
+    with stage('db_insert', table='Author') as event:
+        table_author = data['author'].dropna().drop_duplicates(ignore_index=True).to_frame(name='name')
+        table_author['id'] = table_author.index + 1
+        table_author.to_sql('Author', con, if_exists='append', index=False)
+        event['items'] = table_author.shape[0]
 
     # Insert information on which authors contributed to which articles
-    table_article_author = pd.merge(
-        data[['pmcid', 'author']].dropna().drop_duplicates(ignore_index=True),
-        table_author,
-        how='inner',
-        left_on='author',
-        right_on='name',
-    )
-    table_article_author = table_article_author[['pmcid', 'id']].rename(columns={
-        'pmcid': 'article_pmcid',
-        'id': 'author_id',
-    })
-    table_article_author.to_sql('ArticleAuthor', con, if_exists='append', index=False)
+    with stage('db_insert', table='ArticleAuthor') as event:
+        table_article_author = pd.merge(
+            data[['pmcid', 'author']].dropna().drop_duplicates(ignore_index=True),
+            table_author,
+            how='inner',
+            left_on='author',
+            right_on='name',
+        )
+        table_article_author = table_article_author[['pmcid', 'id']].rename(columns={
+            'pmcid': 'article_pmcid',
+            'id': 'author_id',
+        })
+        table_article_author.to_sql('ArticleAuthor', con, if_exists='append', index=False)
+        event['items'] = table_article_author.shape[0]
 
 
 def insert_genes_info(con: sqlite3.Connection) -> None:
@@ -50,24 +65,31 @@ def insert_genes_info(con: sqlite3.Connection) -> None:
     """
 
     # Read data on genes
-    data = pd.read_csv(genes_info, sep='\t', dtype=object)
+    with stage('csv_load', table='Gene') as event:
+        data = pd.read_csv(genes_info, sep='\t', dtype=object)
+        event['items'] = data.shape[0]
+        event['bytes'] = os.path.getsize(genes_info)
 
     # Insert gene information
-    table_gene = data.drop(columns=['external_synonym']).drop_duplicates(ignore_index=True)
-    table_gene = table_gene.rename(columns={
-        'ensembl_gene_id': 'ensembl_id',
-        'external_gene_name': 'name',
-        'chromosome_name': 'chromosome',
-    })
-    table_gene.to_sql('Gene', con, if_exists='append', index=False)
+    with stage('db_insert', table='Gene') as event:
+        table_gene = data.drop(columns=['external_synonym']).drop_duplicates(ignore_index=True)
+        table_gene = table_gene.rename(columns={
+            'ensembl_gene_id': 'ensembl_id',
+            'external_gene_name': 'name',
+            'chromosome_name': 'chromosome',
+        })
+        table_gene.to_sql('Gene', con, if_exists='append', index=False)
+        event['items'] = table_gene.shape[0]
 
     # Insert gene synonym information
-    table_gene_synonym = data[['ensembl_gene_id', 'external_synonym']].dropna().drop_duplicates(ignore_index=True)
-    table_gene_synonym = table_gene_synonym.rename(columns={
-        'ensembl_gene_id': 'gene_ensembl_id',
-        'external_synonym': 'name',
-    })
-    table_gene_synonym.to_sql('GeneSynonym', con, if_exists='append', index=False)
+    with stage('db_insert', table='GeneSynonym') as event:
+        table_gene_synonym = data[['ensembl_gene_id', 'external_synonym']].dropna().drop_duplicates(ignore_index=True)
+        table_gene_synonym = table_gene_synonym.rename(columns={
+            'ensembl_gene_id': 'gene_ensembl_id',
+            'external_synonym': 'name',
+        })
+        table_gene_synonym.to_sql('GeneSynonym', con, if_exists='append', index=False)
+        event['items'] = table_gene_synonym.shape[0]
 
 
 def main() -> None:
@@ -76,7 +98,7 @@ def main() -> None:
     """
 
     # Open a connection to the database
-    con = sqlite3.connect(db)
+    con = connect_wal(db)
 
     # Insert information on articles and genes
     insert_articles_info(con)
@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.cooccurrence import rebuild_cooccurrences
+from utils.sql import connect_wal
+
+paths = get_paths()
+db = paths['db']['sqlite']
+
+
+def main() -> None:
+    """
+    Recount gene frequencies and co-occurrences from all gene signatures in a SQLite database.
+    """
+
+    # Recount all gene signatures
+    con = connect_wal(db)
+    rebuild_cooccurrences(con)
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.genes import load_gene_vocabulary
+from utils.index import get_unindexed_pmcids, index_gene_mentions
+from utils.regex import get_pmcid_from_filename
+from utils.sql import connect_wal
+
+paths = get_paths()
+articles_texts = paths['data']['articles']['texts']
+db = paths['db']['sqlite']
+
+
+def main() -> None:
+    """
+    Index gene mentions in articles.
+    """
+
+    # Command line help messages
+    description = (
+        "Search articles for gene symbols and save each mention in a SQLite database. "
+        "Articles that have already been indexed with the current gene vocabulary are skipped unless reindexing."
+    )
+    help_val_set = "Index the validation set instead of the entire dataset."
+    help_test_set = "Index the test set instead of the entire dataset."
+    help_reindex = "Index all articles again, even if they have already been indexed."
+    help_max_processes = "The maximum number of processes to use for regex processing."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--val-set', action='store_true', help=help_val_set)
+    group.add_argument('--test-set', action='store_true', help=help_test_set)
+    parser.add_argument('--reindex', action='store_true', help=help_reindex)
+    parser.add_argument('-m', '--max-processes', default=5, type=int, help=help_max_processes)
+    args = parser.parse_args()
+
+    # Get the PMCIDs of articles to index
+    match args.val_set, args.test_set:
+        case False, False:
+            article_pmcids = [
+                get_pmcid_from_filename(article_filename)
+                for article_filename in os.listdir(articles_texts)
+            ]
+        case True, False:
+            with open(paths['run']['targets']['val']) as file:
+                article_pmcids = list(json.load(file).keys())
+        case False, True:
+            with open(paths['run']['targets']['test']) as file:
+                article_pmcids = list(json.load(file).keys())
+
+    # Skip articles that have already been indexed with the current gene vocabulary
+    vocabulary = load_gene_vocabulary()
+    con = connect_wal(db)
+    if not args.reindex:
+        article_pmcids = get_unindexed_pmcids(article_pmcids, vocabulary['fingerprint'], con)
+    print(f"Articles to Index: {len(article_pmcids)}")
+
+    # Index gene mentions
+    index_gene_mentions(
+        article_pmcids,
+        vocabulary['genes_regex'],
+        vocabulary['genes_ensembl_ids'],
+        vocabulary['fingerprint'],
+        args.max_processes,
+        con,
+    )
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
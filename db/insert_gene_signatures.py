@@ -1,95 +1,102 @@
 import pandas as pd
 
 import argparse
-import json
 import os
 import sqlite3
 import sys
 
 sys.path.append(os.getcwd())
 
-from utils.sql import get_query
+from utils.batch import print_counts, read_batch_output
+from utils.config import get_paths
+from utils.cooccurrence import insert_signature_genes
+from utils.genes import load_gene_vocabulary
+from utils.instrument import set_profiler, stage
+from utils.shard import get_shard_batch_id, parse_shard
+from utils.similarity import build_signature_index, save_signature_index
+from utils.sql import connect_wal
 
-with open('paths.json') as file:
-    paths = json.load(file)
-    db = paths['db']['sqlite']
+paths = get_paths()
+db = paths['db']['sqlite']
 
 
-def get_ensembl_id(gene: str, con: sqlite3.Connection) -> str | None:
+def get_ensembl_id(gene: str, genes_ensembl_ids: dict[str, list[str]]) -> str | None:
     """
-    Given the name of a gene, get its Ensembl ID.
+    Given the name of a gene, get its Ensembl ID. Gene names are preferred over synonyms for other genes.
     :param gene: The gene name.
-    :param con: A connection to the SQLite database.
+    :param genes_ensembl_ids: A dictionary mapping gene symbols to lists of Ensembl IDs from the gene vocabulary.
     :return: The Ensembl ID of the gene or None if no corresponding Ensembl ID is found.
     """
 
-    # Assuming the name refers to the gene name, get the Ensembl ID
-    query_gene_name = pd.read_sql_query(get_query('gene_name'), con, params={'gene': gene})
-    if not query_gene_name.empty:
-        return query_gene_name.loc[0, 'ensembl_id']
-
-    # Try treating the name as a synonym for another gene name and get the Ensembl ID
-    query_gene_synonym_name = pd.read_sql_query(get_query('gene_synonym_name'), con, params={'synonym': gene})
-    if not query_gene_synonym_name.empty:
-        return query_gene_synonym_name.loc[0, 'ensembl_id']
-    
-    # Return None otherwise
-    return None
+    # Ensembl IDs of genes with the name come before those of genes with the name as a synonym
+    ensembl_ids = genes_ensembl_ids.get(gene)
+    return ensembl_ids[0] if ensembl_ids else None
 
 
-def format_gene_signature(pmcid: str, genes: list[str], con: sqlite3.Connection) -> pd.DataFrame:
+def format_gene_signature(pmcid: str, genes: list[str], genes_ensembl_ids: dict[str, list[str]]) -> pd.DataFrame:
     """
     Format a gene signature found in an article to make it ready to insert into the SQLite database.
     :param pmcid: The PMCID of the article.
     :param genes: A list of genes in the gene signature.
-    :param con: A connection to the SQLite database.
+    :param genes_ensembl_ids: A dictionary mapping gene symbols to lists of Ensembl IDs from the gene vocabulary.
     :return: A DataFrame compliant with the database schema containing information on the gene signature.
     """
 
     # Format gene signature information
     table_gene_signature = pd.DataFrame({
         'article_pmcid': pmcid,
-        'gene_ensembl_id': [get_ensembl_id(gene, con) for gene in genes],
+        'gene_ensembl_id': [get_ensembl_id(gene, genes_ensembl_ids) for gene in genes],
     })
     table_gene_signature = table_gene_signature.dropna().drop_duplicates(ignore_index=True)
     return table_gene_signature
 
 
 
-def insert_gene_signatures(requests_output: list[str], con: sqlite3.Connection) -> None:
+def insert_gene_signatures(batch_output: str, con: sqlite3.Connection, max_processes: int = 1) -> None:
     """
     Insert all gene signatures from a batch output into the SQLite database.
-    :param requests_output: A list of output requests as strings.
+    :param batch_output: The path to the batch output file.
     :param con: A connection to the SQLite database.
+    :param max_processes: The maximum number of processes to use for parsing the batch output file.
     """
 
+    # Load the gene vocabulary for looking up Ensembl IDs
+    genes_ensembl_ids = load_gene_vocabulary()['genes_ensembl_ids']
+
     # Initialize a list for storing tables of invidual gene signatures
     table_gene_signature = []
 
     # Get gene signatures from each request
-    for request_output in requests_output:
-        request_output = json.loads(request_output)
-
-        # Get the PMCID of the article and the gene signature found in the article if possible
-        pmcid = request_output['custom_id']
-        try:
-            content = json.loads(request_output['response']['body']['choices'][0]['message']['content'])
-            genes = content['genes']
-        except json.JSONDecodeError as exception:
-            print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
-            continue
-        
-        # Format the gene signature within the request to comply with the database schema
-        table_gene_signature.append(format_gene_signature(pmcid, genes, con))
-    
-    # Insert gene signature information
-    table_gene_signature = pd.concat(table_gene_signature, ignore_index=True)
-    table_gene_signature.to_sql('GeneSignature', con, if_exists='append', index=False)
+    with stage('gene_lookup') as event:
+        counts = {}
+        for record in read_batch_output(batch_output, counts, max_processes):
+
+            # Skip requests without a gene signature
+            if record.error is not None:
+                print(f"{record.custom_id}: {record.error}", file=sys.stderr)
+                continue
 
+            # Format the gene signature within the request to comply with the database schema
+            table_gene_signature.append(
+                format_gene_signature(record.custom_id, record.content['genes'], genes_ensembl_ids)
+            )
+            event['items'] += 1
+        event['bytes'] = counts['bytes']
+        print_counts(counts)
 
-def main() -> None:
+    # Nothing to insert if no response had a gene signature
+    if len(table_gene_signature) == 0:
+        print("No gene signatures to insert.", file=sys.stderr)
+        return
+
+    # Insert gene signature information along with gene frequency and co-occurrence counts
+    insert_signature_genes(pd.concat(table_gene_signature, ignore_index=True), con)
+
+
+def main(argv: list[str] | None = None) -> None:
     """
     Insert gene signatures into a SQLite database.
+    :param argv: Command line arguments to parse instead of those passed to the script.
     """
 
     # Command line help messages
@@ -97,6 +104,9 @@ def main() -> None:
     help_prompt_number = "The number in the prompt filename."
     help_val_set = "Insert batch output from the validation set instead of the entire dataset."
     help_test_set = "Insert batch output from the test set instead of the entire dataset."
+    help_shard = "Insert the batch output of shard i of N (given as i/N) instead of the whole batch."
+    help_max_processes = "The maximum number of processes to use for parsing the batch output file."
+    help_profile = "Profile each stage with the specified profiler and save the results under logs/profiles."
 
     # Parse command line arguments
     parser = argparse.ArgumentParser(description=description)
@@ -104,7 +114,11 @@ def main() -> None:
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--val-set', action='store_true', help=help_val_set)
     group.add_argument('--test-set', action='store_true', help=help_test_set)
-    args = parser.parse_args()
+    parser.add_argument('--shard', type=parse_shard, help=help_shard)
+    parser.add_argument('-m', '--max-processes', default=1, type=int, help=help_max_processes)
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], help=help_profile)
+    args = parser.parse_args(argv)
+    set_profiler(args.profile)
 
     # Get the batch ID
     match args.val_set, args.test_set:
@@ -114,14 +128,15 @@ def main() -> None:
             batch_id = f'val_{args.prompt_number:02d}'
         case False, True:
             batch_id = f'test_{args.prompt_number:02d}'
-
-    # Read the batch file
-    with open(paths['batch']['output'].format(batch_id=batch_id)) as file:
-        requests_output = file.readlines()
+    batch_id = get_shard_batch_id(batch_id, args.shard)
 
     # Insert gene signature information
-    con = sqlite3.connect(db)
-    insert_gene_signatures(requests_output, con)
+    con = connect_wal(db)
+    insert_gene_signatures(paths['batch']['output'].format(batch_id=batch_id), con, args.max_processes)
+    con.commit()
+
+    # Rebuild the gene signature search index to include the new gene signatures
+    save_signature_index(build_signature_index(con))
     con.close()
 
 
@@ -0,0 +1,4 @@
+-- Query for an article with a specified PMCID
+SELECT pmcid, doi, title, journal, volume, issue, pages, date
+FROM Article
+WHERE pmcid = :pmcid;
@@ -0,0 +1,12 @@
+-- Query for articles matching a full-text search, from best to worst match
+SELECT
+    ArticleText.article_pmcid,
+    ArticleText.source,
+    Article.title,
+    bm25(ArticleText) AS rank,
+    snippet(ArticleText, 2, '[', ']', '...', 16)
+FROM ArticleText
+LEFT JOIN Article ON Article.pmcid = ArticleText.article_pmcid
+WHERE ArticleText MATCH :query AND (:source IS NULL OR ArticleText.source = :source)
+ORDER BY rank
+LIMIT :limit;
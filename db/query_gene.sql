@@ -0,0 +1,6 @@
+-- Query for a gene with a specified Ensembl ID and its synonyms
+SELECT Gene.ensembl_id, Gene.name, Gene.chromosome, Gene.description, group_concat(GeneSynonym.name, char(9))
+FROM Gene
+LEFT JOIN GeneSynonym ON GeneSynonym.gene_ensembl_id = Gene.ensembl_id
+WHERE Gene.ensembl_id = :ensembl_id
+GROUP BY Gene.ensembl_id;
@@ -0,0 +1,14 @@
+-- Query for genes appearing in the most gene signatures together with a gene with a specified Ensembl ID
+SELECT Pair.ensembl_id, Gene.name, Pair.signatures
+FROM (
+    SELECT gene_ensembl_id_b AS ensembl_id, signatures
+    FROM GeneCooccurrence
+    WHERE gene_ensembl_id_a = :ensembl_id
+    UNION ALL
+    SELECT gene_ensembl_id_a AS ensembl_id, signatures
+    FROM GeneCooccurrence
+    WHERE gene_ensembl_id_b = :ensembl_id
+) AS Pair
+LEFT JOIN Gene ON Gene.ensembl_id = Pair.ensembl_id
+ORDER BY Pair.signatures DESC, Pair.ensembl_id
+LIMIT :limit;
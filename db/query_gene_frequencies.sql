@@ -0,0 +1,6 @@
+-- Query for genes appearing in the most gene signatures
+SELECT GeneFrequency.gene_ensembl_id AS ensembl_id, Gene.name, GeneFrequency.signatures
+FROM GeneFrequency
+LEFT JOIN Gene ON Gene.ensembl_id = GeneFrequency.gene_ensembl_id
+ORDER BY GeneFrequency.signatures DESC, GeneFrequency.gene_ensembl_id
+LIMIT :limit;
@@ -0,0 +1,6 @@
+-- Query for articles mentioning a gene with a specified Ensembl ID
+SELECT article_pmcid AS pmcid, COUNT(DISTINCT line_number) AS lines
+FROM GeneMention
+WHERE gene_ensembl_id = :ensembl_id
+GROUP BY article_pmcid
+ORDER BY lines DESC, pmcid;
@@ -0,0 +1,6 @@
+-- Query for articles with gene signatures containing a gene with a specified Ensembl ID
+SELECT GeneSignature.article_pmcid AS pmcid, Article.title, Article.journal, Article.date
+FROM GeneSignature
+LEFT JOIN Article ON Article.pmcid = GeneSignature.article_pmcid
+WHERE GeneSignature.gene_ensembl_id = :ensembl_id
+ORDER BY GeneSignature.article_pmcid;
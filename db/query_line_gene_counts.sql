@@ -0,0 +1,5 @@
+-- Query for the number of unique gene symbols on each line of an article mentioning any
+SELECT line_number, COUNT(DISTINCT name)
+FROM GeneMention
+WHERE article_pmcid = :pmcid
+GROUP BY line_number;
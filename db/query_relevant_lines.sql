@@ -0,0 +1,7 @@
+-- Query for lines in an article mentioning at least a minimum number of unique gene symbols
+SELECT line_number
+FROM GeneMention
+WHERE article_pmcid = :pmcid
+GROUP BY line_number
+HAVING COUNT(DISTINCT name) >= :threshold
+ORDER BY line_number;
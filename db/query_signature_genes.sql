@@ -0,0 +1,6 @@
+-- Query for the genes in the gene signature of an article with a specified PMCID
+SELECT Gene.ensembl_id, Gene.name, Gene.chromosome, Gene.description
+FROM GeneSignature
+JOIN Gene ON Gene.ensembl_id = GeneSignature.gene_ensembl_id
+WHERE GeneSignature.article_pmcid = :pmcid
+ORDER BY Gene.name;
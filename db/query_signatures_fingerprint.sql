@@ -0,0 +1,4 @@
+-- Query for the version of the GeneSignature table and its maximum row ID, which change whenever the table changes
+SELECT
+    COALESCE((SELECT version FROM TableVersion WHERE name = 'GeneSignature'), 0),
+    COALESCE((SELECT MAX(rowid) FROM GeneSignature), 0);
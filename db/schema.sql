@@ -68,3 +68,76 @@ CREATE TABLE IF NOT EXISTS GeneSignature (
     -- Relationship between each article and each gene within the article's gene signature
     PRIMARY KEY (article_pmcid, gene_ensembl_id)
 );
+
+-- Look up gene signatures containing a gene
+CREATE INDEX IF NOT EXISTS GeneSignatureGene ON GeneSignature(gene_ensembl_id, article_pmcid);
+
+-- An article whose lines have been searched for gene symbols
+CREATE TABLE IF NOT EXISTS IndexedArticle (
+    -- PMCID of the article
+    article_pmcid TEXT PRIMARY KEY REFERENCES Article(pmcid) ON DELETE CASCADE ON UPDATE CASCADE,
+    -- Number of lines in the article before the references
+    lines INTEGER NOT NULL,
+    -- Fingerprint of the gene vocabulary the article was searched with, which must match the current vocabulary for the
+    -- article to count as indexed
+    vocabulary TEXT
+);
+
+-- A mention of a gene symbol on a line of an article
+CREATE TABLE IF NOT EXISTS GeneMention (
+    -- PMCID of the article in which the gene symbol is mentioned
+    article_pmcid TEXT REFERENCES IndexedArticle(article_pmcid) ON DELETE CASCADE ON UPDATE CASCADE,
+    -- Line number (starting from 0) of the line mentioning the gene symbol
+    line_number INTEGER NOT NULL,
+    -- Gene symbol as it appears in the article
+    name TEXT NOT NULL,
+    -- Ensembl ID of a gene with the symbol as its name or synonym
+    gene_ensembl_id TEXT REFERENCES Gene(ensembl_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    -- Relationship between each line and each gene mentioned on the line
+    PRIMARY KEY (article_pmcid, line_number, name, gene_ensembl_id)
+) WITHOUT ROWID;
+
+-- Look up mentions of a gene
+CREATE INDEX IF NOT EXISTS GeneMentionGene ON GeneMention(gene_ensembl_id, article_pmcid);
+
+-- The number of gene signatures containing a gene
+CREATE TABLE IF NOT EXISTS GeneFrequency (
+    -- Ensembl ID of the gene
+    gene_ensembl_id TEXT PRIMARY KEY REFERENCES Gene(ensembl_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    -- Number of gene signatures containing the gene
+    signatures INTEGER NOT NULL
+);
+
+-- The number of gene signatures containing both of two genes
+CREATE TABLE IF NOT EXISTS GeneCooccurrence (
+    -- Ensembl ID of the first gene, which comes before the second gene in sorted order
+    gene_ensembl_id_a TEXT REFERENCES Gene(ensembl_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    -- Ensembl ID of the second gene
+    gene_ensembl_id_b TEXT REFERENCES Gene(ensembl_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    -- Number of gene signatures containing both genes
+    signatures INTEGER NOT NULL,
+    -- Relationship between each pair of genes
+    PRIMARY KEY (gene_ensembl_id_a, gene_ensembl_id_b)
+) WITHOUT ROWID;
+
+-- Look up co-occurrences of the second gene in each pair
+CREATE INDEX IF NOT EXISTS GeneCooccurrenceB ON GeneCooccurrence(gene_ensembl_id_b);
+
+-- The number of times the rows of a table have changed, for detecting when data derived from the table is stale
+CREATE TABLE IF NOT EXISTS TableVersion (
+    -- Name of the table
+    name TEXT PRIMARY KEY,
+    -- Number of rows of the table that have been inserted, updated, or deleted
+    version INTEGER NOT NULL
+);
+
+-- Count changes to gene signatures, which invalidate the saved gene signature index
+CREATE TRIGGER IF NOT EXISTS GeneSignatureInsert AFTER INSERT ON GeneSignature BEGIN
+    INSERT INTO TableVersion VALUES ('GeneSignature', 1) ON CONFLICT (name) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS GeneSignatureUpdate AFTER UPDATE ON GeneSignature BEGIN
+    INSERT INTO TableVersion VALUES ('GeneSignature', 1) ON CONFLICT (name) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS GeneSignatureDelete AFTER DELETE ON GeneSignature BEGIN
+    INSERT INTO TableVersion VALUES ('GeneSignature', 1) ON CONFLICT (name) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,13 @@
+-- Optional full-text search over articles, which requires SQLite to be built with FTS5
+
+-- The text of an article for ranked full-text search, linked to Article(pmcid) by article_pmcid
+CREATE VIRTUAL TABLE IF NOT EXISTS ArticleText USING fts5(
+    -- PMCID of the article
+    article_pmcid UNINDEXED,
+    -- Either 'texts' for all lines before the references or 'relevant' for only lines mentioning gene symbols
+    source UNINDEXED,
+    -- Text of the article
+    text,
+    -- Match different forms of words (e.g. 'signature' and 'signatures')
+    tokenize = 'porter unicode61'
+);
@@ -0,0 +1,57 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.fts import search_article_texts
+
+paths = get_paths()
+db = paths['db']['sqlite']
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Search article texts.
+    :param argv: Command line arguments to parse instead of those passed to the script.
+    """
+
+    # Command line help messages
+    description = (
+        "List articles matching a full-text query, ranked by BM25, with a snippet of each match. "
+        "This script assumes that articles have been indexed with db/insert_article_texts.py."
+    )
+    help_query = (
+        "A query in SQLite FTS5 syntax, e.g. '\"prognostic signature\" AND TP53' or 'NEAR(prognostic TP53, 10)'."
+    )
+    help_source = "Only search text from this source."
+    help_limit = "The maximum number of articles to list."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('query', help=help_query)
+    parser.add_argument('-s', '--source', choices=['texts', 'relevant'], help=help_source)
+    parser.add_argument('-n', '--limit', default=20, type=int, help=help_limit)
+    args = parser.parse_args(argv)
+
+    # Search for matching articles
+    con = sqlite3.connect(db)
+    try:
+        articles = search_article_texts(args.query, args.source, args.limit, con)
+    except sqlite3.OperationalError as exception:
+        print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        con.close()
+
+    # Display results
+    print(f"Number of Articles: {len(articles)}")
+    for pmcid, source, title, rank, snippet in articles:
+        snippet = ' '.join(snippet.split())
+        print(f"{pmcid}\t{source}\t{rank:.3f}\t{title}\n\t{snippet}")
+
+
+if __name__ == '__main__':
+    main()
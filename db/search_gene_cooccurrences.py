@@ -0,0 +1,57 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.sql import get_ensembl_ids, get_query
+
+paths = get_paths()
+db = paths['db']['sqlite']
+
+
+def main() -> None:
+    """
+    Display gene frequencies and co-occurrences across gene signatures.
+    """
+
+    # Command line help messages
+    description = (
+        "List the genes appearing in the most gene signatures, or the genes appearing in the most gene signatures "
+        "together with a specified gene."
+    )
+    help_gene = "The gene name, synonym, or Ensembl ID to find co-occurring genes for."
+    help_limit = "The maximum number of genes to list."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('gene', nargs='?', help=help_gene)
+    parser.add_argument('-n', '--limit', default=20, type=int, help=help_limit)
+    args = parser.parse_args()
+
+    # Get the most frequent genes
+    con = sqlite3.connect(db)
+    if args.gene is None:
+        rows = con.execute(get_query('gene_frequencies'), {'limit': args.limit}).fetchall()
+
+    # Get the genes co-occurring most with the specified gene
+    else:
+        ensembl_ids = get_ensembl_ids(args.gene, con)
+        if len(ensembl_ids) == 0:
+            print(f"Gene not found: {args.gene}", file=sys.stderr)
+        rows = con.execute(get_query('gene_cooccurrences'), {
+            'ensembl_id': ensembl_ids[0] if len(ensembl_ids) > 0 else None,
+            'limit': args.limit,
+        }).fetchall()
+    con.close()
+
+    # Display results
+    print("Ensembl ID\tName\tSignatures")
+    for ensembl_id, name, signatures in rows:
+        print(f"{ensembl_id}\t{name}\t{signatures}")
+
+
+if __name__ == '__main__':
+    main()
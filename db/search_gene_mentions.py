@@ -0,0 +1,62 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.sql import get_ensembl_ids, get_query
+
+paths = get_paths()
+db = paths['db']['sqlite']
+
+
+def search_gene_mentions(gene: str, con: sqlite3.Connection) -> dict[str, int]:
+    """
+    Find articles mentioning a gene using the gene mention index.
+    :param gene: The gene name, synonym, or Ensembl ID.
+    :param con: A connection to the SQLite database.
+    :return: A dictionary mapping PMCIDs of articles mentioning the gene to the number of lines mentioning it.
+    """
+
+    # Count lines mentioning any of the gene's Ensembl IDs in each article
+    articles = {}
+    for ensembl_id in get_ensembl_ids(gene, con):
+        for pmcid, lines in con.execute(get_query('gene_mention_articles'), {'ensembl_id': ensembl_id}):
+            articles[pmcid] = max(articles.get(pmcid, 0), lines)
+    return dict(sorted(articles.items(), key=lambda article: (-article[1], article[0])))
+
+
+def main() -> None:
+    """
+    Search the gene mention index.
+    """
+
+    # Command line help messages
+    description = (
+        "List articles mentioning a gene along with the number of lines mentioning it. "
+        "This script assumes that articles have been indexed with db/insert_gene_mentions.py."
+    )
+    help_gene = "The gene name, synonym, or Ensembl ID."
+    help_limit = "The maximum number of articles to list."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('gene', help=help_gene)
+    parser.add_argument('-n', '--limit', default=20, type=int, help=help_limit)
+    args = parser.parse_args()
+
+    # Search for articles mentioning the gene
+    con = sqlite3.connect(db)
+    articles = search_gene_mentions(args.gene, con)
+    con.close()
+
+    # Display results
+    print(f"Number of Articles: {len(articles)}")
+    for pmcid, lines in list(articles.items())[:args.limit]:
+        print(f"{pmcid}\t{lines}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.similarity import build_signature_index, load_signature_index, save_signature_index, search_signatures
+from utils.sql import get_ensembl_ids
+
+paths = get_paths()
+db = paths['db']['sqlite']
+
+
+def main() -> None:
+    """
+    Search for gene signatures similar to a set of genes.
+    """
+
+    # Command line help messages
+    description = (
+        "List the gene signatures in a SQLite database that overlap most with a set of genes. "
+        "The search index is rebuilt automatically whenever the gene signatures in the database change."
+    )
+    help_genes = "Gene names, synonyms, or Ensembl IDs in the query."
+    help_pmcid = "Use the gene signature from the article with this PMCID as the query."
+    help_k = "The maximum number of gene signatures to list."
+    help_metric = "The similarity measure to rank gene signatures by."
+    help_rebuild = "Rebuild the search index before searching."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('genes', nargs='*', help=help_genes)
+    parser.add_argument('-p', '--pmcid', help=help_pmcid)
+    parser.add_argument('-k', default=10, type=int, help=help_k)
+    parser.add_argument('--metric', choices=['jaccard', 'overlap'], default='jaccard', help=help_metric)
+    parser.add_argument('--rebuild', action='store_true', help=help_rebuild)
+    args = parser.parse_args()
+
+    # Load or rebuild the index
+    con = sqlite3.connect(db)
+    if args.rebuild:
+        index = build_signature_index(con)
+        save_signature_index(index)
+    else:
+        index = load_signature_index(con)
+
+    # Get the Ensembl IDs of the genes in the query
+    ensembl_ids = []
+    for gene in args.genes:
+        gene_ensembl_ids = get_ensembl_ids(gene, con)
+        if len(gene_ensembl_ids) == 0:
+            print(f"Gene not found: {gene}", file=sys.stderr)
+        ensembl_ids += gene_ensembl_ids[:1]
+    if args.pmcid is not None:
+        ensembl_ids += [
+            row[0] for row in
+            con.execute('SELECT gene_ensembl_id FROM GeneSignature WHERE article_pmcid = ?', (args.pmcid,))
+        ]
+    con.close()
+
+    # Display the most similar gene signatures, excluding the query signature itself
+    results = search_signatures(index, ensembl_ids, args.k + (args.pmcid is not None), args.metric)
+    print(f"PMCID\t{args.metric.capitalize()}\tShared Genes")
+    for pmcid, similarity, shared in [result for result in results if result[0] != args.pmcid][:args.k]:
+        print(f"{pmcid}\t{similarity:.4f}\t{shared}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+from urllib.parse import unquote, urlsplit
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.service import ConnectionPool, ResultCache
+from utils.sql import connect_wal, get_ensembl_ids, get_query
+
+paths = get_paths()
+db = paths['db']['sqlite']
+
+
+class QueryServer(ThreadingHTTPServer):
+    """
+    A local read-only service answering lookups of gene signatures, genes, and articles from the SQLite database as
+    JSON. Queries run on a pool of read-only connections, and results are cached until the database changes.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], pool_size: int, cache_size: int) -> None:
+        """
+        :param address: The host and port to listen on.
+        :param pool_size: The number of read-only connections to the database.
+        :param cache_size: The maximum number of results to cache.
+        """
+
+        # Connections and cached results
+        super().__init__(address, QueryHandler)
+        self.pool = ConnectionPool(db, pool_size)
+        self.cache = ResultCache(db, cache_size)
+
+    def get_signature(self, pmcid: str) -> dict | None:
+        """
+        Get the gene signature of an article with information on the article and each gene.
+        :param pmcid: The PMCID of the article.
+        :return: The gene signature or None if the article has none.
+        """
+
+        # Look up the genes in the gene signature
+        with self.pool.connection() as con:
+            genes = con.execute(get_query('signature_genes'), {'pmcid': pmcid}).fetchall()
+            if len(genes) == 0:
+                return None
+            article = con.execute(get_query('article'), {'pmcid': pmcid}).fetchone()
+
+        # Format the gene signature
+        article_columns = ['pmcid', 'doi', 'title', 'journal', 'volume', 'issue', 'pages', 'date']
+        return {
+            'pmcid': pmcid,
+            'article': dict(zip(article_columns, article)) if article is not None else None,
+            'genes': [
+                dict(zip(['ensembl_id', 'name', 'chromosome', 'description'], gene))
+                for gene in genes
+            ],
+        }
+
+    def get_gene(self, gene: str) -> dict | None:
+        """
+        Get information on each gene with a name, synonym, or Ensembl ID.
+        :param gene: The gene name, synonym, or Ensembl ID.
+        :return: The genes found or None if there are none.
+        """
+
+        # Look up each gene with the name or synonym
+        with self.pool.connection() as con:
+            genes = [
+                con.execute(get_query('gene'), {'ensembl_id': ensembl_id}).fetchone()
+                for ensembl_id in get_ensembl_ids(gene, con)
+            ]
+        genes = [gene_info for gene_info in genes if gene_info is not None]
+        if len(genes) == 0:
+            return None
+
+        # Format the genes
+        return {
+            'query': gene,
+            'genes': [
+                {
+                    'ensembl_id': ensembl_id,
+                    'name': name,
+                    'chromosome': chromosome,
+                    'description': description,
+                    'synonyms': synonyms.split('\t') if synonyms is not None else [],
+                }
+                for ensembl_id, name, chromosome, description, synonyms in genes
+            ],
+        }
+
+    def get_gene_signatures(self, gene: str) -> dict | None:
+        """
+        Get the articles with gene signatures containing a gene given by its name, synonym, or Ensembl ID.
+        :param gene: The gene name, synonym, or Ensembl ID.
+        :return: The Ensembl IDs the gene was resolved to and the articles found for each, or None if the gene is not
+        found.
+        """
+
+        # Look up articles for each gene with the name or synonym
+        with self.pool.connection() as con:
+            ensembl_ids = get_ensembl_ids(gene, con)
+            if len(ensembl_ids) == 0:
+                return None
+            articles = {
+                ensembl_id: con.execute(get_query('gene_signature_articles'), {'ensembl_id': ensembl_id}).fetchall()
+                for ensembl_id in ensembl_ids
+            }
+
+        # Format the articles
+        return {
+            'query': gene,
+            'ensembl_ids': ensembl_ids,
+            'articles': {
+                ensembl_id: [dict(zip(['pmcid', 'title', 'journal', 'date'], article)) for article in gene_articles]
+                for ensembl_id, gene_articles in articles.items()
+            },
+        }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Route GET requests to lookups:
+    /signatures/<pmcid>: the gene signature of an article with information on each gene
+    /genes/<gene>: information and synonyms of the genes with a name, synonym, or Ensembl ID
+    /genes/<gene>/signatures: articles with gene signatures containing a gene
+    /stats: cache statistics
+    """
+
+    server: QueryServer
+
+    def do_GET(self) -> None:
+        """
+        Handle a lookup.
+        """
+
+        # Split the path into its parts
+        parts = [unquote(part) for part in urlsplit(self.path).path.strip('/').split('/')]
+
+        # Route the lookup, caching results by path
+        match parts:
+            case ['signatures', pmcid]:
+                result = self.server.cache.get(tuple(parts), lambda: self.server.get_signature(pmcid))
+            case ['genes', gene]:
+                result = self.server.cache.get(tuple(parts), lambda: self.server.get_gene(gene))
+            case ['genes', gene, 'signatures']:
+                result = self.server.cache.get(tuple(parts), lambda: self.server.get_gene_signatures(gene))
+            case ['stats']:
+                self.server.cache.refresh()
+                result = {**self.server.cache.stats, 'size': len(self.server.cache.results)}
+            case _:
+                self.send_json(404, {'error': f"Unknown path: {self.path}"})
+                return
+
+        # Respond with the result
+        if result is None:
+            self.send_json(404, {'error': f"Not found: {parts[1]}"})
+        else:
+            self.send_json(200, result)
+
+    def send_json(self, status_code: int, body: dict) -> None:
+        """
+        Send a JSON response.
+        :param status_code: The HTTP status code.
+        :param body: The response body.
+        """
+
+        # Write the status, headers, and body
+        content = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args) -> None:
+        """
+        Silence the log of each request.
+        """
+
+        # Logging every lookup would slow down the service
+        pass
+
+
+def main() -> None:
+    """
+    Serve lookups from the SQLite database until interrupted.
+    """
+
+    # Command line help messages
+    description = (
+        "Serve read-only lookups of gene signatures, genes, and articles from a SQLite database as JSON over HTTP: "
+        "/signatures/<pmcid>, /genes/<gene>, /genes/<gene>/signatures, and /stats. Gene signatures may be inserted "
+        "while the service is running, and cached results are discarded whenever the database changes."
+    )
+    help_host = "The host to listen on."
+    help_port = "The port to listen on."
+    help_pool_size = "The number of read-only connections to the database."
+    help_cache_size = "The maximum number of results to cache."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--host', default='127.0.0.1', help=help_host)
+    parser.add_argument('-p', '--port', default=8080, type=int, help=help_port)
+    parser.add_argument('-n', '--pool-size', default=8, type=int, help=help_pool_size)
+    parser.add_argument('-c', '--cache-size', default=10000, type=int, help=help_cache_size)
+    args = parser.parse_args()
+
+    # Switch the database to write-ahead logging so that inserts never block lookups
+    connect_wal(db).close()
+
+    # Serve lookups until interrupted
+    server = QueryServer((args.host, args.port), args.pool_size, args.cache_size)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    server.pool.close()
+    server.cache.close()
+    print(f"Cache Hits: {server.cache.stats['hits']}")
+    print(f"Cache Misses: {server.cache.stats['misses']}")
+
+
+if __name__ == '__main__':
+    main()
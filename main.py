@@ -0,0 +1,56 @@
+import argparse
+import importlib
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+# Subcommands mapped to the module implementing them, arguments always passed to the module, and a help message
+commands = {
+    'create': ('run.run', ['--create'], "Create a file of requests for a prompt and set of articles."),
+    'execute': ('run.run', ['--execute'], "Execute a batch of requests from an existing file."),
+    'retrieve': ('run.run', ['--retrieve'], "Retrieve the output of an executed batch if it has completed."),
+    'triage': ('run.triage', [], "Calibrate the score below which articles are skipped when creating requests."),
+    'merge': ('run.merge', [], "Combine the batch files of every shard of a batch, checking that none are missing."),
+    'cost': ('run.cost', [], "Display token and cost estimates for a batch."),
+    'metrics': ('analysis.metrics', [], "Evaluate prompt accuracy and cost of a batch on the validation or test set."),
+    'insert': ('db.insert_gene_signatures', [], "Insert all gene signatures from a batch output into the database."),
+    'index-texts': ('db.insert_article_texts', [], "Index article texts for ranked full-text search."),
+    'search': ('db.search_articles', [], "Search indexed article texts with a full-text query."),
+    'sample': ('run.sample', [], "Sample new articles not already included in a dataset."),
+    'fetch': ('setup.articles', [], "Query and retrieve articles in the PMC Open Access Subset."),
+    'pipeline': ('run.pipeline', [], "Run steps for many prompts and sets at once, skipping those that are up to date."),
+}
+
+
+def main() -> None:
+    """
+    Run a subcommand, importing only the modules it needs.
+    """
+
+    # Command line help messages
+    description = (
+        "Run any step of processing articles. "
+        "Arguments after the subcommand are passed to the script implementing it; use '<subcommand> -h' for details."
+    )
+    help_command = "The step to run."
+    help_args = "Arguments for the subcommand."
+
+    # Parse the subcommand, leaving its arguments to the script implementing it
+    parser = argparse.ArgumentParser(
+        description=description,
+        epilog='\n'.join(f"{name}: {command[2]}" for name, command in commands.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('command', choices=commands, help=help_command)
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=help_args)
+    args = parser.parse_args()
+
+    # Import the module implementing the subcommand and run it
+    module_name, command_args, _ = commands[args.command]
+    module = importlib.import_module(module_name)
+    module.main(command_args + args.args)
+
+
+if __name__ == '__main__':
+    main()
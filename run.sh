@@ -3,14 +3,44 @@
 # Virtual environment
 source venv/bin/activate
 
-# Validation set batches
-for (( i=1 ; i<=8 ; i++ ))
-do
-    python3 run/run.py $i -c --val-set
-done
+# Validation set batches (only those whose prompt, genes, or targets have changed are recreated)
+python3 run/pipeline.py --prompts 1 2 3 4 5 6 7 8 --sets val --stages create
+
+# A demonstration of creating requests by memory-mapping articles and only decoding lines that may mention genes
+# python3 run/run.py 5 -c --val-set --mmap
+
+# A demonstration of shortening relevant lines (repeated lines, whitespace, numeric table cells) to save input tokens
+# python3 run/run.py 5 -ck --val-set
+
+# A demonstration of packing articles with few relevant lines into shared requests of up to 4000 tokens each
+# python3 run/run.py 5 -c --val-set --pack 4000
+
+# A demonstration of calibrating triage on the validation set and only sending articles likely to have gene signatures
+# python3 run/triage.py --test-set
+# python3 run/run.py 5 -ct --val-set
 
 # A demonstration of asynchronously processing a batch (using the validation set and prompt 5)
 # python3 run/run.py 5 -es --val-set
 
 # A demonstration of asynchronously processing a batch (using the validation set and prompt 5)
 # python3 run/run.py 5 -e --val-set
+
+# A demonstration of retrieving the output of an asynchronously processed batch once it has completed
+# python3 run/run.py 5 -r --val-set
+
+# The same steps through the single entry point, which only imports what each step needs
+# python3 main.py create 5 --val-set
+# python3 main.py cost 5 --val-set
+
+# A demonstration of the full pipeline for several prompts at once, skipping steps that are already up to date
+# python3 run/pipeline.py --prompts 1 2 3 --sets val --stages create cost execute poll metrics -w 3
+
+# A demonstration of synchronous execution against a local server that simulates rate limits
+# (set "base_url" to "http://127.0.0.1:8000/v1" in settings.json first)
+# python3 run/mock_server.py --rpm 30 &
+# python3 run/run.py 5 -es --val-set -w 8
+
+# A demonstration of splitting a batch across machines by article and combining the shards' outputs afterwards
+# python3 run/run.py 5 -ces --val-set --shard 0/2
+# python3 run/run.py 5 -ces --val-set --shard 1/2
+# python3 run/merge.py 5 --val-set -n 2
@@ -1,21 +1,23 @@
 import argparse
-import json
 import os
 import sys
+from typing import Iterable
 
 sys.path.append(os.getcwd())
 
+from utils.batch import read_jsonl
+from utils.config import get_paths
 from utils.cost import count_tokens_input, calculate_cost_batch_input, calculate_cost_batch_output
+from utils.shard import get_shard_batch_id, parse_shard
 
 
-with open('paths.json') as file:
-    paths = json.load(file)
+paths = get_paths()
 
 
-def estimate_costs(requests_input: list[str]) -> tuple[int, float, float]:
+def estimate_costs(requests_input: Iterable[dict]) -> tuple[int, float, float]:
     """
     Get an estimate of the number of tokens in, the input cost of, and the maximum output cost of the request input.
-    :param requests_input: A list of input requests as strings.
+    :param requests_input: Input requests read from the batch input file.
     :return: A tuple containing the estimate number of tokens, the estimated input cost, and the maximum output cost.
     """
 
@@ -26,7 +28,6 @@ def estimate_costs(requests_input: list[str]) -> tuple[int, float, float]:
 
     # Total the estimated number of input tokens, estimated input cost, and maximum output cost
     for request_input in requests_input:
-        request_input = json.loads(request_input)
         tokens_current = count_tokens_input(request_input)
         tokens += tokens_current
         cost_input += calculate_cost_batch_input(tokens_current, request_input['body']['model'])
@@ -34,9 +35,10 @@ def estimate_costs(requests_input: list[str]) -> tuple[int, float, float]:
     return tokens, cost_input, max_cost_output
 
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
     """
     Get token and cost estimates.
+    :param argv: Command line arguments to parse instead of those passed to the script.
     """
 
     # Command line help messages
@@ -47,6 +49,7 @@ def main() -> None:
     help_prompt_number = "The number in the prompt filename."
     help_val_set = "Use the validation set instead of the entire dataset."
     help_test_set = "Use the test set instead of the entire dataset."
+    help_shard = "Use the batch file of shard i of N (given as i/N) created with the same option."
 
     # Parse command line arguments
     parser = argparse.ArgumentParser(description=description)
@@ -54,7 +57,8 @@ def main() -> None:
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--val-set', action='store_true', help=help_val_set)
     group.add_argument('--test-set', action='store_true', help=help_test_set)
-    args = parser.parse_args()
+    parser.add_argument('--shard', type=parse_shard, help=help_shard)
+    args = parser.parse_args(argv)
 
     # Get the identifier of the batch file
     match args.val_set, args.test_set:
@@ -64,13 +68,10 @@ def main() -> None:
             batch_id = f'val_{args.prompt_number:02d}'
         case False, True:
             batch_id = f'test_{args.prompt_number:02d}'
+    batch_id = get_shard_batch_id(batch_id, args.shard)
 
-    # Read the batch file
-    with open(paths['batch']['input'].format(batch_id=batch_id)) as file:
-        requests_input = file.readlines()
-
-    # Calculate and display cost metrics
-    tokens, cost_input, max_cost_output = estimate_costs(requests_input)
+    # Calculate and display cost metrics while streaming the batch file
+    tokens, cost_input, max_cost_output = estimate_costs(read_jsonl(paths['batch']['input'].format(batch_id=batch_id)))
     print(f"Estimated Number of Input Tokens: {tokens}")
     print(f"Estimated Input Cost: ${cost_input}")
     print(f"Maximum Output Cost: ${max_cost_output}")
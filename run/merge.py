@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.batch import parse_output_line, read_jsonl
+from utils.config import get_paths
+from utils.cost import calculate_cost_batch_input, calculate_cost_batch_output
+from utils.instrument import stage
+from utils.pack import load_packs, save_packs
+from utils.regex import get_pmcid_from_filename
+from utils.shard import get_shard_batch_id, get_shard_index, select_shard
+
+paths = get_paths()
+articles_texts = paths['data']['articles']['texts']
+
+
+def get_expected_pmcids(batch_id: str, article_pmcids: list[str], shard: tuple[int, int]) -> tuple[set[str], bool]:
+    """
+    Get the PMCIDs a shard should have outputs for. These are the articles requested in the shard's batch input if it is
+    present, since triage may have skipped some articles, and otherwise every article of the set assigned to the shard.
+    :param batch_id: A unique identifier for the whole batch.
+    :param article_pmcids: A list of PMCIDs of all articles in the set.
+    :param shard: A tuple containing the shard index and the number of shards.
+    :return: A tuple containing the set of expected PMCIDs and whether they were read from the batch input.
+    """
+
+    # Prefer the articles actually requested for the shard, including each article of packed requests
+    shard_batch_id = get_shard_batch_id(batch_id, shard)
+    batch_input = paths['batch']['input'].format(batch_id=shard_batch_id)
+    if os.path.exists(batch_input):
+        packs = load_packs(shard_batch_id)
+        return {
+            article_pmcid
+            for request_input in read_jsonl(batch_input)
+            for article_pmcid in packs.get(request_input['custom_id'], [request_input['custom_id']])
+        }, True
+    return set(select_shard(article_pmcids, shard)), False
+
+
+def merge_shard_outputs(
+    batch_id: str,
+    article_pmcids: list[str],
+    n_shards: int
+) -> tuple[dict[str, list[str]], dict[str, float]]:
+    """
+    Combine the batch outputs of every shard into the batch output of the whole batch, checking that each article has
+    exactly one output from the shard it was assigned to. The merged file only replaces the existing batch output if no
+    problems are found.
+    :param batch_id: A unique identifier for the whole batch.
+    :param article_pmcids: A list of PMCIDs of all articles in the set.
+    :param n_shards: The number of shards.
+    :return: A tuple containing a dictionary mapping each kind of problem ('missing', 'duplicate', 'unexpected',
+    'wrong_shard', 'malformed', and 'unreadable' shard files) to the PMCIDs or files affected, and a dictionary with the
+    total 'records', 'errors', 'cost_input', and 'cost_output' of the merged output.
+    """
+
+    # Track problems and totals
+    problems = {key: [] for key in ['missing', 'duplicate', 'unexpected', 'wrong_shard', 'malformed', 'unreadable']}
+    totals = {'records': 0, 'errors': 0, 'cost_input': 0, 'cost_output': 0}
+    seen = set()
+
+    # Write to a temporary file so that an incomplete merge never replaces the batch output
+    batch_output = paths['batch']['output'].format(batch_id=batch_id)
+    with stage('merge', batch_id=batch_id, shards=n_shards) as event, open(f'{batch_output}.tmp', 'w') as file:
+        for index in range(n_shards):
+            shard_batch_id = get_shard_batch_id(batch_id, (index, n_shards))
+            expected, from_input = get_expected_pmcids(batch_id, article_pmcids, (index, n_shards))
+            shard_seen = set()
+
+            # Read the shard's output
+            try:
+                shard_file = open(paths['batch']['output'].format(batch_id=shard_batch_id))
+            except FileNotFoundError as exception:
+                print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
+                problems['unreadable'].append(shard_batch_id)
+                problems['missing'].extend(sorted(expected))
+                continue
+
+            # Check each record before copying it
+            with shard_file:
+                for line in shard_file:
+                    event['bytes'] += len(line)
+                    record = parse_output_line(line)
+                    if record is None:
+                        if line.strip() and shard_batch_id not in problems['malformed']:
+                            problems['malformed'].append(shard_batch_id)
+                        continue
+                    pmcid = record.custom_id
+                    if pmcid in seen:
+                        problems['duplicate'].append(pmcid)
+                        continue
+                    if get_shard_index(pmcid, n_shards) != index:
+                        problems['wrong_shard'].append(pmcid)
+                    elif pmcid not in expected:
+                        problems['unexpected'].append(pmcid)
+                    seen.add(pmcid)
+                    shard_seen.add(pmcid)
+                    file.write(line if line.endswith('\n') else f'{line}\n')
+
+                    # Total the records and their costs
+                    totals['records'] += 1
+                    totals['errors'] += record.error is not None
+                    if record.usage is not None and record.model is not None:
+                        totals['cost_input'] += calculate_cost_batch_input(record.usage['prompt_tokens'], record.model)
+                        totals['cost_output'] += calculate_cost_batch_output(
+                            record.usage['completion_tokens'], record.model
+                        )
+
+            # Every expected article must have an output
+            problems['missing'].extend(sorted(expected - shard_seen))
+            print(
+                f"{shard_batch_id}: {len(shard_seen)} of {len(expected)} "
+                f"{'requests' if from_input else 'articles'} present"
+            )
+        event['items'] = totals['records']
+
+    # Replace the batch output only if the shards are complete and disjoint
+    if any(len(affected) > 0 for affected in problems.values()):
+        os.remove(f'{batch_output}.tmp')
+    else:
+        os.replace(f'{batch_output}.tmp', batch_output)
+    return problems, totals
+
+
+def merge_shard_inputs(batch_id: str, n_shards: int) -> bool:
+    """
+    Combine the batch inputs of every shard, and their packs if any, into those of the whole batch so that they can be
+    used for cost estimates and comparisons as if they had been created on one machine.
+    :param batch_id: A unique identifier for the whole batch.
+    :param n_shards: The number of shards.
+    :return: Whether the batch inputs were merged, which requires every shard's batch input to be present.
+    """
+
+    # Only merge complete sets of batch inputs
+    shard_inputs = [
+        paths['batch']['input'].format(batch_id=get_shard_batch_id(batch_id, (index, n_shards)))
+        for index in range(n_shards)
+    ]
+    if not all(os.path.exists(shard_input) for shard_input in shard_inputs):
+        return False
+
+    # Concatenate the batch inputs
+    batch_input = paths['batch']['input'].format(batch_id=batch_id)
+    with open(f'{batch_input}.tmp', 'w') as file:
+        for shard_input in shard_inputs:
+            for request_input in read_jsonl(shard_input):
+                json.dump(request_input, file)
+                file.write('\n')
+    os.replace(f'{batch_input}.tmp', batch_input)
+
+    # Pack IDs are unique across shards, so their packs can simply be combined
+    packs = {}
+    for index in range(n_shards):
+        packs.update(load_packs(get_shard_batch_id(batch_id, (index, n_shards))))
+    save_packs(batch_id, packs if len(packs) > 0 else None)
+    return True
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Merge the outputs of a sharded batch.
+    :param argv: Command line arguments to parse instead of those passed to the script.
+    """
+
+    # Command line help messages
+    description = (
+        "Combine the batch files of every shard created with '--shard i/N' into the batch files of the whole batch, "
+        "verifying that no article is missing or duplicated, and evaluate the combined output on the validation or "
+        "test set. The merged output is only written if every check passes."
+    )
+    help_prompt_number = "The number in the prompt filename."
+    help_shards = "The number of shards the batch was split into."
+    help_val_set = "Merge the validation set instead of the entire dataset."
+    help_test_set = "Merge the test set instead of the entire dataset."
+    help_no_metrics = "Do not calculate metrics on the merged output of the validation or test set."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('prompt_number', type=int, help=help_prompt_number)
+    parser.add_argument('-n', '--shards', required=True, type=int, help=help_shards)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--val-set', action='store_true', help=help_val_set)
+    group.add_argument('--test-set', action='store_true', help=help_test_set)
+    parser.add_argument('--no-metrics', action='store_true', help=help_no_metrics)
+    args = parser.parse_args(argv)
+
+    # Get the batch ID and all articles in the set
+    match args.val_set, args.test_set:
+        case False, False:
+            set_name = 'data'
+            article_pmcids = [
+                get_pmcid_from_filename(article_filename)
+                for article_filename in os.listdir(articles_texts)
+            ]
+        case True, False:
+            set_name = 'val'
+            with open(paths['run']['targets']['val']) as file:
+                article_pmcids = list(json.load(file).keys())
+        case False, True:
+            set_name = 'test'
+            with open(paths['run']['targets']['test']) as file:
+                article_pmcids = list(json.load(file).keys())
+    batch_id = f'{set_name}_{args.prompt_number:02d}'
+
+    # Merge and verify the outputs
+    problems, totals = merge_shard_outputs(batch_id, article_pmcids, args.shards)
+    print(f"Records: {totals['records']}")
+    print(f"Errors: {totals['errors']}")
+    print(f"Input Cost: ${totals['cost_input']}")
+    print(f"Output Cost: ${totals['cost_output']}")
+
+    # Report problems without replacing the batch output
+    problems = {kind: affected for kind, affected in problems.items() if len(affected) > 0}
+    if len(problems) > 0:
+        for kind, affected in problems.items():
+            print(f"{kind.replace('_', ' ').capitalize()}: {len(affected)} ({', '.join(affected[:10])}"
+                  f"{', ...' if len(affected) > 10 else ''})", file=sys.stderr)
+        print("The shards were not merged.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Merged: {paths['batch']['output'].format(batch_id=batch_id)}")
+
+    # Merge the inputs as well when every shard's input is present
+    if merge_shard_inputs(batch_id, args.shards):
+        print(f"Merged: {paths['batch']['input'].format(batch_id=batch_id)}")
+
+    # Evaluate the merged output, since accuracies of shards cannot simply be averaged
+    if set_name != 'data' and not args.no_metrics:
+        from analysis.metrics import main as main_metrics
+        main_metrics([str(args.prompt_number), f'--{set_name}-set'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import argparse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+import time
+
+
+class ThrottlingServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the chat completions endpoint that enforces requests-per-minute and tokens-per-minute limits
+    over a sliding window, responding like the OpenAI API with x-ratelimit-* headers and 429 errors with Retry-After.
+    """
+
+    def __init__(self, address: tuple[str, int], rpm: int, tpm: int, window: float, latency: float) -> None:
+        """
+        :param address: The host and port to listen on.
+        :param rpm: The maximum number of requests in each window.
+        :param tpm: The maximum number of tokens in each window.
+        :param window: The length of the window in seconds.
+        :param latency: The number of seconds each accepted request takes.
+        """
+
+        # Limits and requests accepted in the current window as (time, tokens) pairs
+        super().__init__(address, MockHandler)
+        self.limits = {'requests': rpm, 'tokens': tpm}
+        self.window = window
+        self.latency = latency
+        self.accepted = deque()
+        self.counts = {'accepted': 0, 'throttled': 0}
+        self.lock = threading.Lock()
+
+    def admit(self, tokens: int) -> tuple[bool, dict[str, str]]:
+        """
+        Decide whether a request is within the limits and record it if so.
+        :param tokens: The number of tokens the request counts against the limit.
+        :return: A tuple containing whether the request was accepted and the rate limit headers to send.
+        """
+
+        # Forget requests outside the window
+        with self.lock:
+            now = time.monotonic()
+            while len(self.accepted) > 0 and self.accepted[0][0] <= now - self.window:
+                self.accepted.popleft()
+
+            # Accept the request if both limits allow it
+            used_tokens = sum(accepted_tokens for _, accepted_tokens in self.accepted)
+            allowed = len(self.accepted) < self.limits['requests'] and used_tokens + tokens <= self.limits['tokens']
+            if allowed:
+                self.accepted.append((now, tokens))
+                used_tokens += tokens
+            self.counts['accepted' if allowed else 'throttled'] += 1
+
+            # Report limits, remaining quotas, and when the oldest request leaves the window
+            reset = max(0.0, self.accepted[0][0] + self.window - now) if len(self.accepted) > 0 else 0.0
+            headers = {
+                'x-ratelimit-limit-requests': str(self.limits['requests']),
+                'x-ratelimit-remaining-requests': str(max(0, self.limits['requests'] - len(self.accepted))),
+                'x-ratelimit-reset-requests': f'{reset:.3f}s',
+                'x-ratelimit-limit-tokens': str(self.limits['tokens']),
+                'x-ratelimit-remaining-tokens': str(max(0, self.limits['tokens'] - used_tokens)),
+                'x-ratelimit-reset-tokens': f'{reset:.3f}s',
+            }
+            if not allowed:
+                headers['retry-after-ms'] = str(int(reset * 1000))
+                headers['retry-after'] = str(max(1, round(reset)))
+            return allowed, headers
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Respond to chat completion requests with an empty gene signature for each article.
+    """
+
+    server: ThrottlingServer
+
+    def do_POST(self) -> None:
+        """
+        Handle a chat completion request.
+        """
+
+        # Read the request and estimate its tokens as the API does, at about four characters per token
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt_tokens = sum(len(message['content']) for message in body['messages']) // 4
+        tokens = prompt_tokens + body.get('max_completion_tokens', 0)
+
+        # Throttle requests over the limits
+        allowed, headers = self.server.admit(tokens)
+        if not allowed:
+            self.send_json(429, headers, {'error': {
+                'message': "Rate limit reached",
+                'type': 'requests',
+                'code': 'rate_limit_exceeded',
+            }})
+            return
+
+        # Respond like a chat completion, answering for each article of packed requests
+        time.sleep(self.server.latency)
+        article_pmcids = re.findall(r'^==== PMCID: (\S+) ====$', body['messages'][-1]['content'], re.MULTILINE)
+        if len(article_pmcids) > 0:
+            content = json.dumps({'articles': {article_pmcid: {'genes': []} for article_pmcid in article_pmcids}})
+        else:
+            content = json.dumps({'genes': []})
+        self.send_json(200, headers, {
+            'id': f'chatcmpl-mock-{time.monotonic_ns()}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body['model'],
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(content) // 4,
+                'total_tokens': prompt_tokens + len(content) // 4,
+            },
+        })
+
+    def send_json(self, status_code: int, headers: dict[str, str], body: dict) -> None:
+        """
+        Send a JSON response.
+        :param status_code: The HTTP status code.
+        :param headers: Additional headers to send.
+        :param body: The response body.
+        """
+
+        # Write the status, headers, and body
+        content = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args) -> None:
+        """
+        Silence the log of each request.
+        """
+
+        # Requests are summarized when the server stops instead
+        pass
+
+
+def main() -> None:
+    """
+    Run the mock server until interrupted.
+    """
+
+    # Command line help messages
+    description = (
+        "Serve a local chat completions endpoint that simulates rate limiting, for testing synchronous execution. "
+        "Point the client at it by setting \"base_url\" to \"http://127.0.0.1:<port>/v1\" in settings.json."
+    )
+    help_port = "The port to listen on."
+    help_rpm = "The maximum number of requests accepted in each window."
+    help_tpm = "The maximum number of tokens accepted in each window."
+    help_window = "The length of the rate limit window in seconds."
+    help_latency = "The number of seconds each accepted request takes."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-p', '--port', default=8000, type=int, help=help_port)
+    parser.add_argument('--rpm', default=60, type=int, help=help_rpm)
+    parser.add_argument('--tpm', default=100000, type=int, help=help_tpm)
+    parser.add_argument('--window', default=60, type=float, help=help_window)
+    parser.add_argument('--latency', default=0.2, type=float, help=help_latency)
+    args = parser.parse_args()
+
+    # Serve requests until interrupted, then summarize them
+    server = ThrottlingServer(('127.0.0.1', args.port), args.rpm, args.tpm, args.window, args.latency)
+    print(f"Serving on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print(f"Accepted Requests: {server.counts['accepted']}")
+    print(f"Throttled Requests: {server.counts['throttled']}")
+
+
+if __name__ == '__main__':
+    main()
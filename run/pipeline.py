@@ -0,0 +1,333 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.genes import hash_file
+from utils.instrument import stage
+
+paths = get_paths()
+
+# Stages in the order they run for each prompt and set
+stage_names = ['create', 'cost', 'execute', 'poll', 'metrics', 'insert']
+
+# Statuses of batches that will never complete
+failed_statuses = ['failed', 'expired', 'cancelled']
+
+
+def hash_path(path: str, hashes: dict[tuple, str]) -> str | None:
+    """
+    Hash a file by its contents or a directory by the names, sizes, and modification times of its files.
+    :param path: The path to the file or directory.
+    :param hashes: A dictionary of previous hashes keyed by path, size, and modification time, which is updated.
+    :return: A hexadecimal SHA-256 hash or None if the path does not exist.
+    """
+
+    # Missing paths have no hash
+    try:
+        path_stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    # Reuse the hash of an unchanged file or directory
+    key = (path, path_stat.st_size, path_stat.st_mtime_ns)
+    if key in hashes:
+        return hashes[key]
+
+    # Hash directory listings without reading every file
+    if os.path.isdir(path):
+        listing = hashlib.sha256()
+        for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+            entry_stat = entry.stat()
+            listing.update(f'{entry.name}\t{entry_stat.st_size}\t{entry_stat.st_mtime_ns}\n'.encode())
+        hashes[key] = listing.hexdigest()
+    else:
+        hashes[key] = hash_file(path)
+    return hashes[key]
+
+
+def get_stages(prompt_number: int, set_name: str, synchronous: bool, max_processes: int) -> list[dict]:
+    """
+    Describe every stage for processing a prompt on a set of articles.
+    :param prompt_number: The number in the prompt filename.
+    :param set_name: Either 'val', 'test', or 'data' for the entire dataset.
+    :param synchronous: Whether requests are executed as synchronous chat completions instead of a batch.
+    :param max_processes: The maximum number of processes to use for regex processing.
+    :return: A list of stages, each with a name, the main.py arguments that run it (or None to poll a batch), the files
+    it reads and writes, and the name of a shared resource it must hold exclusively while running (or None).
+    """
+
+    # Arguments selecting the prompt and set
+    batch_id = f'{set_name}_{prompt_number:02d}'
+    set_args = {'val': ['--val-set'], 'test': ['--test-set'], 'data': []}[set_name]
+    targets = [paths['run']['targets'][set_name]] if set_name != 'data' else [paths['data']['articles']['texts']]
+    batch_input = paths['batch']['input'].format(batch_id=batch_id)
+    batch_info = paths['batch']['info'].format(batch_id=batch_id)
+    batch_output = paths['batch']['output'].format(batch_id=batch_id)
+
+    # Stages in order
+    return [
+        {
+            'name': 'create',
+            'command': ['create', str(prompt_number), *set_args, '-m', str(max_processes)],
+            'inputs': [
+                paths['prompts']['prompt'].format(prompt_number=prompt_number),
+                paths['data']['genes']['info'],
+                paths['data']['genes']['vocabulary'],
+                paths['data']['articles']['texts'],
+                *(targets if set_name != 'data' else []),
+            ],
+            'outputs': [batch_input],
+            'resource': None,
+        },
+        {
+            'name': 'cost',
+            'command': ['cost', str(prompt_number), *set_args],
+            'inputs': [batch_input],
+            'outputs': [paths['logs']['cost'].format(batch_id=batch_id)],
+            'resource': None,
+        },
+        {
+            'name': 'execute',
+            'command': ['execute', str(prompt_number), *set_args, *(['--synchronous'] if synchronous else [])],
+            'inputs': [batch_input],
+            'outputs': [batch_output if synchronous else batch_info],
+            'resource': None,
+        },
+        {
+            'name': 'poll',
+            'command': None,
+            'inputs': [batch_info],
+            'outputs': [batch_output],
+            'resource': None,
+        },
+        {
+            'name': 'metrics',
+            'command': ['metrics', str(prompt_number), *set_args],
+            'inputs': [batch_output, *targets],
+            'outputs': [paths['logs']['analysis']['accuracy'].format(batch_id=batch_id)],
+            'resource': 'metrics',
+        },
+        {
+            'name': 'insert',
+            'command': ['insert', str(prompt_number), *set_args],
+            'inputs': [batch_output],
+            'outputs': [],
+            'resource': 'db',
+        },
+    ]
+
+
+def run_chain(
+    prompt_number: int,
+    set_name: str,
+    selected: list[str],
+    options: dict,
+    state: dict,
+    locks: dict[str, threading.Lock]
+) -> bool:
+    """
+    Run the selected stages for a prompt and set in order, skipping stages whose inputs are unchanged since they last
+    succeeded.
+    :param prompt_number: The number in the prompt filename.
+    :param set_name: Either 'val', 'test', or 'data' for the entire dataset.
+    :param selected: The names of the stages to run.
+    :param options: Options for running stages ('synchronous', 'max_processes', 'poll_interval', 'max_wait', and
+    'force').
+    :param state: Signatures of the inputs of every stage that has succeeded, which is updated and saved.
+    :param locks: Locks for the state file and for shared resources.
+    :return: True if every selected stage succeeded or was skipped.
+    """
+
+    # Run each selected stage
+    batch_id = f'{set_name}_{prompt_number:02d}'
+    hashes = {}
+    for stage_info in get_stages(prompt_number, set_name, options['synchronous'], options['max_processes']):
+        if stage_info['name'] not in selected:
+            continue
+        if stage_info['name'] == 'poll' and options['synchronous']:
+            continue
+        if stage_info['name'] in ['metrics'] and set_name == 'data':
+            continue
+
+        # Inputs must exist
+        input_hashes = {path: hash_path(path, hashes) for path in stage_info['inputs']}
+        missing = [path for path, input_hash in input_hashes.items() if input_hash is None]
+        if len(missing) > 0:
+            print(f"[{batch_id}] {stage_info['name']}: missing inputs {missing}", file=sys.stderr)
+            return False
+
+        # Skip the stage if it already succeeded with the same inputs
+        key = f"{batch_id}:{stage_info['name']}"
+        signature = hashlib.sha256(json.dumps([stage_info['command'], input_hashes]).encode()).hexdigest()
+        outputs_exist = all(os.path.exists(path) for path in stage_info['outputs'])
+        if not options['force'] and outputs_exist and state.get(key) == signature:
+            print(f"[{batch_id}] {stage_info['name']}: up to date")
+            continue
+
+        # Run the stage, holding its shared resource if any
+        print(f"[{batch_id}] {stage_info['name']}: running")
+        lock = locks[stage_info['resource']] if stage_info['resource'] is not None else threading.Lock()
+        with lock, stage(f"pipeline_{stage_info['name']}", batch_id=batch_id):
+            succeeded = run_stage(batch_id, stage_info, options['poll_interval'], options['max_wait'])
+        if not succeeded:
+            print(f"[{batch_id}] {stage_info['name']}: failed", file=sys.stderr)
+            return False
+
+        # Record the inputs the stage succeeded with
+        with locks['state']:
+            state[key] = signature
+            save_state(state)
+    return True
+
+
+def run_stage(batch_id: str, stage_info: dict, poll_interval: float, max_wait: float) -> bool:
+    """
+    Run a single stage.
+    :param batch_id: A unique identifier for the batch.
+    :param stage_info: The stage as described by get_stages.
+    :param poll_interval: The number of seconds to wait between checks on whether a batch has completed.
+    :param max_wait: The maximum number of seconds to wait for a batch to complete.
+    :return: True if the stage succeeded.
+    """
+
+    # Poll until the batch has completed, failed, or taken too long, importing the OpenAI client only when needed
+    if stage_info['command'] is None:
+        from utils.run import retrieve_batch
+        deadline = time.monotonic() + max_wait
+        while (status := retrieve_batch(batch_id)) != 'completed':
+            if status in failed_statuses:
+                print(f"[{batch_id}] Batch {status}", file=sys.stderr)
+                return False
+            if time.monotonic() + poll_interval > deadline:
+                print(f"[{batch_id}] Batch still {status} after {max_wait} seconds", file=sys.stderr)
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    # Run the stage in its own process and show its output once it finishes
+    result = subprocess.run(
+        [sys.executable, 'main.py', *stage_info['command']],
+        capture_output=True,
+        text=True,
+    )
+    for line in result.stdout.splitlines():
+        print(f"[{batch_id}] {line}")
+    for line in result.stderr.splitlines():
+        print(f"[{batch_id}] {line}", file=sys.stderr)
+
+    # Save the output of cost estimates
+    if stage_info['name'] == 'cost' and result.returncode == 0:
+        os.makedirs(os.path.dirname(stage_info['outputs'][0]), exist_ok=True)
+        with open(stage_info['outputs'][0], 'w') as file:
+            file.write(result.stdout)
+    return result.returncode == 0
+
+
+def load_state() -> dict:
+    """
+    Load the signatures of the inputs of every stage that has succeeded.
+    :return: A dictionary mapping stages to signatures.
+    """
+
+    # Start with no state if the file does not exist
+    try:
+        with open(paths['logs']['pipeline']) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(state: dict) -> None:
+    """
+    Save the signatures of the inputs of every stage that has succeeded.
+    :param state: A dictionary mapping stages to signatures.
+    """
+
+    # Write to a temporary file first so that the state file is never partially written
+    os.makedirs(os.path.dirname(paths['logs']['pipeline']), exist_ok=True)
+    with open(f"{paths['logs']['pipeline']}.tmp", 'w') as file:
+        json.dump(state, file, indent=4, sort_keys=True)
+    os.replace(f"{paths['logs']['pipeline']}.tmp", paths['logs']['pipeline'])
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Run stages for multiple prompts and sets concurrently.
+    :param argv: Command line arguments to parse instead of those passed to the script.
+    """
+
+    # Command line help messages
+    description = (
+        "Run the stages create, cost, execute, poll, metrics, and insert for each combination of prompt and set. "
+        "Combinations run concurrently, and stages whose inputs have not changed since they last succeeded are skipped."
+    )
+    help_prompts = "The numbers in the prompt filenames."
+    help_sets = "The sets of articles to use, where 'data' is the entire dataset."
+    help_stages = "The stages to run."
+    help_max_workers = "The maximum number of combinations of prompt and set to process at once."
+    help_max_processes = "The maximum number of processes each combination uses for regex processing."
+    help_synchronous = "Execute requests as individual synchronous chat completions instead of batches."
+    help_poll_interval = "The number of seconds to wait between checks on whether a batch has completed."
+    help_max_wait = "The maximum number of seconds to wait for a batch to complete before counting it as failed."
+    help_force = "Run every selected stage even if it is up to date."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-p', '--prompts', nargs='+', default=list(range(1, 9)), type=int, help=help_prompts)
+    parser.add_argument('--sets', nargs='+', default=['val'], choices=['val', 'test', 'data'], help=help_sets)
+    parser.add_argument('--stages', nargs='+', default=['create', 'cost'], choices=stage_names, help=help_stages)
+    parser.add_argument('-w', '--max-workers', default=2, type=int, help=help_max_workers)
+    parser.add_argument('-m', '--max-processes', default=5, type=int, help=help_max_processes)
+    parser.add_argument('-s', '--synchronous', action='store_true', help=help_synchronous)
+    parser.add_argument('--poll-interval', default=60, type=float, help=help_poll_interval)
+    parser.add_argument('--max-wait', default=25 * 60 * 60, type=float, help=help_max_wait)
+    parser.add_argument('-f', '--force', action='store_true', help=help_force)
+    args = parser.parse_args(argv)
+
+    # Shared state and locks
+    state = load_state()
+    locks = {'state': threading.Lock(), 'metrics': threading.Lock(), 'db': threading.Lock()}
+    options = {
+        'synchronous': args.synchronous,
+        'max_processes': args.max_processes,
+        'poll_interval': args.poll_interval,
+        'max_wait': args.max_wait,
+        'force': args.force,
+    }
+
+    # Run each combination of prompt and set
+    with ThreadPoolExecutor(args.max_workers) as executor:
+        futures = {
+            (set_name, prompt_number): executor.submit(
+                run_chain, prompt_number, set_name, args.stages, options, state, locks
+            )
+            for set_name in args.sets for prompt_number in args.prompts
+        }
+
+    # Summarize results, counting chains that raised an exception as failed
+    failed = []
+    for (set_name, prompt_number), future in futures.items():
+        try:
+            succeeded = future.result()
+        except Exception as exception:
+            print(f"[{set_name}_{prompt_number:02d}] {type(exception).__name__}: {exception}", file=sys.stderr)
+            succeeded = False
+        if not succeeded:
+            failed.append(f'{set_name}_{prompt_number:02d}')
+    print(f"Completed: {len(futures) - len(failed)} of {len(futures)}")
+    if len(failed) > 0:
+        print(f"Failed: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,110 +1,204 @@
-import numpy as np
-import pandas as pd
-
 import argparse
+from concurrent.futures import Future, ThreadPoolExecutor
 import json
-from multiprocessing import Pool
 import os
 import sys
 
 sys.path.append(os.getcwd())
 
-from utils.regex import create_genes_regex, get_pmcid_from_filename
-from utils.run import get_relevant_lines, write_batch_input, execute_batch, execute_chat_completion
-
-with open('paths.json') as file:
-    paths = json.load(file)
-    articles_texts = paths['data']['articles']['texts']
-    genes_info = paths['data']['genes']['info']
-
-
-def format_get_relevant_lines_dict_item(
-    article_pmcid: str,
-    article_lines: list[str],
-    genes_regex: str,
-    threshold: int
-) -> tuple[str, str]:
-    """
-    A wrapper for get_relevant_lines that joins all lines and returns a valid key-value pair for adding to a dictionary.
-    :param article_pmcid: The article's PMCID.
-    :param article_lines: A list of lines in the article.
-    :param genes_regex: A regular expression that matches gene symbols.
-    :param threshold: The minimum number of unique gene symbols a line must have to be returned.
-    :return: A tuple containing the article's PMCID (key) and a string with all relevant lines from the article (value).
-    """
-
-    # Call get_relevant_lines and create a tuple
-    return article_pmcid, ''.join(get_relevant_lines(article_lines, genes_regex, threshold))
-
-
-def create_batch_input(batch_id: str, article_pmcids: list[str], prompt_number: int, max_processes: int) -> None:
+from utils.batch import read_jsonl
+from utils.cache import get_request_key, read_cached_response, write_cached_response
+from utils.compact import compact_article
+from utils.config import get_paths
+from utils.cost import count_tokens_input, count_tokens_text, count_tokens_texts
+from utils.extract import get_articles_relevant_lines, get_indexed_articles_relevant_lines
+from utils.genes import load_gene_vocabulary
+from utils.governor import RateLimitGovernor, get_governor
+from utils.instrument import set_profiler, stage
+from utils.pack import format_packed_article, pack_articles, save_packs, unpack_batch_output
+from utils.regex import get_pmcid_from_filename
+from utils.run import (
+    write_batch_input,
+    format_request_output,
+    execute_batch,
+    retrieve_batch,
+    execute_chat_completion,
+    model,
+)
+from utils.shard import get_shard_batch_id, parse_shard, select_shard
+
+paths = get_paths()
+articles_texts = paths['data']['articles']['texts']
+
+
+def create_batch_input(
+    batch_id: str,
+    article_pmcids: list[str],
+    prompt_number: int,
+    max_processes: int,
+    histogram: bool = False,
+    use_index: bool = False,
+    triage: bool = False,
+    use_mmap: bool = False,
+    compact: bool = False,
+    pack_budget: int | None = None
+) -> None:
     """
     Create a batch of requests with a specific prompt.
     :param batch_id: A unique identifier to appear within the filename of the batch.
     :param article_pmcids: A list of PMCIDs of all articles to be included in the batch.
     :param prompt_number: The number in the prompt filename.
     :max_processes: The maximum number of processes in a pool.
+    :param histogram: Whether to log a histogram of the time taken to find relevant lines in each article.
+    :param use_index: Whether to get relevant lines from the gene mention index instead of searching each article.
+    :param triage: Whether to only include articles scoring at least the calibrated triage cutoff.
+    :param use_mmap: Whether to memory-map articles and search their bytes instead of reading them as text.
+    :param compact: Whether to remove repeated lines, extra whitespace, and numeric table cells from relevant lines.
+    :param pack_budget: The maximum number of tokens of relevant lines in a request packing several small articles, or
+    None to send each article in its own request.
     """
 
     # Load the prompt
     with open(paths['prompts']['prompt'].format(prompt_number=prompt_number)) as file:
         prompt = ''.join(file.readlines())
 
-    # Create a regex for detecting gene symbols
-    data = pd.read_csv(genes_info, sep='\t', dtype=object)
-    genes = np.concatenate([
-        data['external_gene_name'].dropna().unique(),
-        data['external_synonym'].dropna().unique()
-    ], axis=0)
-    genes_regex = create_genes_regex(genes)
-
-    # Prepare articles as arguments for mapping
-    args = []
-    threshold = 2
-    for article_pmcid in article_pmcids:
-        with open(f'{paths['data']['articles']['texts']}/{article_pmcid}.txt', errors='ignore') as file:
-            args.append((article_pmcid, file.readlines(), genes_regex, threshold))
-
     # Get relevant lines from articles
-    with Pool(max_processes) as pool:
-        articles = dict(pool.starmap(format_get_relevant_lines_dict_item, args))
+    threshold = 2
+    features = {} if triage else None
+    if use_index:
+        articles = get_indexed_articles_relevant_lines(batch_id, article_pmcids, threshold, max_processes, features)
+    else:
+        vocabulary = load_gene_vocabulary()
+        articles = get_articles_relevant_lines(
+            batch_id,
+            article_pmcids,
+            vocabulary['genes_regex'],
+            threshold,
+            max_processes,
+            histogram,
+            features,
+            vocabulary['genes_regex_bytes'] if use_mmap else None,
+        )
+
+    # Only keep articles likely to contain a gene signature, only importing NumPy for triage so that commands not using
+    # it start quickly
+    if triage:
+        import numpy as np
+        from utils.triage import load_triage_cutoff, score_articles
+        with stage('triage', batch_id=batch_id) as event:
+            cutoff = load_triage_cutoff()
+            scores = score_articles(np.array([features[article_pmcid] for article_pmcid in articles]))
+            articles = {
+                article_pmcid: article_relevant
+                for (article_pmcid, article_relevant), score in zip(articles.items(), scores)
+                if score >= cutoff
+            }
+            event['items'] = len(articles)
+            event['total'] = len(scores)
+        print(f"Articles Routed: {len(articles)} of {len(scores)}")
+
+    # Shorten relevant lines and report the input tokens saved
+    if compact:
+        with stage('compaction', batch_id=batch_id) as event:
+            tokens_before = count_tokens_text(list(articles.values()), model)
+            articles = {
+                article_pmcid: compact_article(article_relevant) for article_pmcid, article_relevant in articles.items()
+            }
+            event['items'] = len(articles)
+            event['tokens_before'] = tokens_before
+            event['tokens_after'] = count_tokens_text(list(articles.values()), model)
+        tokens_saved = event['tokens_before'] - event['tokens_after']
+        print(f"Input Tokens Saved: {tokens_saved} of {tokens_before} ({tokens_saved / max(1, tokens_before):.1%})")
+
+    # Pack small articles into shared requests, saving which articles are in each for unpacking the output
+    packs = None
+    if pack_budget is not None:
+        with stage('packing', batch_id=batch_id) as event:
+            packed_articles = [
+                format_packed_article(article_pmcid, article_relevant)
+                for article_pmcid, article_relevant in articles.items()
+            ]
+            articles_tokens = dict(zip(articles, count_tokens_texts(packed_articles, model)))
+            packs = pack_articles(articles_tokens, pack_budget)
+            event['items'] = sum(len(pack) for pack in packs.values())
+            event['requests'] = len(packs)
+        print(f"Articles Packed: {event['items']} of {len(articles)} in {len(packs)} requests")
+    save_packs(batch_id, packs)
 
     # Write batch
-    write_batch_input(batch_id, articles, prompt)
+    write_batch_input(batch_id, articles, prompt, packs)
+
+
+def send_chat_completion(request_input: dict, tokens: int, governor: RateLimitGovernor) -> dict:
+    """
+    Send a request as a chat completion and cache its response as soon as it arrives.
+    :param request_input: The input request.
+    :param tokens: The number of tokens the request counts against the tokens-per-minute limit.
+    :param governor: The governor pacing requests.
+    :return: The response body.
+    """
+
+    # Send the request and cache the response
+    response_body = execute_chat_completion(request_input['body'], governor, tokens).to_dict()
+    write_cached_response(get_request_key(request_input['body']), response_body)
+    return response_body
 
 
-def execute_chat_completions(batch_id: str) -> None:
+def execute_chat_completions(batch_id: str, use_cache: bool = True, max_workers: int = 8) -> None:
     """
-    Execute all requests in a batch as separate chat completions for synchronous processing.
+    Execute all requests in a batch as separate chat completions for synchronous processing. Requests with cached
+    responses are not sent, and the rest are sent concurrently at a pace set by a rate limit governor.
     :param batch_id: A unique identifier for the batch.
+    :param use_cache: Whether to reuse cached responses instead of sending requests.
+    :param max_workers: The maximum number of requests in flight at once.
     """
 
     # Read all requests from the batch
-    with open(paths['batch']['input'].format(batch_id=batch_id)) as file:
-        requests_input = file.readlines()
+    requests_input = list(read_jsonl(paths['batch']['input'].format(batch_id=batch_id)))
 
     # Save outputs in a batch-like format
-    with open(paths['batch']['output'].format(batch_id=batch_id), 'w') as file:
-
-        # Create a chat completion for each request
-        for request_input in requests_input:
-            request_input = json.loads(request_input)
-            completion = execute_chat_completion(request_input['body'])
-
-            # Format and write each chat completion
-            request_output = {
-                'custom_id': request_input['custom_id'],
-                'response': {
-                    'body': completion.to_dict()
-                }
-            }
-            json.dump(request_output, file)
+    with (
+        stage('completion', batch_id=batch_id, cache_hits=0, max_workers=max_workers) as event,
+        ThreadPoolExecutor(max_workers) as executor,
+        open(paths['batch']['output'].format(batch_id=batch_id), 'w') as file,
+    ):
+
+        # Send each request without a cached response, counting the prompt and the most tokens the completion may use
+        # as the API does for rate limits
+        governor = get_governor(max_workers)
+        responses = {}
+        for i, request_input in enumerate(requests_input):
+            response_body = read_cached_response(get_request_key(request_input['body'])) if use_cache else None
+            if response_body is None:
+                tokens = count_tokens_input(request_input) + request_input['body']['max_completion_tokens']
+                responses[i] = executor.submit(send_chat_completion, request_input, tokens, governor)
+                event['items'] += 1
+            else:
+                responses[i] = response_body
+                event['cache_hits'] += 1
+
+        # Format and write each chat completion in order
+        for i, request_input in enumerate(requests_input):
+            response_body = responses.pop(i)
+            if isinstance(response_body, Future):
+                response_body = response_body.result()
+            json.dump(format_request_output(request_input['custom_id'], response_body), file)
             file.write('\n')
+        event.update(governor.stats)
 
+    # Split the outputs of packed requests into outputs for each article
+    unpack_batch_output(batch_id)
 
-def main() -> None:
+    # Display cache usage
+    print(f"Cached Responses: {event['cache_hits']}")
+    print(f"Requests Sent: {event['items']}")
+    print(f"Throttled Requests: {governor.stats['throttled']}")
+
+
+def main(argv: list[str] | None = None) -> None:
     """
     Run functions for processing articles.
+    :param argv: Command line arguments to parse instead of those passed to the script.
     """
 
     # Command line help messages
@@ -113,9 +207,26 @@ def main() -> None:
     help_create = "Create a file of requests for the prompt and set of articles."
     help_execute = "Execute a batch of requests from an existing file for the prompt and set of articles."
     help_synchronous = "If executing a batch, instead excute as individual synchronous chat completions."
+    help_max_workers = "The maximum number of synchronous chat completions in flight at once."
+    help_retrieve = "Retrieve the output of an executed batch if it has completed."
+    help_no_cache = "Send every request even if a cached response exists."
     help_val_set = "Use the validation set instead of the entire dataset."
     help_test_set = "Use the test set instead of the entire dataset."
     help_max_processes = "The maximum number of processes to use for regex processing."
+    help_mmap = "When creating requests, memory-map articles and only decode lines that may mention gene symbols."
+    help_compact = "When creating requests, remove repeated lines, extra whitespace, and numeric table cells."
+    help_pack = (
+        "When creating requests, send articles with few relevant lines together in requests of up to this many tokens "
+        "of relevant lines. Outputs are split back into one per article when executing or retrieving the batch."
+    )
+    help_histogram = "Log a histogram of the time taken to find relevant lines in each article."
+    help_use_index = "When creating requests, use the gene mention index, indexing articles as needed."
+    help_triage = "When creating requests, skip articles scoring below the cutoff saved by run/triage.py."
+    help_shard = (
+        "Only process shard i of N (given as i/N, counting from 0), which holds the articles whose PMCIDs hash to it. "
+        "Each shard has its own batch files, which run/merge.py combines once every shard is done."
+    )
+    help_profile = "Profile each stage with the specified profiler and save the results under logs/profiles."
 
     # Parse command line arguments
     parser = argparse.ArgumentParser(description=description)
@@ -123,11 +234,23 @@ def main() -> None:
     parser.add_argument('-c', '--create', action='store_true', help=help_create)
     parser.add_argument('-e', '--execute', action='store_true', help=help_execute)
     parser.add_argument('-s', '--synchronous', action='store_true', help=help_synchronous)
+    parser.add_argument('-w', '--max-workers', default=8, type=int, help=help_max_workers)
+    parser.add_argument('-r', '--retrieve', action='store_true', help=help_retrieve)
+    parser.add_argument('--no-cache', action='store_true', help=help_no_cache)
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--val-set', action='store_true', help=help_val_set)
     group.add_argument('--test-set', action='store_true', help=help_test_set)
     parser.add_argument('-m', '--max-processes', default=5, type=int, help=help_max_processes)
-    args = parser.parse_args()
+    parser.add_argument('-i', '--use-index', action='store_true', help=help_use_index)
+    parser.add_argument('-t', '--triage', action='store_true', help=help_triage)
+    parser.add_argument('--mmap', action='store_true', help=help_mmap)
+    parser.add_argument('-k', '--compact', action='store_true', help=help_compact)
+    parser.add_argument('--pack', type=int, metavar='TOKENS', help=help_pack)
+    parser.add_argument('--histogram', action='store_true', help=help_histogram)
+    parser.add_argument('--shard', type=parse_shard, help=help_shard)
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], help=help_profile)
+    args = parser.parse_args(argv)
+    set_profiler(args.profile)
 
     # Set up input information
     match args.val_set, args.test_set:
@@ -154,13 +277,35 @@ def main() -> None:
             batch_id = f'test_{args.prompt_number:02d}'
             article_pmcids = list(test_targets.keys())
 
+    # Only keep the articles in the shard, giving the shard its own batch files
+    batch_id = get_shard_batch_id(batch_id, args.shard)
+    article_pmcids = select_shard(article_pmcids, args.shard)
+
     # Create a JSONL file containing a batch of requests
     if args.create:
-        create_batch_input(batch_id, article_pmcids, args.prompt_number, args.max_processes)
+        create_batch_input(
+            batch_id,
+            article_pmcids,
+            args.prompt_number,
+            args.max_processes,
+            args.histogram,
+            args.use_index,
+            args.triage,
+            args.mmap,
+            args.compact,
+            args.pack,
+        )
 
     # Run a batch using the JSONL file
     if args.execute:
-        execute_chat_completions(batch_id) if args.synchronous else execute_batch(batch_id)
+        if args.synchronous:
+            execute_chat_completions(batch_id, not args.no_cache, args.max_workers)
+        else:
+            execute_batch(batch_id, not args.no_cache)
+
+    # Retrieve the output of a batch
+    if args.retrieve:
+        retrieve_batch(batch_id)
 
 
 if __name__ == '__main__':
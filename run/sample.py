@@ -3,10 +3,14 @@ import numpy as np
 import argparse
 import json
 import os
+import sys
 
-with open('paths.json') as file:
-    paths = json.load(file)
-    articles_texts = paths['data']['articles']['texts']
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+
+paths = get_paths()
+articles_texts = paths['data']['articles']['texts']
 
 
 def sample_articles(n_samples: int) -> np.ndarray:
@@ -30,9 +34,10 @@ def sample_articles(n_samples: int) -> np.ndarray:
     return np.random.default_rng().choice(articles_filenames, size=n_samples, replace=False)
 
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
     """
     Run sampling as needed.
+    :param argv: Command line arguments to parse instead of those passed to the script.
     """
 
     # Command line help messages
@@ -42,7 +47,7 @@ def main() -> None:
     # Parse command line arguments
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument('-n', '--n-samples', default=1, type=int, help=help_n_samples)
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Sample a new article
     print(sample_articles(args.n_samples))
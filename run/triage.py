@@ -0,0 +1,113 @@
+import numpy as np
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.extract import get_articles_relevant_lines, get_indexed_articles_relevant_lines
+from utils.genes import load_gene_vocabulary
+from utils.triage import save_triage_cutoff, score_articles
+
+paths = get_paths()
+
+
+def get_scores(batch_id: str, targets: dict[str, list], max_processes: int, use_index: bool) -> np.ndarray:
+    """
+    Score every article in a set for triage.
+    :param batch_id: A unique identifier for logging the stages of scoring.
+    :param targets: A dictionary mapping article PMCIDs in the set to their expected targets.
+    :param max_processes: The maximum number of processes to use for regex processing.
+    :param use_index: Whether to compute features from the gene mention index instead of searching each article.
+    :return: An array of scores in the order of the targets.
+    """
+
+    # Compute features for each article in exactly the same way as when creating requests
+    threshold = 2
+    features = {}
+    if use_index:
+        get_indexed_articles_relevant_lines(batch_id, list(targets), threshold, max_processes, features)
+    else:
+        genes_regex = load_gene_vocabulary()['genes_regex']
+        get_articles_relevant_lines(batch_id, list(targets), genes_regex, threshold, max_processes, False, features)
+    return score_articles(np.array([features[article_pmcid] for article_pmcid in targets]))
+
+
+def evaluate_cutoff(scores: np.ndarray, positive: np.ndarray, cutoff: float) -> dict:
+    """
+    Measure how well a cutoff separates articles with gene signatures from those without.
+    :param scores: The score of each article.
+    :param positive: Whether each article contains a gene signature.
+    :param cutoff: The cutoff score.
+    :return: A dictionary containing the recall on articles with gene signatures, the fraction of articles without gene
+    signatures that are skipped, and the fraction of all articles that are routed to the API.
+    """
+
+    # Compare routed articles to targets
+    routed = scores >= cutoff
+    return {
+        'recall': float(routed[positive].mean()) if positive.any() else 1.0,
+        'negatives_skipped': float((~routed[~positive]).mean()) if (~positive).any() else 0.0,
+        'routed': float(routed.mean()) if routed.shape[0] > 0 else 0.0,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Calibrate the triage cutoff.
+    :param argv: Command line arguments to parse instead of those passed to the script.
+    """
+
+    # Command line help messages
+    description = (
+        "Calibrate the score below which articles are skipped when creating requests with --triage. "
+        "The cutoff is the highest score that keeps the target recall on articles with gene signatures in the validation "
+        "set."
+    )
+    help_recall = "The minimum fraction of articles with gene signatures in the validation set that must be routed."
+    help_test_set = "Also report the recall on the test set using the calibrated cutoff."
+    help_max_processes = "The maximum number of processes to use for regex processing."
+    help_use_index = "Use the gene mention index, indexing articles as needed."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-r', '--recall', default=1.0, type=float, help=help_recall)
+    parser.add_argument('--test-set', action='store_true', help=help_test_set)
+    parser.add_argument('-m', '--max-processes', default=5, type=int, help=help_max_processes)
+    parser.add_argument('-i', '--use-index', action='store_true', help=help_use_index)
+    args = parser.parse_args(argv)
+
+    # Score the validation set
+    with open(paths['run']['targets']['val']) as file:
+        val_targets = json.load(file)
+    scores = get_scores('triage_val', val_targets, args.max_processes, args.use_index)
+    positive = np.array([len(target) > 0 for target in val_targets.values()])
+
+    # Choose the highest cutoff that keeps the target recall
+    cutoff = float(np.quantile(scores[positive], 1 - args.recall, method='lower')) if positive.any() else 0.0
+    calibration = evaluate_cutoff(scores, positive, cutoff)
+    print(f"Cutoff: {cutoff}")
+    print(f"Validation Recall: {calibration['recall']}")
+    print(f"Validation Negatives Skipped: {calibration['negatives_skipped']}")
+    print(f"Validation Articles Routed: {calibration['routed']}")
+
+    # Check the cutoff on articles not used for calibration
+    if args.test_set:
+        with open(paths['run']['targets']['test']) as file:
+            test_targets = json.load(file)
+        scores = get_scores('triage_test', test_targets, args.max_processes, args.use_index)
+        positive = np.array([len(target) > 0 for target in test_targets.values()])
+        evaluation = evaluate_cutoff(scores, positive, cutoff)
+        print(f"Test Recall: {evaluation['recall']}")
+        print(f"Test Negatives Skipped: {evaluation['negatives_skipped']}")
+        print(f"Test Articles Routed: {evaluation['routed']}")
+
+    # Save the cutoff
+    save_triage_cutoff(cutoff, calibration)
+
+
+if __name__ == '__main__':
+    main()
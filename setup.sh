@@ -20,3 +20,6 @@ nohup python3 -u setup/articles.py > logs/nohup.out &
 
 # Get gene info
 Rscript setup/genes.R
+
+# Compile the gene vocabulary
+python3 setup/vocabulary.py
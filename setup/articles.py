@@ -3,52 +3,79 @@ from Bio import Entrez
 import pandas as pd
 
 import argparse
+import datetime
 import json
 import os
+import subprocess
 import sys
 import time
 
-with open('paths.json') as file:
-    paths = json.load(file)
-    articles_info = paths['data']['articles']['info']
-    articles_texts = paths['data']['articles']['texts']
+sys.path.append(os.getcwd())
 
-with open('settings.json') as file:
-    settings = json.load(file)
-    email = settings['email']
+from utils.config import get_paths, get_settings
+from utils.instrument import set_profiler, stage
 
+paths = get_paths()
+articles_info = paths['data']['articles']['info']
+articles_sync = paths['data']['articles']['sync']
+articles_texts = paths['data']['articles']['texts']
 
-def query() -> None:
+
+def search(mindate: str | None = None, maxdate: str | None = None) -> list[str]:
     """
-    Query PubMed Central for articles using Entrez.
+    Search PubMed Central for articles potentially containing gene signatures using Entrez.
+    :param mindate: The earliest date (as YYYY/MM/DD) an article may have been added or modified, or None to search all
+    articles.
+    :param maxdate: The latest date (as YYYY/MM/DD) an article may have been added or modified, which is required if
+    mindate is given.
+    :return: A list of the PMC IDs found.
     """
 
     # Set email for Entrez
-    Entrez.email = email
+    Entrez.email = get_settings()['email']
+
+    # Restrict the search to a range of modification dates if given
+    dates = {} if mindate is None else {'datetype': 'mdat', 'mindate': mindate, 'maxdate': maxdate}
 
     # Get article PMCIDs
-    handle_esearch = Entrez.esearch(db='pmc', term='"gene signature" OR "gene set"', retmax=2 ** 31 - 1)
-    record_esearch = Entrez.read(handle_esearch)
-    handle_esearch.close()
+    with stage('esearch', **dates) as event:
+        handle_esearch = Entrez.esearch(db='pmc', term='"gene signature" OR "gene set"', retmax=2 ** 31 - 1, **dates)
+        record_esearch = Entrez.read(handle_esearch)
+        handle_esearch.close()
+        event['items'] = len(record_esearch['IdList'])
     print(f"Number of Articles: {record_esearch['Count']}")
     print(f"Number of PMCIDs: {len(record_esearch['IdList'])}")
+    return list(record_esearch['IdList'])
+
+
+def summarize(ids: list[str]) -> pd.DataFrame:
+    """
+    Get information on articles from their summaries using Entrez.
+    :param ids: A list of PMC IDs as returned by search.
+    :return: A DataFrame with a row for each author of each article, sorted by PMC ID.
+    """
+
+    # Set email for Entrez
+    Entrez.email = get_settings()['email']
 
     # Get article summaries
     record_esummary = []
     batch_size = 9999
-    n_iters = int(record_esearch['Count']) // batch_size + (int(record_esearch['Count']) % batch_size > 0)
+    n_iters = len(ids) // batch_size + (len(ids) % batch_size > 0)
     for i in range(n_iters):
         start_index = i * batch_size
-        end_index = min((i + 1) * batch_size, int(record_esearch['Count']))
+        end_index = min((i + 1) * batch_size, len(ids))
         print(f"Retrieving summaries for indices {start_index} to {end_index - 1}...")
-        handle_esummary = Entrez.esummary(db='pmc', id=record_esearch['IdList'][start_index:end_index], retmax=batch_size)
-        record_esummary += Entrez.read(handle_esummary)
-        handle_esummary.close()
+        with stage('esummary', start_index=start_index) as event:
+            handle_esummary = Entrez.esummary(db='pmc', id=ids[start_index:end_index], retmax=batch_size)
+            record_esummary += Entrez.read(handle_esummary)
+            handle_esummary.close()
+            event['items'] = end_index - start_index
     record_esummary.sort(key=lambda summary: int(summary['Id']))
     print(f"Number of Article Summaries: {len(record_esummary)}")
 
     # Extract relevant information
-    data = pd.DataFrame({
+    return pd.DataFrame({
         'doi': [
             summary['ArticleIds']['doi'] if 'doi' in summary['ArticleIds'] else ''
             for summary in record_esummary for _ in range(len(summary['AuthorList']))
@@ -86,66 +113,179 @@ def query() -> None:
             for summary in record_esummary for _ in range(len(summary['AuthorList']))
         ],
     })
-    data.to_csv(articles_info, sep='\t', index=False)
 
 
-def get_articles_texts(max_processes: int) -> None:
+def load_sync() -> dict | None:
+    """
+    Load the state of the last sync of articles.
+    :return: A dictionary with the date of the last sync of article information ('date', as YYYY/MM/DD) and the PMCIDs
+    of articles whose texts could not be downloaded ('unavailable'), either of which may be missing, or None if articles
+    were never synced.
+    """
+
+    # Articles fetched before syncs were recorded must be fetched again in full
+    try:
+        with open(articles_sync) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save_sync(**sync) -> None:
+    """
+    Update the state of syncing articles once the changes it records have been written, keeping anything not given.
+    :param sync: The keys of the state to replace, as returned by load_sync.
+    """
+
+    # Write the updated state
+    sync = {**(load_sync() or {}), **sync}
+    with open(articles_sync, 'w') as file:
+        json.dump(sync, file, indent=4)
+
+
+def query(full: bool = False) -> None:
+    """
+    Query PubMed Central for articles using Entrez. After the first query, only articles added or modified since the
+    last sync are searched, and information on articles not already known is appended.
+    :param full: Whether to search all articles and rewrite the articles info file even if it was synced before.
+    """
+
+    # Search articles added or modified since the last sync, including that day since the sync may have been partial
+    today = datetime.date.today().strftime('%Y/%m/%d')
+    date = None if full or not os.path.exists(articles_info) else (load_sync() or {}).get('date')
+    if date is None:
+        ids = search()
+    else:
+        print(f"Syncing articles since {date}")
+        ids = search(date, today)
+
+    # Rewrite the articles info file after a full search
+    if date is None:
+        data = summarize(ids)
+        with stage('serialization') as event:
+            data.to_csv(articles_info, sep='\t', index=False)
+            event['items'] = data.shape[0]
+            event['bytes'] = os.path.getsize(articles_info)
+        save_sync(date=today)
+        return
+
+    # Otherwise, only summarize articles not already known, since modified articles keep their PMCIDs
+    known_pmcids = set(pd.read_csv(articles_info, sep='\t', usecols=['pmcid'], dtype=object)['pmcid'])
+    ids = [pmc_id for pmc_id in ids if f'PMC{pmc_id}' not in known_pmcids]
+    print(f"Number of New PMCIDs: {len(ids)}")
+    if len(ids) > 0:
+        data = summarize(ids)
+        data = data[~data['pmcid'].isin(known_pmcids)]
+        with stage('serialization', mode='append') as event:
+            size = os.path.getsize(articles_info)
+            data.to_csv(articles_info, sep='\t', index=False, header=False, mode='a')
+            event['items'] = data.shape[0]
+            event['bytes'] = os.path.getsize(articles_info) - size
+    save_sync(date=today)
+
+
+def get_articles_texts(max_processes: int, full: bool = False) -> None:
     """
-    Get text from articles in the PMC Open Access Subset.
+    Get text from articles in the PMC Open Access Subset that have not been downloaded yet. Articles that S3 reports as
+    missing under every prefix are recorded and skipped in later syncs, while other failed downloads are retried.
     :param max_processes: The maximum number of child processes to create.
+    :param full: Whether to retry articles that could not be downloaded before.
     """
 
-    # Retrieve all PMCIDs
+    # Retrieve PMCIDs of articles not downloaded yet, skipping those that were unavailable before
     data = pd.read_csv(articles_info, sep='\t', dtype=object)
+    unavailable = set() if full else set((load_sync() or {}).get('unavailable', []))
     pmcids = data['pmcid'].dropna().unique()
+    pmcids = pmcids[[
+        pmcid not in unavailable and not os.path.exists(f'{articles_texts}/{pmcid}.txt') for pmcid in pmcids
+    ]]
+    print(f"Articles to Download: {pmcids.shape[0]}")
+    print(f"Articles Skipped as Unavailable: {len(unavailable)}")
 
-    # Command to run
+    # Command to run, and the exit code a child uses to report that no prefix had the article
     cmd = 'aws s3 cp s3://pmc-oa-opendata/{dir}/txt/all/{pmcid}.txt {articles_texts} --no-sign-request'
+    not_found_code = 3
 
     # Use PMCIDs to download articles
+    not_found = set()
     n_iters = pmcids.shape[0] // max_processes + (pmcids.shape[0] % max_processes > 0)
     for i in range(n_iters):
         start_index = i * max_processes
         end_index = min((i + 1) * max_processes, pmcids.shape[0])
         start_time = time.time()
-        for j in range(start_index, end_index):
+        with stage('download', start_index=start_index) as event:
+            children = {}
+            for j in range(start_index, end_index):
 
-            # If child, use the AWS CLI to download article text
-            if os.fork() == 0:
-                os.system(cmd.format(dir='oa_comm', pmcid=pmcids[j], articles_texts=articles_texts))
-                os.system(cmd.format(dir='oa_noncomm', pmcid=pmcids[j], articles_texts=articles_texts))
-                os.system(cmd.format(dir='phe_timebound', pmcid=pmcids[j], articles_texts=articles_texts))
-                print(f"Index: {j}, PMCID: {pmcids[j]}")
-                sys.exit()
+                # If child, use the AWS CLI to download article text, counting prefixes that do not have the article
+                pid = os.fork()
+                if pid == 0:
+                    n_not_found = 0
+                    for prefix in ['oa_comm', 'oa_noncomm', 'phe_timebound']:
+                        result = subprocess.run(
+                            cmd.format(dir=prefix, pmcid=pmcids[j], articles_texts=articles_texts),
+                            shell=True, capture_output=True, text=True
+                        )
+                        print(result.stdout, end='')
+                        if result.returncode != 0 and ('(404)' in result.stderr or 'NoSuchKey' in result.stderr):
+                            n_not_found += 1
+                        else:
+                            print(result.stderr, end='', file=sys.stderr)
+                    print(f"Index: {j}, PMCID: {pmcids[j]}", flush=True)
 
-        # If parent, wait for all child processes to exit
-        for j in range(start_index, end_index):
-            os.wait()
+                    # Exit immediately so that the child does not log the stage as its own
+                    os._exit(not_found_code if n_not_found == 3 else 0)
+                children[pid] = pmcids[j]
+
+            # If parent, wait for all child processes to exit, keeping articles that no prefix had
+            for j in range(start_index, end_index):
+                pid, status = os.wait()
+                if os.waitstatus_to_exitcode(status) == not_found_code:
+                    not_found.add(children[pid])
+
+            # Count downloaded articles
+            for j in range(start_index, end_index):
+                if os.path.exists(f'{articles_texts}/{pmcids[j]}.txt'):
+                    event['items'] += 1
+                    event['bytes'] += os.path.getsize(f'{articles_texts}/{pmcids[j]}.txt')
 
         # Print elapsed time
         end_time = time.time()
         print(f"Iteration Time: {end_time - start_time}")
 
+    # Record articles that are not in the Open Access Subset, leaving failed downloads to be retried in the next sync
+    unavailable.update(not_found)
+    save_sync(unavailable=sorted(unavailable))
+
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
     """
     Run setup functions for retrieving articles.
+    :param argv: Command line arguments to parse instead of those passed to the script.
     """
 
     # Command line help messages
     description = "Query and retrieve articles in the PMC Open Access Subset using AWS."
     help_max_processes = "The maximum number of processes to use for fetching articles."
+    help_full = (
+        "Search all articles again instead of only those added or modified since the last sync, and retry downloading "
+        "articles that were unavailable before."
+    )
+    help_profile = "Profile each stage with the specified profiler and save the results under logs/profiles."
 
     # Parse command line arguments
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument('-m', '--max-processes', default=5, type=int, help=help_max_processes)
-    args = parser.parse_args()
+    parser.add_argument('--full', action='store_true', help=help_full)
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], help=help_profile)
+    args = parser.parse_args(argv)
+    set_profiler(args.profile)
 
     # Run queries for articles potentially containing gene signatures
-    query()
+    query(args.full)
 
-    # Get all OA articles
-    get_articles_texts(args.max_processes)
+    # Get OA articles that are missing
+    get_articles_texts(args.max_processes, args.full)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,35 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.genes import build_gene_vocabulary, load_gene_vocabulary
+
+
+def main() -> None:
+    """
+    Build the gene vocabulary.
+    """
+
+    # Command line help messages
+    description = (
+        "Compile gene symbols, their Ensembl IDs, and a regex for detecting them from the genes info file. "
+        "The vocabulary is only rebuilt if the genes info file has changed unless forced."
+    )
+    help_force = "Rebuild the vocabulary even if the genes info file is unchanged."
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-f', '--force', action='store_true', help=help_force)
+    args = parser.parse_args()
+
+    # Build the vocabulary
+    vocabulary = build_gene_vocabulary() if args.force else load_gene_vocabulary()
+    print(f"Number of Gene Symbols: {len(vocabulary['genes'])}")
+    print(f"Genes Info Hash: {vocabulary['source_hash']}")
+    print(f"Vocabulary Fingerprint: {vocabulary['fingerprint']}")
+
+
+if __name__ == '__main__':
+    main()
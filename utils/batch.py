@@ -0,0 +1,138 @@
+import itertools
+import json
+from multiprocessing import Pool
+import os
+import sys
+from typing import Iterator, NamedTuple
+
+sys.path.append(os.getcwd())
+
+
+class OutputRecord(NamedTuple):
+    """
+    A single response from a batch output file.
+    :param custom_id: The custom ID of the request, which is the PMCID of the article.
+    :param content: The JSON content of the response with a list of 'genes', or None if it could not be parsed.
+    :param usage: The token usage of the response or None if it is not available.
+    :param model: The model that generated the response or None if it is not available.
+    :param error: A description of why the content could not be parsed or None if it was parsed successfully.
+    """
+    custom_id: str
+    content: dict | None
+    usage: dict | None
+    model: str | None
+    error: str | None
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    """
+    Read a JSONL file one line at a time.
+    :param path: The path to the JSONL file.
+    :return: An iterator over the JSON object on each line.
+    """
+
+    # Parse each non-empty line
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_output_line(line: str) -> OutputRecord | None:
+    """
+    Parse a line of a batch output file. Failed requests and responses without a valid gene signature are returned with
+    an error instead of raising an exception.
+    :param line: A line of the batch output file.
+    :return: The parsed record or None if the line is not a request output with a custom ID.
+    """
+
+    # The line must at least identify its request
+    try:
+        request_output = json.loads(line)
+        custom_id = request_output['custom_id']
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+    # Get the response body of a successful request
+    response = request_output.get('response') or {}
+    body = response.get('body') or {}
+    usage = body.get('usage')
+    model = body.get('model')
+    if request_output.get('error') is not None:
+        return OutputRecord(custom_id, None, usage, model, f"Request failed: {request_output['error']}")
+    if response.get('status_code', 200) != 200:
+        return OutputRecord(custom_id, None, usage, model, f"Request failed with status {response['status_code']}")
+
+    # Parse the content of the chat completion, which must contain a list of genes
+    try:
+        content = json.loads(body['choices'][0]['message']['content'])
+        if not isinstance(content['genes'], list):
+            raise TypeError(f"'genes' is {type(content['genes']).__name__}, not list")
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError) as exception:
+        return OutputRecord(custom_id, None, usage, model, f"{type(exception).__name__}: {exception}")
+    return OutputRecord(custom_id, content, usage, model, None)
+
+
+def read_batch_output(
+    path: str,
+    counts: dict[str, int] | None = None,
+    max_processes: int = 1,
+    chunk_size: int = 1000
+) -> Iterator[OutputRecord]:
+    """
+    Read a batch output file one record at a time. Lines that are not request outputs are skipped and counted. When
+    using multiple processes, lines are parsed in chunks so that memory use stays bounded by the chunk size.
+    :param path: The path to the batch output file.
+    :param counts: A dictionary updated with the number of 'records', 'errors', 'malformed' lines, and 'bytes' read.
+    :param max_processes: The maximum number of processes to use for parsing.
+    :param chunk_size: The number of lines each process parses at a time.
+    :return: An iterator over the records in the order of the file.
+    """
+
+    # Track counts
+    counts = counts if counts is not None else {}
+    for key in ['records', 'errors', 'malformed', 'bytes']:
+        counts.setdefault(key, 0)
+
+    # Parse lines in this process or in chunks across a pool of processes
+    with open(path) as file:
+        if max_processes > 1:
+            pool = Pool(max_processes)
+            chunks = iter(lambda: list(itertools.islice(file, chunk_size * max_processes)), [])
+            parsed = (
+                (line, record)
+                for lines in chunks
+                for line, record in zip(lines, pool.map(parse_output_line, lines, chunksize=chunk_size))
+            )
+        else:
+            pool = None
+            parsed = ((line, parse_output_line(line)) for line in file)
+
+        # Yield records, counting those that could not be parsed
+        try:
+            for line, record in parsed:
+                counts['bytes'] += len(line)
+                if record is None:
+                    if line.strip():
+                        counts['malformed'] += 1
+                    continue
+                counts['records'] += 1
+                counts['errors'] += record.error is not None
+                yield record
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+
+def print_counts(counts: dict[str, int]) -> None:
+    """
+    Warn about records in a batch output file that could not be used.
+    :param counts: The counts updated by read_batch_output.
+    """
+
+    # Only print if anything went wrong
+    if counts['errors'] > 0 or counts['malformed'] > 0:
+        print(
+            f"Records: {counts['records']}, Errors: {counts['errors']}, Malformed Lines: {counts['malformed']}",
+            file=sys.stderr,
+        )
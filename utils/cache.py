@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+
+paths = get_paths()
+
+
+def get_request_key(body: dict) -> str:
+    """
+    Get a key identifying a request by hashing its body. Requests with the same prompt, model parameters, and article
+    text share a key.
+    :param body: The request body containing the model, messages, and other parameters.
+    :return: A hexadecimal SHA-256 hash of the request body.
+    """
+
+    # Serialize the body canonically before hashing
+    serialized = json.dumps(body, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def get_cache_path(key: str) -> str:
+    """
+    Get the path to a cached response.
+    :param key: The key of the request.
+    :return: The path to the cached response.
+    """
+
+    # Spread responses across subdirectories to keep directories small
+    return paths['cache']['responses'].format(prefix=key[:2], key=key)
+
+
+def read_cached_response(key: str) -> dict | None:
+    """
+    Read a cached response.
+    :param key: The key of the request.
+    :return: The response body or None if the response is not cached.
+    """
+
+    # Load the response if it exists
+    try:
+        with open(get_cache_path(key)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def write_cached_response(key: str, response_body: dict) -> None:
+    """
+    Save a response to the cache.
+    :param key: The key of the request.
+    :param response_body: The response body returned for the request.
+    """
+
+    # Write to a temporary file first so that readers never see a partially written response, giving each writer its
+    # own file since threads of a process may write the same key at once
+    cache_path = get_cache_path(key)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp', 'w') as file:
+        json.dump(response_body, file)
+    os.replace(f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp', cache_path)
@@ -0,0 +1,49 @@
+import re
+
+# A number as written in tables, e.g. '12', '-0.45', '1,024', '3.2e-5', '2.1 × 10−4', '<0.001', or '45%'
+number_regex = r'[<>≤≥~±+\-−–]?\d+(?:[.,]\d+)*(?:[eE][+\-−–]?\d+|\s*[×x]\s*10\^?[+\-−–]?\d+)?%?'
+
+# A table cell containing only numbers (e.g. '0.82 (0.61–1.10)') or placeholders for missing values
+numeric_cell_regex = re.compile(
+    rf'[\s(\[]*{number_regex}(?:[\s,;:/±()\[\]\-−–]+{number_regex})*[\s)\]*†‡]*|[\s\-−–—.*/]*|NA|N/A|n/a|ND|NS|ns'
+)
+
+# Cells are separated by tabs or by runs of at least two spaces
+cell_separator_regex = re.compile(r'\t| {2,}')
+
+
+def compact_line(line: str) -> str:
+    """
+    Shorten a line without removing any words, collapsing runs of whitespace and dropping table cells that only contain
+    numbers. Lines without several cells are only collapsed, since numbers in sentences may give context to genes.
+    :param line: A line from an article.
+    :return: The compacted line without a trailing newline, which is empty if nothing but numbers remained.
+    """
+
+    # Drop numeric cells from lines that look like table rows
+    cells = cell_separator_regex.split(line.strip())
+    if len(cells) > 1:
+        cells = [cell for cell in cells if numeric_cell_regex.fullmatch(cell) is None]
+
+    # Collapse whitespace within cells, keeping cells of tab-separated tables apart with single tabs
+    return ('\t' if '\t' in line.strip() else ' ').join(' '.join(cell.split()) for cell in cells if cell != '')
+
+
+def compact_article(article_relevant: str) -> str:
+    """
+    Reduce the tokens used by an article's relevant lines by compacting each line and removing lines repeated within the
+    article, such as table rows and figure captions appearing more than once. Gene symbols and the words around them
+    are kept, as is the order of the remaining lines.
+    :param article_relevant: A string with all relevant lines from the article.
+    :return: A string with the compacted relevant lines.
+    """
+
+    # Keep the first copy of each non-empty compacted line
+    seen = set()
+    lines = []
+    for line in article_relevant.splitlines():
+        line = compact_line(line)
+        if len(line) > 0 and line not in seen:
+            seen.add(line)
+            lines.append(f'{line}\n')
+    return ''.join(lines)
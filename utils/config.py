@@ -0,0 +1,27 @@
+from functools import cache
+import json
+
+
+@cache
+def get_paths() -> dict:
+    """
+    Read the paths to all files used in this project. The file is only read once per process.
+    :return: A dictionary of paths.
+    """
+
+    # Read the file
+    with open('paths.json') as file:
+        return json.load(file)
+
+
+@cache
+def get_settings() -> dict:
+    """
+    Read user settings such as the OpenAI API key. The file is only read once per process and only when a setting is
+    first needed.
+    :return: A dictionary of settings.
+    """
+
+    # Read the file
+    with open('settings.json') as file:
+        return json.load(file)
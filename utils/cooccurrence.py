@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.instrument import stage
+
+
+def count_cooccurrences(table_gene_signature: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Count how many gene signatures contain each gene and each pair of genes.
+    :param table_gene_signature: A DataFrame with the same columns as the GeneSignature table.
+    :return: A tuple containing DataFrames with the same columns as the GeneFrequency and GeneCooccurrence tables.
+    """
+
+    # Encode articles and genes as integers, sorting genes within each signature
+    table_gene_signature = table_gene_signature[['article_pmcid', 'gene_ensembl_id']].dropna().drop_duplicates()
+    genes, gene_codes = np.unique(table_gene_signature['gene_ensembl_id'].to_numpy(dtype=str), return_inverse=True)
+    _, article_codes = np.unique(table_gene_signature['article_pmcid'].to_numpy(dtype=str), return_inverse=True)
+    order = np.lexsort((gene_codes, article_codes))
+    gene_codes = gene_codes[order]
+    article_codes = article_codes[order]
+
+    # Count gene frequencies
+    table_gene_frequency = pd.DataFrame({
+        'gene_ensembl_id': genes,
+        'signatures': np.bincount(gene_codes, minlength=genes.shape[0]),
+    })
+
+    # Pair each gene with every gene after it in the same signature
+    sizes = np.bincount(article_codes)
+    starts = np.cumsum(sizes) - sizes
+    positions = np.arange(gene_codes.shape[0]) - starts[article_codes]
+    n_partners = sizes[article_codes] - positions - 1
+    left = np.repeat(np.arange(gene_codes.shape[0]), n_partners)
+    right = left + 1 + np.arange(left.shape[0]) - np.repeat(np.cumsum(n_partners) - n_partners, n_partners)
+
+    # Count gene pairs
+    pairs, counts = np.unique(
+        gene_codes[left].astype(np.int64) * genes.shape[0] + gene_codes[right],
+        return_counts=True,
+    )
+    table_gene_cooccurrence = pd.DataFrame({
+        'gene_ensembl_id_a': genes[pairs // max(genes.shape[0], 1)],
+        'gene_ensembl_id_b': genes[pairs % max(genes.shape[0], 1)],
+        'signatures': counts,
+    })
+    return table_gene_frequency, table_gene_cooccurrence
+
+
+def count_new_cooccurrences(
+    table_gene_signature_new: pd.DataFrame,
+    table_gene_signature_all: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Count how many genes and gene pairs are added to gene signatures by new genes, including pairs of new genes with
+    genes already in the same gene signature.
+    :param table_gene_signature_new: A DataFrame with the same columns as the GeneSignature table containing the new
+    genes.
+    :param table_gene_signature_all: A DataFrame with the same columns as the GeneSignature table containing every gene
+    of the gene signatures with new genes, both new and old.
+    :return: A tuple containing DataFrames with the same columns as the GeneFrequency and GeneCooccurrence tables.
+    """
+
+    # Count the gene signatures with and without the new genes
+    keys = ['article_pmcid', 'gene_ensembl_id']
+    is_new = table_gene_signature_all.merge(
+        table_gene_signature_new[keys].drop_duplicates(), on=keys, how='left', indicator=True
+    )['_merge'].to_numpy() == 'both'
+    counts_all = count_cooccurrences(table_gene_signature_all)
+    counts_old = count_cooccurrences(table_gene_signature_all[~is_new])
+
+    # Keep the difference, which only contains counts involving a new gene
+    counts_new = []
+    for table_all, table_old in zip(counts_all, counts_old):
+        columns = [column for column in table_all.columns if column != 'signatures']
+        table = table_all.merge(table_old, on=columns, how='left', suffixes=('', '_old'))
+        table['signatures'] -= table['signatures_old'].fillna(0).astype(np.int64)
+        counts_new.append(table.loc[table['signatures'] > 0, [*columns, 'signatures']].reset_index(drop=True))
+    return counts_new[0], counts_new[1]
+
+
+def add_cooccurrences(
+    table_gene_frequency: pd.DataFrame,
+    table_gene_cooccurrence: pd.DataFrame,
+    con: sqlite3.Connection
+) -> None:
+    """
+    Add gene and gene pair counts to existing counts in the GeneFrequency and GeneCooccurrence tables. Changes are not
+    committed, so that the caller can make them part of a larger transaction.
+    :param table_gene_frequency: A DataFrame with the same columns as the GeneFrequency table.
+    :param table_gene_cooccurrence: A DataFrame with the same columns as the GeneCooccurrence table.
+    :param con: A connection to the SQLite database.
+    """
+
+    # Add the counts to existing counts
+    with stage('db_insert', table='GeneCooccurrence') as event:
+        con.executemany(
+            'INSERT INTO GeneFrequency VALUES (?, ?) '
+            'ON CONFLICT (gene_ensembl_id) '
+            'DO UPDATE SET signatures = signatures + excluded.signatures',
+            table_gene_frequency.astype(object).itertuples(index=False),
+        )
+        con.executemany(
+            'INSERT INTO GeneCooccurrence VALUES (?, ?, ?) '
+            'ON CONFLICT (gene_ensembl_id_a, gene_ensembl_id_b) '
+            'DO UPDATE SET signatures = signatures + excluded.signatures',
+            table_gene_cooccurrence.astype(object).itertuples(index=False),
+        )
+        event['items'] = table_gene_frequency.shape[0] + table_gene_cooccurrence.shape[0]
+
+
+def insert_signature_genes(table_gene_signature: pd.DataFrame, con: sqlite3.Connection) -> None:
+    """
+    Insert the genes of gene signatures into the GeneSignature table and add them to the gene and gene pair counts in
+    the GeneFrequency and GeneCooccurrence tables in a single transaction, so that counts always match the gene
+    signatures. Articles may already have a gene signature, in which case the new genes are also paired with its
+    existing genes. The genes must not already be in the GeneSignature table.
+    :param table_gene_signature: A DataFrame with the same columns as the GeneSignature table.
+    :param con: A connection to the SQLite database.
+    """
+
+    # Insert the genes first, which starts the transaction and keeps other writers out until it is committed
+    table_gene_signature = table_gene_signature[['article_pmcid', 'gene_ensembl_id']].dropna().drop_duplicates()
+    with con:
+        with stage('db_insert', table='GeneSignature') as event:
+            con.executemany(
+                'INSERT INTO GeneSignature (article_pmcid, gene_ensembl_id) VALUES (?, ?)',
+                table_gene_signature.astype(object).itertuples(index=False),
+            )
+            event['items'] = table_gene_signature.shape[0]
+
+        # Count genes and gene pairs added to the full gene signature of each article
+        article_pmcids = table_gene_signature['article_pmcid'].unique()
+        with stage('cooccurrence', signatures=len(article_pmcids)) as event:
+            table_gene_signature_all = pd.DataFrame([
+                (article_pmcid, gene_ensembl_id)
+                for article_pmcid in article_pmcids
+                for (gene_ensembl_id,) in con.execute(
+                    'SELECT gene_ensembl_id FROM GeneSignature WHERE article_pmcid = ?', (article_pmcid,)
+                )
+            ], columns=['article_pmcid', 'gene_ensembl_id'])
+            table_gene_frequency, table_gene_cooccurrence = count_new_cooccurrences(
+                table_gene_signature, table_gene_signature_all
+            )
+            event['items'] = table_gene_cooccurrence.shape[0]
+
+        # Add the counts
+        add_cooccurrences(table_gene_frequency, table_gene_cooccurrence, con)
+
+
+def rebuild_cooccurrences(con: sqlite3.Connection) -> None:
+    """
+    Recount the genes and gene pairs in all gene signatures in the GeneSignature table in a single transaction, so that
+    readers never see the counts cleared or partially rebuilt.
+    :param con: A connection to the SQLite database.
+    """
+
+    # Clear existing counts
+    with con:
+        con.execute('DELETE FROM GeneFrequency')
+        con.execute('DELETE FROM GeneCooccurrence')
+
+        # Count all gene signatures
+        table_gene_signature = pd.read_sql_query('SELECT article_pmcid, gene_ensembl_id FROM GeneSignature', con)
+        with stage('cooccurrence', signatures=int(table_gene_signature['article_pmcid'].nunique())) as event:
+            table_gene_frequency, table_gene_cooccurrence = count_cooccurrences(table_gene_signature)
+            event['items'] = table_gene_cooccurrence.shape[0]
+        add_cooccurrences(table_gene_frequency, table_gene_cooccurrence, con)
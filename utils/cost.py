@@ -1,22 +1,38 @@
-import tiktoken
-
 import sys
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    import tiktoken
 
-def count_tokens_input(request_input: dict) -> int:
+
+def get_encoding(model: str) -> 'tiktoken.Encoding':
     """
-    Count the number of tokens in a request input. For models not supported by tiktoken, the number is only an estimate.
-    :param request_input: The request input.
-    :return: The number of tokens.
+    Get the tokenizer encoding of a model. For models not supported by tiktoken, the cl100k_base encoding is used.
+    :param model: The model.
+    :return: The encoding.
     """
 
+    # Import tiktoken only when counting tokens
+    import tiktoken
+
     # Get encoding
     try:
-        encoding = tiktoken.encoding_for_model(request_input['body']['model'])
+        return tiktoken.encoding_for_model(model)
     except KeyError as exception:
         print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
         print("Using cl100k_base encoding as default.", file=sys.stderr)
-        encoding = tiktoken.get_encoding('cl100k_base')
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def count_tokens_input(request_input: dict) -> int:
+    """
+    Count the number of tokens in a request input. For models not supported by tiktoken, the number is only an estimate.
+    :param request_input: The request input.
+    :return: The number of tokens.
+    """
+
+    # Get encoding
+    encoding = get_encoding(request_input['body']['model'])
 
     # Token counting procedure from OpenAI Cookbook
     tokens = 3
@@ -28,6 +44,32 @@ def count_tokens_input(request_input: dict) -> int:
     return tokens
 
 
+def count_tokens_texts(texts: list[str], model: str) -> list[int]:
+    """
+    Count the number of tokens in each of several texts, such as the contents of messages, without the overhead of the
+    messages.
+    :param texts: A list of texts.
+    :param model: The model whose tokenizer to use.
+    :return: A list with the number of tokens in each text.
+    """
+
+    # Encode all texts at once
+    encoding = get_encoding(model)
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+
+def count_tokens_text(texts: list[str], model: str) -> int:
+    """
+    Count the total number of tokens in several texts.
+    :param texts: A list of texts.
+    :param model: The model whose tokenizer to use.
+    :return: The total number of tokens in all texts.
+    """
+
+    # Add up the tokens in each text
+    return sum(count_tokens_texts(texts, model))
+
+
 def calculate_cost_batch_input(tokens: int, model: str) -> float:
     """
     Calculate the cost of a batch input.
@@ -0,0 +1,203 @@
+from multiprocessing import Pool
+import os
+import sys
+import time
+from typing import TYPE_CHECKING
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.genes import load_gene_vocabulary
+from utils.index import get_indexed_relevant_lines, get_unindexed_pmcids, index_gene_mentions
+from utils.instrument import stage, summarize_timings
+from utils.run import get_relevant_lines
+from utils.sql import connect_wal
+
+if TYPE_CHECKING:
+    import numpy as np
+
+paths = get_paths()
+db = paths['db']['sqlite']
+
+
+def format_get_relevant_lines_dict_item(
+    article_pmcid: str,
+    article_lines: list[str],
+    genes_regex: str,
+    threshold: int,
+    triage: bool = False
+) -> tuple[str, str, float, 'np.ndarray | None']:
+    """
+    A wrapper for get_relevant_lines that joins all lines and returns a valid key-value pair for adding to a dictionary,
+    along with the time taken to find the relevant lines and optionally the features used for triage.
+    :param article_pmcid: The article's PMCID.
+    :param article_lines: A list of lines in the article.
+    :param genes_regex: A regular expression that matches gene symbols.
+    :param threshold: The minimum number of unique gene symbols a line must have to be returned.
+    :param triage: Whether to also compute triage features from the same search.
+    :return: A tuple containing the article's PMCID (key), a string with all relevant lines from the article (value),
+    the time taken in seconds, and the triage features or None.
+    """
+
+    # Call get_relevant_lines and create a tuple
+    start_time = time.perf_counter()
+    if not triage:
+        article_relevant = ''.join(get_relevant_lines(article_lines, genes_regex, threshold))
+        return article_pmcid, article_relevant, time.perf_counter() - start_time, None
+
+    # Count gene symbols on each line once to find both relevant lines and triage features, only importing NumPy for
+    # triage so that creating requests without it stays fast
+    from utils.triage import get_line_gene_counts, get_triage_features
+    line_gene_counts = get_line_gene_counts(article_lines, genes_regex)
+    article_relevant = ''.join(
+        line for line, line_gene_count in zip(article_lines, line_gene_counts) if line_gene_count >= threshold
+    )
+    features = get_triage_features(line_gene_counts, article_relevant, threshold)
+    return article_pmcid, article_relevant, time.perf_counter() - start_time, features
+
+
+def format_scan_relevant_lines_dict_item(
+    article_pmcid: str,
+    genes_regex_bytes: bytes,
+    genes_regex: str,
+    threshold: int,
+    triage: bool = False
+) -> tuple[str, str, float, 'np.ndarray | None']:
+    """
+    A wrapper for get_relevant_lines_mmap that returns the same tuple as format_get_relevant_lines_dict_item, reading
+    the article itself by memory-mapping it.
+    :param article_pmcid: The article's PMCID.
+    :param genes_regex_bytes: A regular expression for bytes that matches gene symbols.
+    :param genes_regex: A regular expression that matches gene symbols.
+    :param threshold: The minimum number of unique gene symbols a line must have to be returned.
+    :param triage: Whether to also compute triage features from the same search.
+    :return: A tuple containing the article's PMCID (key), a string with all relevant lines from the article (value),
+    the time taken in seconds, and the triage features or None.
+    """
+
+    # Import the scanner, which requires NumPy, only when memory-mapping articles
+    from utils.scan import get_relevant_lines_mmap
+    from utils.triage import get_triage_features
+
+    # Call get_relevant_lines_mmap and create a tuple
+    start_time = time.perf_counter()
+    article_relevant, line_gene_counts = get_relevant_lines_mmap(
+        article_pmcid, genes_regex_bytes, genes_regex, threshold
+    )
+    article_relevant = ''.join(article_relevant)
+    features = get_triage_features(line_gene_counts, article_relevant, threshold) if triage else None
+    return article_pmcid, article_relevant, time.perf_counter() - start_time, features
+
+
+def get_articles_relevant_lines(
+    batch_id: str,
+    article_pmcids: list[str],
+    genes_regex: str,
+    threshold: int,
+    max_processes: int,
+    histogram: bool,
+    features: dict[str, 'np.ndarray'] | None = None,
+    genes_regex_bytes: bytes | None = None
+) -> dict[str, str]:
+    """
+    Search articles for relevant lines using a regex.
+    :param batch_id: A unique identifier for the batch being created.
+    :param article_pmcids: A list of PMCIDs of all articles to search.
+    :param genes_regex: A regular expression that matches gene symbols.
+    :param threshold: The minimum number of unique gene symbols a line must have to be returned.
+    :param max_processes: The maximum number of processes in a pool.
+    :param histogram: Whether to log a histogram of the time taken to find relevant lines in each article.
+    :param features: A dictionary to fill with the triage features of each article, or None to skip triage.
+    :param genes_regex_bytes: A regular expression for bytes that matches gene symbols. If given, each process
+    memory-maps its articles and only decodes lines with candidate matches instead of reading whole articles as text.
+    :return: A dictionary mapping PMCIDs to strings with all relevant lines from each article.
+    """
+
+    # Let each process read its articles when scanning bytes
+    if genes_regex_bytes is not None:
+        function = format_scan_relevant_lines_dict_item
+        args = [
+            (article_pmcid, genes_regex_bytes, genes_regex, threshold, features is not None)
+            for article_pmcid in article_pmcids
+        ]
+
+    # Otherwise, prepare articles as arguments for mapping
+    else:
+        function = format_get_relevant_lines_dict_item
+        args = []
+        with stage('article_read', batch_id=batch_id) as event:
+            for article_pmcid in article_pmcids:
+                with open(f'{paths['data']['articles']['texts']}/{article_pmcid}.txt', errors='ignore') as file:
+                    args.append((article_pmcid, file.readlines(), genes_regex, threshold, features is not None))
+                    event['items'] += 1
+                    event['bytes'] += file.buffer.tell()
+
+    # Get relevant lines from articles
+    with stage('extraction', batch_id=batch_id, max_processes=max_processes) as event:
+        if genes_regex_bytes is not None:
+            event['source'] = 'mmap'
+        with Pool(max_processes) as pool:
+            results = pool.starmap(function, args)
+        articles = {article_pmcid: article_relevant for article_pmcid, article_relevant, _, _ in results}
+        event['items'] = len(articles)
+        event['bytes'] = sum(len(article_relevant) for article_relevant in articles.values())
+        if histogram:
+            event['timings'] = summarize_timings([duration for _, _, duration, _ in results])
+    if features is not None:
+        features.update({article_pmcid: article_features for article_pmcid, _, _, article_features in results})
+    return articles
+
+
+def get_indexed_articles_relevant_lines(
+    batch_id: str,
+    article_pmcids: list[str],
+    threshold: int,
+    max_processes: int,
+    features: dict[str, 'np.ndarray'] | None = None
+) -> dict[str, str]:
+    """
+    Get relevant lines from articles using the gene mention index. Articles not yet indexed with the current gene
+    vocabulary are indexed first.
+    :param batch_id: A unique identifier for the batch being created.
+    :param article_pmcids: A list of PMCIDs of all articles to include.
+    :param threshold: The minimum number of unique gene symbols a line must have to be returned.
+    :param max_processes: The maximum number of processes in a pool.
+    :param features: A dictionary to fill with the triage features of each article, or None to skip triage.
+    :return: A dictionary mapping PMCIDs to strings with all relevant lines from each article.
+    """
+
+    # Index articles that have not been indexed with the current gene vocabulary yet
+    vocabulary = load_gene_vocabulary()
+    con = connect_wal(db)
+    article_pmcids_unindexed = get_unindexed_pmcids(article_pmcids, vocabulary['fingerprint'], con)
+    print(f"Articles to Index: {len(article_pmcids_unindexed)}")
+    if len(article_pmcids_unindexed) > 0:
+        index_gene_mentions(
+            article_pmcids_unindexed,
+            vocabulary['genes_regex'],
+            vocabulary['genes_ensembl_ids'],
+            vocabulary['fingerprint'],
+            max_processes,
+            con,
+        )
+
+    # Get relevant lines from the index
+    with stage('extraction', batch_id=batch_id, source='index') as event:
+        articles = {
+            article_pmcid: ''.join(get_indexed_relevant_lines(article_pmcid, threshold, con))
+            for article_pmcid in article_pmcids
+        }
+        event['items'] = len(articles)
+        event['bytes'] = sum(len(article_relevant) for article_relevant in articles.values())
+
+    # Get triage features from the index as well
+    if features is not None:
+        from utils.triage import get_indexed_line_gene_counts, get_triage_features
+        features.update({
+            article_pmcid: get_triage_features(
+                get_indexed_line_gene_counts(article_pmcid, con), articles[article_pmcid], threshold
+            )
+            for article_pmcid in article_pmcids
+        })
+    con.close()
+    return articles
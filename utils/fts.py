@@ -0,0 +1,141 @@
+from multiprocessing import Pool
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.instrument import stage
+from utils.run import get_relevant_lines
+from utils.sql import get_query
+
+paths = get_paths()
+articles_texts = paths['data']['articles']['texts']
+
+
+def create_article_text_table(con: sqlite3.Connection) -> None:
+    """
+    Create the full-text search table if it does not exist. The table is kept out of the main schema since it requires
+    SQLite to be built with FTS5.
+    :param con: A connection to the SQLite database.
+    """
+
+    # Run the optional schema
+    with open(paths['db']['schema_fts']) as file:
+        con.executescript(file.read())
+
+
+def read_article_text(article_pmcid: str, source: str, genes_regex: str | None) -> tuple[str, str]:
+    """
+    Read the text of an article to be indexed for full-text search.
+    :param article_pmcid: The article's PMCID.
+    :param source: Either 'texts' for all lines before the references or 'relevant' for only relevant lines.
+    :param genes_regex: A regular expression that matches gene symbols, which is only used for relevant lines.
+    :return: A tuple containing the article's PMCID and its text.
+    """
+
+    # Read the article
+    with open(f'{articles_texts}/{article_pmcid}.txt', errors='ignore') as file:
+        article_lines = file.readlines()
+
+    # Keep either relevant lines or everything before the references
+    if source == 'relevant':
+        return article_pmcid, ''.join(get_relevant_lines(article_lines, genes_regex, 2))
+    if '==== Refs\n' in article_lines:
+        article_lines = article_lines[:article_lines.index('==== Refs\n')]
+    return article_pmcid, ''.join(article_lines)
+
+
+def read_article_text_args(args: tuple[str, str, str | None]) -> tuple[str, str]:
+    """
+    A wrapper for read_article_text taking its arguments as one tuple, for mapping over articles with imap_unordered.
+    :param args: A tuple containing the arguments of read_article_text.
+    :return: A tuple containing the article's PMCID and its text.
+    """
+
+    # Unpack the arguments
+    return read_article_text(*args)
+
+
+def get_missing_text_pmcids(article_pmcids: list[str], source: str, con: sqlite3.Connection) -> list[str]:
+    """
+    Get the PMCIDs of articles whose text from a source has not yet been indexed for full-text search.
+    :param article_pmcids: A list of PMCIDs.
+    :param source: Either 'texts' or 'relevant'.
+    :param con: A connection to the SQLite database.
+    :return: A list of PMCIDs of articles not found in the full-text search table.
+    """
+
+    # Compare against all indexed articles
+    indexed = {
+        row[0] for row in con.execute('SELECT article_pmcid FROM ArticleText WHERE source = ?', (source,))
+    }
+    return [article_pmcid for article_pmcid in article_pmcids if article_pmcid not in indexed]
+
+
+def insert_article_texts(
+    article_pmcids: list[str],
+    source: str,
+    genes_regex: str | None,
+    max_processes: int,
+    replace: bool,
+    con: sqlite3.Connection
+) -> None:
+    """
+    Read articles and save their text in the full-text search table.
+    :param article_pmcids: A list of PMCIDs of all articles to index.
+    :param source: Either 'texts' for all lines before the references or 'relevant' for only relevant lines.
+    :param genes_regex: A regular expression that matches gene symbols, which is only used for relevant lines.
+    :param max_processes: The maximum number of processes in a pool.
+    :param replace: Whether to replace existing text of the articles from the same source. Otherwise, the articles must
+    not have been indexed from the source yet, as returned by get_missing_text_pmcids.
+    :param con: A connection to the SQLite database.
+    """
+
+    # Look up the rows to replace in one scan, since the PMCID and source columns are not indexed and filtering on them
+    # would scan the whole table for every article
+    rowids = {}
+    if replace:
+        article_pmcids_set = set(article_pmcids)
+        for rowid, article_pmcid in con.execute(
+            'SELECT rowid, article_pmcid FROM ArticleText WHERE source = ?', (source,)
+        ):
+            if article_pmcid in article_pmcids_set:
+                rowids.setdefault(article_pmcid, []).append(rowid)
+
+    # Read articles in parallel and insert each one as soon as it has been read, so that only the texts of articles in
+    # flight are held in memory
+    with (
+        stage('db_insert', table='ArticleText', source=source, max_processes=max_processes) as event,
+        Pool(max_processes) as pool,
+        con,
+    ):
+        args = ((article_pmcid, source, genes_regex) for article_pmcid in article_pmcids)
+        for article_pmcid, text in pool.imap_unordered(read_article_text_args, args, chunksize=16):
+            con.executemany(
+                'DELETE FROM ArticleText WHERE rowid = ?', [(rowid,) for rowid in rowids.get(article_pmcid, [])]
+            )
+            con.execute('INSERT INTO ArticleText VALUES (?, ?, ?)', (article_pmcid, source, text))
+            event['items'] += 1
+            event['bytes'] += len(text)
+
+
+def search_article_texts(
+    query: str,
+    source: str | None,
+    limit: int,
+    con: sqlite3.Connection
+) -> list[tuple[str, str, str | None, float, str]]:
+    """
+    Search articles with a full-text query, ranking them by BM25.
+    :param query: A query in FTS5 syntax, such as '"prognostic signature" AND TP53' or 'NEAR(prognostic TP53, 10)'.
+    :param source: Either 'texts' or 'relevant' to only search text from that source, or None to search both.
+    :param limit: The maximum number of articles to return.
+    :param con: A connection to the SQLite database.
+    :return: A list of tuples containing the PMCID, source, title, rank (lower is better), and a snippet of each
+    matching article, from best to worst.
+    """
+
+    # Run the ranked query
+    return con.execute(get_query('article_texts'), {'query': query, 'source': source, 'limit': limit}).fetchall()
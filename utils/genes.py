@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+from typing import TYPE_CHECKING
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.instrument import stage
+from utils.regex import create_genes_regex, create_genes_regex_bytes
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+paths = get_paths()
+genes_info = paths['data']['genes']['info']
+genes_vocabulary = paths['data']['genes']['vocabulary']
+
+# Incremented whenever the contents of the gene vocabulary change so that older files are rebuilt
+vocabulary_format = 3
+
+
+def get_genes_ensembl_ids(data: 'pd.DataFrame') -> dict[str, list[str]]:
+    """
+    Map each gene name and synonym to the Ensembl IDs of all genes with that name or synonym. Ensembl IDs of genes with
+    the symbol as their name come first.
+    :param data: Gene information read from the genes info file.
+    :return: A dictionary mapping gene symbols to lists of Ensembl IDs.
+    """
+
+    # Collect Ensembl IDs for gene names and synonyms
+    genes_ensembl_ids = {}
+    for column in ['external_gene_name', 'external_synonym']:
+        pairs = data[[column, 'ensembl_gene_id']].dropna().drop_duplicates()
+        for gene, ensembl_id in zip(pairs[column], pairs['ensembl_gene_id']):
+            if ensembl_id not in genes_ensembl_ids.setdefault(gene, []):
+                genes_ensembl_ids[gene].append(ensembl_id)
+    return genes_ensembl_ids
+
+
+def hash_file(path: str) -> str:
+    """
+    Hash the contents of a file.
+    :param path: The path to the file.
+    :return: A hexadecimal SHA-256 hash of the file.
+    """
+
+    # Hash the file in chunks
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(2 ** 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_vocabulary_fingerprint(genes_regex: str, genes_ensembl_ids: dict[str, list[str]]) -> str:
+    """
+    Hash the parts of the gene vocabulary that determine which gene mentions are found in an article, so that indexes
+    built with a different vocabulary can be recognized.
+    :param genes_regex: A regular expression that matches gene symbols.
+    :param genes_ensembl_ids: A dictionary mapping gene symbols to lists of Ensembl IDs.
+    :return: A hexadecimal SHA-256 hash of the vocabulary.
+    """
+
+    # Hash the regex and the Ensembl IDs of each gene symbol in a fixed order
+    vocabulary_hash = hashlib.sha256(genes_regex.encode())
+    vocabulary_hash.update(json.dumps(genes_ensembl_ids, sort_keys=True).encode())
+    return vocabulary_hash.hexdigest()
+
+
+def build_gene_vocabulary() -> dict:
+    """
+    Build the gene vocabulary from the genes info file and save it.
+    :return: A dictionary containing the gene symbols ('genes'), a dictionary mapping gene symbols to lists of Ensembl
+    IDs ('genes_ensembl_ids'), a regular expression that matches gene symbols ('genes_regex') and its counterpart for
+    bytes ('genes_regex_bytes'), a fingerprint of the vocabulary ('fingerprint'), and information identifying the
+    version of the genes info file it was built from.
+    """
+
+    # Import NumPy and pandas only when building the vocabulary so that loading it stays fast
+    import numpy as np
+    import pandas as pd
+
+    # Read gene information
+    with stage('csv_load', table='Gene') as event:
+        source_stat = os.stat(genes_info)
+        data = pd.read_csv(genes_info, sep='\t', dtype=object)
+        event['items'] = data.shape[0]
+        event['bytes'] = source_stat.st_size
+
+    # Collect gene symbols and create a regex for detecting them
+    with stage('regex_build') as event:
+        genes = np.concatenate([
+            data['external_gene_name'].dropna().unique(),
+            data['external_synonym'].dropna().unique()
+        ], axis=0).tolist()
+        vocabulary = {
+            'format': vocabulary_format,
+            'source_hash': hash_file(genes_info),
+            'source_size': source_stat.st_size,
+            'source_mtime': source_stat.st_mtime_ns,
+            'genes': genes,
+            'genes_ensembl_ids': get_genes_ensembl_ids(data),
+            'genes_regex': create_genes_regex(genes),
+            'genes_regex_bytes': create_genes_regex_bytes(genes),
+        }
+        vocabulary['fingerprint'] = get_vocabulary_fingerprint(
+            vocabulary['genes_regex'], vocabulary['genes_ensembl_ids']
+        )
+        event['items'] = len(genes)
+        event['bytes'] = len(vocabulary['genes_regex'])
+
+    # Save the vocabulary
+    save_gene_vocabulary(vocabulary)
+    return vocabulary
+
+
+def save_gene_vocabulary(vocabulary: dict) -> None:
+    """
+    Save the gene vocabulary, replacing any older version at once.
+    :param vocabulary: The gene vocabulary as returned by build_gene_vocabulary.
+    """
+
+    # Write to a temporary file first so that readers never see a partially written vocabulary
+    with open(f'{genes_vocabulary}.{os.getpid()}.tmp', 'wb') as file:
+        pickle.dump(vocabulary, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{genes_vocabulary}.{os.getpid()}.tmp', genes_vocabulary)
+
+
+def load_gene_vocabulary() -> dict:
+    """
+    Load the saved gene vocabulary, rebuilding it if the genes info file has changed since it was built.
+    :return: The gene vocabulary as returned by build_gene_vocabulary.
+    """
+
+    # Read the saved vocabulary
+    try:
+        with stage('vocabulary_load') as event, open(genes_vocabulary, 'rb') as file:
+            vocabulary = pickle.load(file)
+            event['bytes'] = file.tell()
+    except FileNotFoundError as exception:
+        print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
+        print("Building the gene vocabulary.", file=sys.stderr)
+        return build_gene_vocabulary()
+
+    # Use the vocabulary if the genes info file is unchanged, only hashing the file if its size or time differ
+    source_stat = os.stat(genes_info)
+    if vocabulary.get('format') == vocabulary_format:
+        if (vocabulary['source_size'], vocabulary['source_mtime']) == (source_stat.st_size, source_stat.st_mtime_ns):
+            return vocabulary
+        if vocabulary['source_hash'] == hash_file(genes_info):
+            vocabulary['source_size'], vocabulary['source_mtime'] = source_stat.st_size, source_stat.st_mtime_ns
+            save_gene_vocabulary(vocabulary)
+            return vocabulary
+
+    # Rebuild the vocabulary otherwise
+    print("The genes info file has changed. Rebuilding the gene vocabulary.", file=sys.stderr)
+    return build_gene_vocabulary()
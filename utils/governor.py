@@ -0,0 +1,248 @@
+from collections import deque
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Mapping
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_settings
+
+
+def parse_duration(duration: str | None) -> float | None:
+    """
+    Parse a duration from a rate limit header, such as '1s', '6m0s', or '20ms'.
+    :param duration: The duration as given in the header.
+    :return: The duration in seconds or None if it could not be parsed.
+    """
+
+    # Add up each unit
+    if duration is None:
+        return None
+    parts = re.findall(r'([0-9]+(?:\.[0-9]+)?)(ms|h|m|s)', duration)
+    if len(parts) == 0:
+        return None
+    scales = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(value) * scales[unit] for value, unit in parts)
+
+
+def get_retry_after(headers: Mapping[str, str]) -> float | None:
+    """
+    Get how long a server asked to wait before retrying.
+    :param headers: The response headers.
+    :return: The delay in seconds or None if the server did not specify one.
+    """
+
+    # Prefer the more precise header sent by OpenAI
+    for header, scale in [('retry-after-ms', 0.001), ('retry-after', 1)]:
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+class RateLimitGovernor:
+    """
+    Pace API requests to stay within requests-per-minute and tokens-per-minute limits. Limits and remaining quotas are
+    updated from x-ratelimit-* response headers, throttled requests pause dispatch for the time given by Retry-After,
+    and the number of concurrent requests grows additively after successes and halves after throttling. A governor may
+    be shared by any number of threads.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        max_attempts: int = 6,
+        window: float = 60
+    ) -> None:
+        """
+        :param requests_per_minute: The initial limit on requests, which is replaced by limits reported by the server.
+        :param tokens_per_minute: The initial limit on tokens, which is replaced by limits reported by the server.
+        :param max_concurrency: The maximum number of requests in flight at once.
+        :param max_attempts: The maximum number of times to send a request that is throttled or fails with a server
+        error.
+        :param window: The length of the rate limit window in seconds.
+        """
+
+        # Limits
+        self.limits = {'requests': requests_per_minute, 'tokens': tokens_per_minute}
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.window = window
+
+        # Requests sent in the current window as (time, tokens) pairs
+        self.sent = deque()
+        self.sent_tokens = 0
+
+        # Quotas reported by the server, which are unknown until the first response
+        self.remaining = {'requests': None, 'tokens': None}
+        self.reset_at = {'requests': 0.0, 'tokens': 0.0}
+
+        # Dispatch state
+        self.concurrency = float(max(1, max_concurrency // 2))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.consecutive_errors = 0
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0}
+        self.condition = threading.Condition()
+
+    def get_wait(self, tokens: int, now: float) -> float:
+        """
+        Get how long to wait before a request can be sent. Must be called while holding the condition.
+        :param tokens: The number of tokens the request counts against the limit.
+        :param now: The current time.
+        :return: The number of seconds to wait, which is infinite if the request must wait for another to finish.
+        """
+
+        # Forget requests outside the window
+        while len(self.sent) > 0 and self.sent[0][0] <= now - self.window:
+            self.sent_tokens -= self.sent.popleft()[1]
+
+        # Wait for a request to finish if too many are in flight
+        if self.in_flight >= int(self.concurrency):
+            return math.inf
+
+        # Wait out pauses after throttling
+        waits = [self.paused_until - now]
+
+        # Wait for old requests to leave the window if the limits would be exceeded
+        if len(self.sent) >= self.limits['requests']:
+            waits.append(self.sent[0][0] + self.window - now)
+        if len(self.sent) > 0 and self.sent_tokens + tokens > self.limits['tokens']:
+            waits.append(self.sent[0][0] + self.window - now)
+
+        # Wait for the server's quotas to reset if they have run out
+        if self.remaining['requests'] is not None and self.remaining['requests'] < 1:
+            waits.append(self.reset_at['requests'] - now)
+        if self.remaining['tokens'] is not None and self.remaining['tokens'] < tokens:
+            waits.append(self.reset_at['tokens'] - now)
+        return max(waits)
+
+    def acquire(self, tokens: int) -> None:
+        """
+        Block until a request may be sent and record it as in flight.
+        :param tokens: The number of tokens the request counts against the limit.
+        """
+
+        # Wait until nothing prevents sending the request
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                wait = self.get_wait(tokens, now)
+                if wait <= 0:
+                    break
+                self.condition.wait(None if math.isinf(wait) else wait)
+
+            # Record the request
+            self.sent.append((now, tokens))
+            self.sent_tokens += tokens
+            self.in_flight += 1
+            self.stats['requests'] += 1
+            for kind, amount in [('requests', 1), ('tokens', tokens)]:
+                if self.remaining[kind] is not None:
+                    self.remaining[kind] -= amount
+
+    def release(self, headers: Mapping[str, str], status_code: int | None, feedback: bool = True) -> None:
+        """
+        Record the response to a request and adjust limits, pauses, and concurrency accordingly.
+        :param headers: The response headers.
+        :param status_code: The HTTP status code or None if no response was received.
+        :param feedback: Whether the outcome of the request says anything about the limits. If not, such as when the
+        request raised an unexpected exception, the request is only no longer counted as in flight.
+        """
+
+        # Return the request's slot
+        with self.condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            if not feedback:
+                self.condition.notify_all()
+                return
+
+            # Update limits and quotas from headers
+            for kind in ['requests', 'tokens']:
+                try:
+                    self.limits[kind] = int(headers[f'x-ratelimit-limit-{kind}'])
+                    self.remaining[kind] = int(headers[f'x-ratelimit-remaining-{kind}'])
+                except (KeyError, TypeError, ValueError):
+                    pass
+                reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                if reset is not None:
+                    self.reset_at[kind] = now + reset
+
+            # Grow concurrency slowly after successes
+            if status_code is not None and status_code < 400:
+                self.consecutive_errors = 0
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+            # Pause and back off after throttling or server errors
+            elif status_code == 429 or status_code is None or status_code >= 500:
+                self.consecutive_errors += 1
+                self.stats['throttled' if status_code == 429 else 'errors'] += 1
+                if status_code == 429:
+                    self.concurrency = max(1.0, self.concurrency / 2)
+                delay = get_retry_after(headers)
+                if delay is None:
+                    delay = min(60, 2 ** self.consecutive_errors) * random.uniform(0.5, 1)
+                self.paused_until = max(self.paused_until, now + delay)
+            self.condition.notify_all()
+
+    def call(self, request: Callable[[], Any], tokens: int) -> Any:
+        """
+        Send a request through the governor, retrying it if it is throttled or fails with a server or connection error.
+        :param request: A function sending the request with the OpenAI client's with_raw_response and returning the
+        raw response.
+        :param tokens: The number of tokens the request counts against the limit.
+        :return: The parsed response.
+        """
+
+        # Import the package only when sending requests
+        from openai import APIConnectionError, APIStatusError
+
+        # Send the request until it succeeds or runs out of attempts, always returning its slot even if the request
+        # raises an unexpected exception
+        for attempt in range(1, self.max_attempts + 1):
+            self.acquire(tokens)
+            headers, status_code, feedback = {}, None, False
+            try:
+                response = request()
+                headers, status_code, feedback = response.headers, response.status_code, True
+            except APIStatusError as exception:
+                headers, status_code, feedback = exception.response.headers, exception.status_code, True
+                retryable = exception.status_code == 429 or exception.status_code >= 500
+                if not retryable or attempt == self.max_attempts:
+                    raise
+                print(f"{type(exception).__name__}: {exception.status_code}, retrying", file=sys.stderr)
+            except APIConnectionError as exception:
+                headers, status_code, feedback = {}, None, True
+                if attempt == self.max_attempts:
+                    raise
+                print(f"{type(exception).__name__}: {exception}, retrying", file=sys.stderr)
+            else:
+                return response.parse()
+            finally:
+                self.release(headers, status_code, feedback)
+
+
+def get_governor(max_concurrency: int) -> RateLimitGovernor:
+    """
+    Create a governor with the initial rate limits in the settings, which default to those of gpt-4.1-nano at usage
+    tier 1 until the server reports its own limits.
+    :param max_concurrency: The maximum number of requests in flight at once.
+    :return: The governor.
+    """
+
+    # Read optional limits from the settings
+    settings = get_settings()
+    return RateLimitGovernor(
+        settings.get('requests_per_minute', 500),
+        settings.get('tokens_per_minute', 200000),
+        max_concurrency,
+    )
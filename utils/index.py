@@ -0,0 +1,135 @@
+from multiprocessing import Pool
+import os
+import re
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.instrument import stage
+from utils.sql import get_query
+
+paths = get_paths()
+articles_texts = paths['data']['articles']['texts']
+
+
+def find_gene_mentions(article_lines: list[str], genes_regex: str) -> tuple[int, list[tuple[int, str]]]:
+    """
+    Find all unique gene symbols on each line of an article (excluding references). Lines are matched in the same way as
+    in get_relevant_lines.
+    :param article_lines: A list of lines in the article.
+    :param genes_regex: A regular expression that matches gene symbols.
+    :return: A tuple containing the number of lines before the references and a list of line numbers paired with each
+    gene symbol found on the line.
+    """
+
+    # Search each line for gene symbols
+    mentions = []
+    n_lines = 0
+    for line in article_lines:
+        if line == '==== Refs\n':
+            break
+        for gene in set(re.findall(genes_regex, line)):
+            mentions.append((n_lines, gene))
+        n_lines += 1
+    return n_lines, mentions
+
+
+def format_find_gene_mentions(article_pmcid: str, genes_regex: str) -> tuple[str, int, list[tuple[int, str]]]:
+    """
+    A wrapper for find_gene_mentions that reads an article from its file.
+    :param article_pmcid: The article's PMCID.
+    :param genes_regex: A regular expression that matches gene symbols.
+    :return: A tuple containing the article's PMCID, the number of lines before the references, and a list of line
+    numbers paired with each gene symbol found on the line.
+    """
+
+    # Read the article and find gene mentions
+    with open(f'{articles_texts}/{article_pmcid}.txt', errors='ignore') as file:
+        return article_pmcid, *find_gene_mentions(file.readlines(), genes_regex)
+
+
+def get_unindexed_pmcids(
+    article_pmcids: list[str],
+    vocabulary_fingerprint: str,
+    con: sqlite3.Connection
+) -> list[str]:
+    """
+    Get the PMCIDs of articles that have not yet been indexed with the current gene vocabulary. Articles indexed with
+    an older vocabulary are stale and count as unindexed.
+    :param article_pmcids: A list of PMCIDs.
+    :param vocabulary_fingerprint: The fingerprint of the current gene vocabulary.
+    :param con: A connection to the SQLite database.
+    :return: A list of PMCIDs of articles not found in the index or indexed with another vocabulary.
+    """
+
+    # Compare against all articles indexed with the same vocabulary
+    indexed = {
+        row[0] for row in con.execute(
+            'SELECT article_pmcid FROM IndexedArticle WHERE vocabulary = ?', (vocabulary_fingerprint,)
+        )
+    }
+    return [article_pmcid for article_pmcid in article_pmcids if article_pmcid not in indexed]
+
+
+def index_gene_mentions(
+    article_pmcids: list[str],
+    genes_regex: str,
+    genes_ensembl_ids: dict[str, list[str]],
+    vocabulary_fingerprint: str,
+    max_processes: int,
+    con: sqlite3.Connection
+) -> None:
+    """
+    Find gene mentions in articles and save them in the SQLite database, replacing existing mentions for the articles.
+    :param article_pmcids: A list of PMCIDs of all articles to index.
+    :param genes_regex: A regular expression that matches gene symbols.
+    :param genes_ensembl_ids: A dictionary mapping gene symbols to lists of Ensembl IDs.
+    :param vocabulary_fingerprint: The fingerprint of the gene vocabulary, which is saved with each article.
+    :param max_processes: The maximum number of processes in a pool.
+    :param con: A connection to the SQLite database.
+    """
+
+    # Search articles for gene mentions
+    with stage('indexing', max_processes=max_processes) as event, Pool(max_processes) as pool:
+        results = pool.starmap(format_find_gene_mentions, [
+            (article_pmcid, genes_regex) for article_pmcid in article_pmcids
+        ])
+        event['items'] = len(results)
+
+    # Replace existing mentions
+    with stage('db_insert', table='GeneMention') as event, con:
+        for article_pmcid, n_lines, mentions in results:
+            con.execute('DELETE FROM GeneMention WHERE article_pmcid = ?', (article_pmcid,))
+            con.execute('INSERT OR REPLACE INTO IndexedArticle VALUES (?, ?, ?)', (
+                article_pmcid, n_lines, vocabulary_fingerprint
+            ))
+            con.executemany('INSERT INTO GeneMention VALUES (?, ?, ?, ?)', [
+                (article_pmcid, line_number, gene, ensembl_id)
+                for line_number, gene in mentions for ensembl_id in genes_ensembl_ids[gene]
+            ])
+            event['items'] += len(mentions)
+
+
+def get_indexed_relevant_lines(article_pmcid: str, threshold: int, con: sqlite3.Connection) -> list[str]:
+    """
+    Get all relevant lines in an article using the index instead of searching the article with a regular expression.
+    The result is the same as get_relevant_lines with the regular expression used for indexing.
+    :param article_pmcid: The article's PMCID.
+    :param threshold: The minimum number of unique gene symbols a line must have to be returned.
+    :param con: A connection to the SQLite database.
+    :return: A list of lines with at least the minimum number of unique gene symbols.
+    """
+
+    # Find the numbers of relevant lines
+    line_numbers = [
+        row[0] for row in con.execute(get_query('relevant_lines'), {'pmcid': article_pmcid, 'threshold': threshold})
+    ]
+    if len(line_numbers) == 0:
+        return []
+
+    # Read only the relevant lines from the article
+    with open(f'{articles_texts}/{article_pmcid}.txt', errors='ignore') as file:
+        article_lines = file.readlines()
+    return [article_lines[line_number] for line_number in line_numbers]
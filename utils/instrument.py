@@ -0,0 +1,184 @@
+import cProfile
+from contextlib import contextmanager
+import json
+import math
+import os
+import resource
+import sys
+import time
+from typing import Iterator
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+
+paths = get_paths()
+
+# The profiler used for every stage in this process (None, 'cprofile', or 'pyinstrument')
+profiler = None
+
+
+def set_profiler(profiler_name: str | None) -> None:
+    """
+    Choose a profiler to run during every stage of the current process.
+    :param profiler_name: Either 'cprofile', 'pyinstrument', or None to disable profiling.
+    """
+
+    # Store the profiler for later stages
+    global profiler
+    profiler = profiler_name
+
+
+def get_peak_memory() -> int:
+    """
+    Get the peak resident set size of the current process and its children so far.
+    :return: The peak memory usage in bytes.
+    """
+
+    # Maximum resident set size is given in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(peak_self, peak_children) * scale
+
+
+def summarize_timings(durations: list[float]) -> dict:
+    """
+    Summarize a list of durations with percentiles and a histogram with power-of-two millisecond buckets.
+    :param durations: A list of durations in seconds.
+    :return: A dictionary containing the summary.
+    """
+
+    # Nothing to summarize
+    if len(durations) == 0:
+        return {'count': 0}
+
+    # Percentiles
+    durations = sorted(durations)
+    summary = {
+        'count': len(durations),
+        'total': sum(durations),
+        'p50': durations[int(0.5 * (len(durations) - 1))],
+        'p90': durations[int(0.9 * (len(durations) - 1))],
+        'p99': durations[int(0.99 * (len(durations) - 1))],
+        'max': durations[-1],
+    }
+
+    # Count durations falling at or below each power of two milliseconds
+    histogram = {}
+    for duration in durations:
+        bucket = 2 ** max(0, math.ceil(math.log2(max(duration * 1000, 1))))
+        histogram[f'<={bucket}ms'] = histogram.get(f'<={bucket}ms', 0) + 1
+    summary['histogram'] = histogram
+    return summary
+
+
+def log_event(event: dict) -> None:
+    """
+    Append an event to the stage log as a single JSON line.
+    :param event: The event to log.
+    """
+
+    # Write the event
+    os.makedirs(os.path.dirname(paths['logs']['stages']), exist_ok=True)
+    with open(paths['logs']['stages'], 'a') as log:
+        json.dump(event, log)
+        log.write('\n')
+
+
+def start_profiler() -> object | None:
+    """
+    Start the profiler chosen with set_profiler if any.
+    :return: The running profiler or None if profiling is disabled or unavailable.
+    """
+
+    # Profiling is disabled
+    if profiler is None:
+        return None
+
+    # Use cProfile from the standard library
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    # Use pyinstrument if it is installed
+    try:
+        from pyinstrument import Profiler
+    except ImportError as exception:
+        print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
+        print("Skipping profiling.", file=sys.stderr)
+        return None
+    profile = Profiler()
+    profile.start()
+    return profile
+
+
+def stop_profiler(profile: object | None, stage_name: str) -> str | None:
+    """
+    Stop a running profiler and save its results.
+    :param profile: The profiler returned by start_profiler.
+    :param stage_name: The name of the stage that was profiled.
+    :return: The path to the saved results or None if nothing was profiled.
+    """
+
+    # Nothing was profiled
+    if profile is None:
+        return None
+
+    # Save the results of the profiler
+    profile_path = paths['logs']['profiles'].format(
+        script=os.path.splitext(os.path.basename(sys.argv[0]))[0],
+        stage=stage_name,
+        timestamp=time.strftime('%Y%m%d%H%M%S'),
+        extension='prof' if profiler == 'cprofile' else 'html',
+    )
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    if profiler == 'cprofile':
+        profile.disable()
+        profile.dump_stats(profile_path)
+    else:
+        profile.stop()
+        with open(profile_path, 'w') as file:
+            file.write(profile.output_html())
+    return profile_path
+
+
+@contextmanager
+def stage(stage_name: str, **fields) -> Iterator[dict]:
+    """
+    Measure a stage of the pipeline and log its duration, counts, and peak memory usage once it finishes. The caller may
+    update the 'items' and 'bytes' counts or add other fields to the yielded event.
+    :param stage_name: The name of the stage.
+    :param fields: Additional fields to include in the logged event.
+    :return: The event to be logged.
+    """
+
+    # Initialize the event
+    event = {
+        'script': os.path.basename(sys.argv[0]),
+        'pid': os.getpid(),
+        'stage': stage_name,
+        **fields,
+        'items': 0,
+        'bytes': 0,
+    }
+
+    # Run the stage
+    profile = start_profiler()
+    start_time = time.perf_counter()
+    try:
+        yield event
+    except BaseException as exception:
+        event['error'] = f"{type(exception).__name__}: {exception}"
+        raise
+
+    # Log the event even if the stage failed
+    finally:
+        event['duration'] = time.perf_counter() - start_time
+        event['peak_memory'] = get_peak_memory()
+        event['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        profile_path = stop_profiler(profile, stage_name)
+        if profile_path is not None:
+            event['profile'] = profile_path
+        log_event(event)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+
+paths = get_paths()
+
+# The most articles in one request, which keeps the completion token limit of a packed request, scaled by its number of
+# articles, within the model's output limit
+max_pack_size = 8
+
+
+def format_packed_article(article_pmcid: str, article_relevant: str) -> str:
+    """
+    Delimit an article's relevant lines by its PMCID for including it in a packed request.
+    :param article_pmcid: The article's PMCID.
+    :param article_relevant: A string with all relevant lines from the article.
+    :return: The delimited relevant lines.
+    """
+
+    # Start the article with a line identifying it as described in the packed prompt
+    article_relevant = article_relevant.rstrip('\n')
+    return f"==== PMCID: {article_pmcid} ====\n{article_relevant}\n"
+
+
+def get_pack_id(article_pmcids: list[str]) -> str:
+    """
+    Get a custom ID for a packed request that is unique to its articles, so that IDs of packs created separately (e.g.
+    in different shards) never collide and can never be mistaken for PMCIDs.
+    :param article_pmcids: The PMCIDs of the articles in the pack.
+    :return: The custom ID.
+    """
+
+    # Hash the PMCIDs in order
+    return f"pack-{hashlib.sha256(' '.join(article_pmcids).encode()).hexdigest()[:16]}"
+
+
+def pack_articles(articles_tokens: dict[str, int], budget: int) -> dict[str, dict[str, int]]:
+    """
+    Group articles into packs of at most max_pack_size articles whose delimited relevant lines fit within a token
+    budget. Articles that fit in no pack with another article are left out and sent in their own requests.
+    :param articles_tokens: A dictionary mapping PMCIDs to the number of tokens in each article's delimited relevant
+    lines.
+    :param budget: The maximum number of tokens of relevant lines in each pack.
+    :return: A dictionary mapping the custom ID of each pack to a dictionary mapping the PMCIDs of its articles to their
+    numbers of tokens, in the order they appear in the request.
+    """
+
+    # Start each pack with the largest remaining article and fill it with the smallest ones that still fit
+    articles_tokens = sorted(articles_tokens.items(), key=lambda item: item[1], reverse=True)
+    packs = []
+    start, stop = 0, len(articles_tokens)
+    while start < stop:
+        pack = dict([articles_tokens[start]])
+        start += 1
+        while (
+            start < stop and len(pack) < max_pack_size
+            and sum(pack.values()) + articles_tokens[stop - 1][1] <= budget
+        ):
+            stop -= 1
+            pack.update([articles_tokens[stop]])
+        packs.append(pack)
+
+    # Packs of one article gain nothing
+    return {get_pack_id(list(pack)): pack for pack in packs if len(pack) > 1}
+
+
+def save_packs(batch_id: str, packs: dict[str, dict[str, int]] | None) -> None:
+    """
+    Save the articles in each pack of a batch for unpacking its output, or remove them if the batch is not packed.
+    :param batch_id: A unique identifier for the batch.
+    :param packs: The packs as returned by pack_articles or None if the batch is not packed.
+    """
+
+    # Never leave packs from an earlier version of the batch
+    if packs is None:
+        try:
+            os.remove(paths['batch']['packs'].format(batch_id=batch_id))
+        except FileNotFoundError:
+            pass
+        return
+    with open(paths['batch']['packs'].format(batch_id=batch_id), 'w') as file:
+        json.dump(packs, file, indent=4)
+
+
+def load_packs(batch_id: str) -> dict[str, dict[str, int]]:
+    """
+    Load the articles in each pack of a batch.
+    :param batch_id: A unique identifier for the batch.
+    :return: The packs as returned by pack_articles, which is empty if the batch is not packed.
+    """
+
+    # Batches created without packing have no packs file
+    try:
+        with open(paths['batch']['packs'].format(batch_id=batch_id)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def apportion(total: int, weights: list[int]) -> list[int]:
+    """
+    Split a whole number in proportion to weights so that the parts are whole numbers adding up to the total.
+    :param total: The number to split.
+    :param weights: A weight for each part.
+    :return: A list of parts.
+    """
+
+    # Round down, then give what remains to the parts that lost the most by rounding
+    weights = [max(weight, 1) for weight in weights]
+    shares = [total * weight / sum(weights) for weight in weights]
+    parts = [int(share) for share in shares]
+    for i in sorted(range(len(shares)), key=lambda i: parts[i] - shares[i])[:total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+def unpack_request_output(request_output: dict, pack: dict[str, int]) -> list[dict]:
+    """
+    Split the output of a packed request into outputs for each of its articles, formatted as if each article had been
+    sent in its own request. Token usage is apportioned by the size of each article and of its answer, so totals over
+    the batch stay the same.
+    :param request_output: The output of the packed request, as in a batch output file.
+    :param pack: A dictionary mapping the PMCIDs of the articles in the pack to their numbers of tokens.
+    :return: A list of outputs, one for each article in the pack.
+    """
+
+    # Get each article's answer from a successful response
+    response = request_output.get('response') or {}
+    body = response.get('body') or {}
+    answers = {}
+    if request_output.get('error') is None and response.get('status_code', 200) == 200:
+        try:
+            content = json.loads(body['choices'][0]['message']['content'])
+            answers = {
+                article_pmcid: json.dumps(answer)
+                for article_pmcid, answer in content['articles'].items()
+                if article_pmcid in pack
+            }
+        except (json.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError):
+            pass
+
+    # Apportion usage among the articles
+    usage = body.get('usage') or {}
+    prompt_tokens = apportion(usage.get('prompt_tokens', 0), list(pack.values()))
+    completion_tokens = apportion(
+        usage.get('completion_tokens', 0),
+        [len(answers.get(article_pmcid, '')) for article_pmcid in pack],
+    )
+
+    # Format an output for each article
+    requests_output = []
+    for i, article_pmcid in enumerate(pack):
+        article_output = {'custom_id': article_pmcid, 'response': dict(response), 'error': request_output.get('error')}
+        article_body = dict(body)
+        article_body['usage'] = {
+            'prompt_tokens': prompt_tokens[i],
+            'completion_tokens': completion_tokens[i],
+            'total_tokens': prompt_tokens[i] + completion_tokens[i],
+        }
+
+        # Answers missing from a successful response count as failed requests, without the answers for the whole pack
+        if article_pmcid in answers:
+            article_body['choices'] = [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': answers[article_pmcid]},
+                'finish_reason': body['choices'][0].get('finish_reason'),
+            }]
+        else:
+            article_body.pop('choices', None)
+            if article_output['error'] is None and response.get('status_code', 200) == 200:
+                article_output['error'] = {
+                    'message': f"No answer for the article in packed request {request_output['custom_id']}"
+                }
+        article_output['response']['body'] = article_body
+        requests_output.append(article_output)
+    return requests_output
+
+
+def unpack_batch_output(batch_id: str) -> None:
+    """
+    Replace the outputs of packed requests in a batch output file with outputs for each of their articles, so that the
+    file can be read in the same way as that of an unpacked batch. Outputs of requests that were not packed, including
+    those already unpacked, are kept as they are.
+    :param batch_id: A unique identifier for the batch.
+    """
+
+    # Nothing to do for batches without packs
+    packs = load_packs(batch_id)
+    if len(packs) == 0:
+        return
+
+    # Rewrite the batch output with each packed request split into its articles
+    batch_output = paths['batch']['output'].format(batch_id=batch_id)
+    with open(batch_output) as file, open(f'{batch_output}.tmp', 'w') as unpacked_file:
+        for line in file:
+            try:
+                request_output = json.loads(line)
+                custom_id = request_output['custom_id']
+            except (json.JSONDecodeError, KeyError, TypeError):
+                unpacked_file.write(line)
+                continue
+            if custom_id not in packs:
+                unpacked_file.write(line)
+                continue
+            for article_output in unpack_request_output(request_output, packs[custom_id]):
+                json.dump(article_output, unpacked_file)
+                unpacked_file.write('\n')
+    os.replace(f'{batch_output}.tmp', batch_output)
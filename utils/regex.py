@@ -1,9 +1,11 @@
-import numpy as np
-
 import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
-def create_genes_regex(genes: np.ndarray) -> str:
+def create_genes_regex(genes: 'np.ndarray | list[str]') -> str:
     """
     Create a regular expression that matches gene names without matching parts of words that coincidentally contain gene
     names.
@@ -24,6 +26,20 @@ def create_genes_regex(genes: np.ndarray) -> str:
     return r'(?:\A|\W)(' + genes_regex + r')(?:\Z|\W)'
 
 
+def create_genes_regex_bytes(genes: 'np.ndarray | list[str]') -> bytes:
+    """
+    Create a regular expression over UTF-8 bytes that matches gene names without matching parts of words. Any line
+    matched by the regular expression from create_genes_regex has a match for this one, though this one may also match
+    lines that it does not (e.g. gene names next to non-ASCII letters), so matches should be checked with the former.
+    :param genes: An array of gene names and/or synonyms.
+    :return: A regular expression for bytes.
+    """
+
+    # Escape gene names in the same way and only look at the characters beside them without consuming them
+    genes_regex = re.sub(r'[.^$*+?{}\\[\]|()]', r'\\\g<0>', '\t'.join(genes))
+    return rb'(?<!\w)(' + re.sub(r'\t', r'|', genes_regex).encode('utf-8') + rb')(?!\w)'
+
+
 def get_pmcid_from_filename(filename: str) -> str:
     """
     Extract an article's PMCID from its filename.
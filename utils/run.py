@@ -1,16 +1,29 @@
-from openai import OpenAI
-
-import pandas as pd
-
+from functools import cache
 import json
+import os
 import re
+import sys
+from typing import Any, TYPE_CHECKING
+
+sys.path.append(os.getcwd())
+
+from utils.cache import get_request_key, read_cached_response, write_cached_response
+from utils.config import get_paths, get_settings
+from utils.governor import get_governor
+from utils.instrument import stage
+from utils.pack import format_packed_article, unpack_batch_output
 
-with open('paths.json') as file:
-    paths = json.load(file)
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from utils.governor import RateLimitGovernor
 
-with open('settings.json') as file:
-    settings = json.load(file)
-    api_key = settings['api_key']
+paths = get_paths()
+
+# The model every request is sent to
+model = 'gpt-4.1-nano'
+
+# The most tokens the answer for one article may take, which is multiplied by the number of articles in packed requests
+max_completion_tokens = 2048
 
 
 def get_relevant_lines(article_lines: list[str], genes_regex: str, threshold: int) -> list[str]:
@@ -32,13 +45,20 @@ def get_relevant_lines(article_lines: list[str], genes_regex: str, threshold: in
     return article_relevant
 
 
-def write_batch_input(batch_id: str, articles: dict[str, str], prompt: str) -> None:
+def write_batch_input(
+    batch_id: str,
+    articles: dict[str, str],
+    prompt: str,
+    packs: dict[str, dict[str, int]] | None = None
+) -> None:
     """
     Write a JSONL file for use with the OpenAI Batch API.
     :param batch_id: A unique identifier for the batch.
-    :param articles: The filenames of all articles to be included in the batch.
-    :param prompt_number: The number in the prompt filename.
-    :return: The path to the JSONL file.
+    :param articles: A dictionary mapping PMCIDs to strings with all relevant lines from each article.
+    :param prompt: The prompt to use as the developer message.
+    :param packs: Packs of articles to send together in one request, as returned by pack_articles, with the packed
+    prompt appended to the prompt and the completion token limit multiplied by the number of articles. Articles in no
+    pack are sent in their own requests.
     """
 
     # Request input template
@@ -47,23 +67,35 @@ def write_batch_input(batch_id: str, articles: dict[str, str], prompt: str) -> N
         'method': 'POST',
         'url': '/v1/chat/completions',
         'body': {
-            'model': 'gpt-4.1-nano',
+            'model': model,
             'messages': [
                 {'role': 'developer', 'content': ''},
                 {'role': 'user', 'content': ''},
             ],
-            'max_completion_tokens': 2048,
+            'max_completion_tokens': max_completion_tokens,
             'response_format': {'type': 'json_object'},
             'temperature': 0,
         },
     }
 
-    # Set the developer message to the prompt
-    request_input['body']['messages'][0]['content'] = prompt
+    # Load the instructions for answering for several articles at once
+    packs = packs if packs is not None else {}
+    if len(packs) > 0:
+        with open(paths['prompts']['packed']) as file:
+            packed_prompt = prompt.rstrip('\n') + '\n' + file.read()
+    packed_pmcids = {article_pmcid for pack in packs.values() for article_pmcid in pack}
 
     # Write each request to the batch input file
-    with open(paths['batch']['input'].format(batch_id=batch_id), 'w') as batch_file:
+    with (
+        stage('serialization', batch_id=batch_id) as event,
+        open(paths['batch']['input'].format(batch_id=batch_id), 'w') as batch_file,
+    ):
+
+        # Send articles in no pack with the prompt by themselves
+        request_input['body']['messages'][0]['content'] = prompt
         for article_pmcid in articles:
+            if article_pmcid in packed_pmcids:
+                continue
             request_input['custom_id'] = article_pmcid
             article = ''.join(articles[article_pmcid])
             request_input['body']['messages'][1]['content'] = article
@@ -71,36 +103,230 @@ def write_batch_input(batch_id: str, articles: dict[str, str], prompt: str) -> N
             # Serialize the request input
             json.dump(request_input, batch_file)
             batch_file.write('\n')
+            event['items'] += 1
+
+        # Send the articles of each pack together, delimited by their PMCIDs, leaving room for an answer for each
+        for pack_id, pack in packs.items():
+            request_input['custom_id'] = pack_id
+            request_input['body']['max_completion_tokens'] = max_completion_tokens * len(pack)
+            request_input['body']['messages'][0]['content'] = packed_prompt
+            request_input['body']['messages'][1]['content'] = ''.join(
+                format_packed_article(article_pmcid, articles[article_pmcid]) for article_pmcid in pack
+            )
+            json.dump(request_input, batch_file)
+            batch_file.write('\n')
+            event['items'] += 1
+        event['bytes'] = batch_file.tell()
+
+
+@cache
+def get_client(max_retries: int | None = None) -> 'OpenAI':
+    """
+    Create an OpenAI client using the API key and optional base URL in the settings. The openai package is only imported
+    here so that operations not using the API do not need it or an API key. Clients are shared within a process.
+    :param max_retries: The number of times the client itself retries a failed request, or None for its default.
+    Requests sent through a RateLimitGovernor use 0 so that the governor decides when to retry.
+    :return: The OpenAI client.
+    """
+
+    # Import the package and create the client, e.g. pointing base_url at a local server that simulates throttling
+    from openai import OpenAI
+    settings = get_settings()
+    kwargs = {} if max_retries is None else {'max_retries': max_retries}
+    return OpenAI(api_key=settings['api_key'], base_url=settings.get('base_url'), **kwargs)
+
+
+def format_request_output(custom_id: str, response_body: dict) -> dict:
+    """
+    Format a response in the same way as a line in a batch output file.
+    :param custom_id: The custom ID of the request.
+    :param response_body: The response body returned for the request.
+    :return: The request output.
+    """
+
+    # Only include fields used when reading batch output files
+    return {
+        'custom_id': custom_id,
+        'response': {
+            'body': response_body
+        }
+    }
+
+
+def split_cached_requests(requests_input: list[str]) -> tuple[dict[str, dict], list[str]]:
+    """
+    Separate requests that already have a cached response from those that still need to be sent.
+    :param requests_input: A list of input requests as strings.
+    :return: A tuple containing a dictionary mapping custom IDs to cached response bodies and a list of input requests
+    as strings without cached responses.
+    """
+
+    # Look up each request in the cache
+    cached = {}
+    uncached = []
+    for request_input in requests_input:
+        request_input_json = json.loads(request_input)
+        response_body = read_cached_response(get_request_key(request_input_json['body']))
+        if response_body is None:
+            uncached.append(request_input)
+        else:
+            cached[request_input_json['custom_id']] = response_body
+    return cached, uncached
 
 
-def execute_batch(batch_id: str) -> None:
+def execute_batch(batch_id: str, use_cache: bool = True) -> None:
     """
-    Execute a batch from a file of requests.
+    Execute a batch from a file of requests. Requests with cached responses are not sent.
     :param batch_id: A unique identifier for the batch.
+    :param use_cache: Whether to skip requests with cached responses.
     """
 
-    # Upload the request file
-    client = OpenAI(api_key=api_key)
-    batch_input_file = client.files.create(
-        file=open(paths['batch']['input'].format(batch_id=batch_id), 'rb'),
-        purpose='batch'
-    )
+    # Read all requests from the batch
+    with open(paths['batch']['input'].format(batch_id=batch_id)) as file:
+        requests_input = file.readlines()
+
+    # Find requests that still need to be sent
+    cached, uncached = split_cached_requests(requests_input) if use_cache else ({}, requests_input)
+    print(f"Cached Responses: {len(cached)}")
+    print(f"Requests to Send: {len(uncached)}")
+
+    # Write the batch output directly if every response is cached
+    if len(uncached) == 0:
+        write_batch_output(batch_id, requests_input, cached, {})
+        with open(paths['batch']['info'].format(batch_id=batch_id), 'w') as file:
+            json.dump({'id': None, 'input_file_id': None}, file)
+        return
+
+    # Write the requests to be sent
+    with open(paths['batch']['pending'].format(batch_id=batch_id), 'w') as file:
+        file.writelines(uncached)
+
+    # Upload the request file, retrying if throttled
+    client = get_client(max_retries=0)
+    governor = get_governor(1)
+    with stage('upload', batch_id=batch_id) as event:
+        event['items'] = len(uncached)
+        event['bytes'] = os.path.getsize(paths['batch']['pending'].format(batch_id=batch_id))
+
+        # Reopen the file for each attempt
+        def upload() -> Any:
+            with open(paths['batch']['pending'].format(batch_id=batch_id), 'rb') as file:
+                return client.files.with_raw_response.create(file=file, purpose='batch')
+        batch_input_file = governor.call(upload, 0)
 
     # Create a batch request
-    client.batches.create(
+    batch = governor.call(lambda: client.batches.with_raw_response.create(
         input_file_id=batch_input_file.id,
         endpoint='/v1/chat/completions',
         completion_window='24h'
-    )
+    ), 0)
+
+    # Save the batch ID for retrieving the output later
+    with open(paths['batch']['info'].format(batch_id=batch_id), 'w') as file:
+        json.dump({'id': batch.id, 'input_file_id': batch_input_file.id}, file)
+
+
+def retrieve_batch(batch_id: str) -> str:
+    """
+    Download the output of a completed batch, cache its responses, and write a batch output file that also includes
+    cached responses for requests that were not sent.
+    :param batch_id: A unique identifier for the batch.
+    :return: The status of the batch, which is 'completed' if the batch output was written. Batches that are 'failed',
+    'expired', or 'cancelled' will never complete.
+    """
+
+    # Check the status of the batch
+    with open(paths['batch']['info'].format(batch_id=batch_id)) as file:
+        batch_info = json.load(file)
+    if batch_info['id'] is None:
+        print("Batch Status: all responses were cached")
+        return 'completed'
+    client = get_client()
+    batch = client.batches.retrieve(batch_info['id'])
+    print(f"Batch Status: {batch.status}")
+    if batch.status != 'completed':
+        return batch.status
+
+    # Download the outputs of successful requests and the errors of failed requests, either of which is missing if no
+    # request had that outcome
+    requests_output = {}
+    with stage('download', batch_id=batch_id) as event:
+        for file_id in [batch.error_file_id, batch.output_file_id]:
+            if file_id is None:
+                continue
+            content = client.files.content(file_id).text
+            event['bytes'] += len(content)
+            for request_output in content.splitlines(keepends=True):
+                if request_output.strip():
+                    requests_output[json.loads(request_output)['custom_id']] = request_output
+        event['items'] = len(requests_output)
+
+    # Read all requests from the batch
+    with open(paths['batch']['input'].format(batch_id=batch_id)) as file:
+        requests_input = file.readlines()
+
+    # Write the batch output with cached responses for requests that were not sent
+    cached, _ = split_cached_requests(requests_input)
+    write_batch_output(batch_id, requests_input, cached, requests_output)
+    return 'completed'
+
+
+def write_batch_output(
+    batch_id: str,
+    requests_input: list[str],
+    cached: dict[str, dict],
+    requests_output: dict[str, str]
+) -> None:
+    """
+    Write a batch output file in the order of the batch input file, combining new and cached responses. Successful new
+    responses are added to the cache, requests without any response are written as failed, and outputs of packed
+    requests are then split into outputs for each article.
+    :param batch_id: A unique identifier for the batch.
+    :param requests_input: A list of input requests as strings.
+    :param cached: A dictionary mapping custom IDs to cached response bodies.
+    :param requests_output: A dictionary mapping custom IDs to new output requests as strings.
+    """
+
+    # Write each response in order
+    with open(paths['batch']['output'].format(batch_id=batch_id), 'w') as file:
+        for request_input in requests_input:
+            request_input = json.loads(request_input)
+            custom_id = request_input['custom_id']
+
+            # Prefer new responses and cache them if successful
+            if custom_id in requests_output:
+                request_output = json.loads(requests_output[custom_id])
+                response = request_output.get('response') or {}
+                if response.get('status_code', 200) == 200 and 'body' in response:
+                    write_cached_response(get_request_key(request_input['body']), response['body'])
+                file.write(requests_output[custom_id].rstrip('\n') + '\n')
+
+            # Otherwise, use cached responses
+            elif custom_id in cached:
+                json.dump(format_request_output(custom_id, cached[custom_id]), file)
+                file.write('\n')
+
+            # Record requests without any response as failed
+            else:
+                print(f"No response for {custom_id}", file=sys.stderr)
+                json.dump({'custom_id': custom_id, 'response': None, 'error': {'message': "No response"}}, file)
+                file.write('\n')
+
+    # Split the outputs of packed requests into outputs for each article
+    unpack_batch_output(batch_id)
 
 
-def execute_chat_completion(kwargs: dict) -> dict:
+def execute_chat_completion(kwargs: dict, governor: 'RateLimitGovernor | None' = None, tokens: int = 0) -> dict:
     """
     Execute a single chat completion synchronously.
     :param kwargs: Keyword arguments passed to the chat completion request body.
+    :param governor: A governor pacing requests and retrying throttled ones, or None to send the request directly.
+    :param tokens: The number of tokens the request counts against the tokens-per-minute limit.
     :return: The chat completion object.
     """
 
     # Create a chat completion for one request
-    client = OpenAI(api_key=api_key)
-    return client.chat.completions.create(**kwargs)
+    if governor is None:
+        return get_client().chat.completions.create(**kwargs)
+    client = get_client(max_retries=0)
+    return governor.call(lambda: client.chat.completions.with_raw_response.create(**kwargs), tokens)
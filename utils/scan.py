@@ -0,0 +1,98 @@
+import numpy as np
+
+import mmap
+import os
+import re
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+
+paths = get_paths()
+articles_texts = paths['data']['articles']['texts']
+
+
+def find_refs_offset(data: mmap.mmap) -> int:
+    """
+    Find where the references of an article begin without decoding it.
+    :param data: The bytes of the article.
+    :return: The offset of the line '==== Refs' or the length of the article if it has no references.
+    """
+
+    # The references may be the first line
+    if data[:10] == b'==== Refs\n' or data[:11] == b'==== Refs\r\n':
+        return 0
+
+    # Otherwise, find the earliest line containing only the marker
+    offsets = [data.find(marker) for marker in [b'\n==== Refs\n', b'\n==== Refs\r\n']]
+    offsets = [offset + 1 for offset in offsets if offset != -1]
+    return min(offsets) if len(offsets) > 0 else len(data)
+
+
+def scan_article(
+    article_pmcid: str,
+    genes_regex_bytes: bytes,
+    genes_regex: str
+) -> tuple[int, list[tuple[int, str, int]]]:
+    """
+    Find lines mentioning gene symbols in an article (excluding references) by memory-mapping the file and searching its
+    bytes, only decoding lines with a candidate match to count gene symbols exactly as in get_relevant_lines. Invalid
+    UTF-8 bytes separate words here, whereas they are dropped when decoding the whole file with errors='ignore'.
+    :param article_pmcid: The article's PMCID.
+    :param genes_regex_bytes: A regular expression for bytes from create_genes_regex_bytes.
+    :param genes_regex: The regular expression from create_genes_regex for the same gene symbols.
+    :return: A tuple containing the number of lines before the references and a list of the line number, decoded line,
+    and number of unique gene symbols of each line mentioning any.
+    """
+
+    # Empty files cannot be memory-mapped
+    with open(f'{articles_texts}/{article_pmcid}.txt', 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return 0, []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = find_refs_offset(data)
+
+            # Number each line by the newlines before it
+            newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8, count=end) == ord('\n'))
+            n_lines = newlines.shape[0] + (1 if end > 0 and data[end - 1] != ord('\n') else 0)
+
+            # Jump from one candidate line to the next, decoding and checking only those lines
+            pattern = re.compile(genes_regex_bytes)
+            gene_lines = []
+            position = 0
+            while (match := pattern.search(data, position, end)) is not None:
+                start = data.rfind(b'\n', 0, match.start()) + 1
+                stop = data.find(b'\n', match.end(), end)
+                stop = end if stop == -1 else stop + 1
+                line = data[start:stop].decode('utf-8', errors='ignore').replace('\r\n', '\n')
+                n_genes = len(set(re.findall(genes_regex, line)))
+                if n_genes > 0:
+                    gene_lines.append((int(np.searchsorted(newlines, start)), line, n_genes))
+                position = stop
+    return n_lines, gene_lines
+
+
+def get_relevant_lines_mmap(
+    article_pmcid: str,
+    genes_regex_bytes: bytes,
+    genes_regex: str,
+    threshold: int
+) -> tuple[list[str], np.ndarray]:
+    """
+    Get all lines in an article (excluding references) containing any gene symbols, as in get_relevant_lines but by
+    scanning the article's bytes with scan_article.
+    :param article_pmcid: The article's PMCID.
+    :param genes_regex_bytes: A regular expression for bytes from create_genes_regex_bytes.
+    :param genes_regex: The regular expression from create_genes_regex for the same gene symbols.
+    :param threshold: The minimum number of unique gene symbols a line must have to be returned.
+    :return: A tuple containing a list of lines with at least the minimum number of unique gene symbols and an array
+    with the number of unique gene symbols on each line before the references.
+    """
+
+    # Keep lines with enough gene symbols and place their counts among all lines
+    n_lines, gene_lines = scan_article(article_pmcid, genes_regex_bytes, genes_regex)
+    line_gene_counts = np.zeros(n_lines, dtype=np.int64)
+    for line_number, _, n_genes in gene_lines:
+        line_gene_counts[line_number] = n_genes
+    return [line for _, line, n_genes in gene_lines if n_genes >= threshold], line_gene_counts
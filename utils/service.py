@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import pathlib
+import queue
+import sqlite3
+import sys
+import threading
+from typing import Any, Callable, Hashable, Iterator
+
+sys.path.append(os.getcwd())
+
+
+def connect_read_only(path: str) -> sqlite3.Connection:
+    """
+    Open a read-only connection to a SQLite database that may be used from any thread. In write-ahead logging mode,
+    reads on such a connection never wait for writers and see the data as of the last commit.
+    :param path: The path to the SQLite database.
+    :return: A connection to the SQLite database.
+    """
+
+    # Open the file as a URI so that it cannot be written to or created
+    uri = f'{pathlib.Path(path).absolute().as_uri()}?mode=ro'
+    return sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30, cached_statements=256)
+
+
+class ConnectionPool:
+    """
+    A fixed number of read-only connections to a SQLite database shared by threads, each used by one thread at a time.
+    Each connection keeps the statements it has prepared, so repeated queries are only compiled once per connection.
+    """
+
+    def __init__(self, path: str, size: int) -> None:
+        """
+        :param path: The path to the SQLite database.
+        :param size: The number of connections.
+        """
+
+        # Open every connection up front
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(connect_read_only(path))
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection, waiting for one to be returned if all are in use.
+        :return: A context manager yielding a connection, which is returned to the pool on exit.
+        """
+
+        # Return the connection even if the query fails
+        con = self.connections.get()
+        try:
+            yield con
+        finally:
+            self.connections.put(con)
+
+    def close(self) -> None:
+        """
+        Close every connection, which must all have been returned.
+        """
+
+        # Empty the pool
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+class ResultCache:
+    """
+    A least recently used cache of query results that is cleared whenever another connection commits changes to the
+    database, such as an insert script adding gene signatures. Changes are detected through PRAGMA data_version on a
+    connection of its own.
+    """
+
+    def __init__(self, path: str, max_size: int) -> None:
+        """
+        :param path: The path to the SQLite database.
+        :param max_size: The maximum number of results to keep.
+        """
+
+        # Cached results and the version of the database they were read from
+        self.results = OrderedDict()
+        self.max_size = max_size
+        self.watcher = connect_read_only(path)
+        self.data_version = None
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """
+        Clear the cache if the database has changed since it was last checked.
+        :return: The current version of the database.
+        """
+
+        # The data version only changes when another connection commits
+        with self.lock:
+            data_version = self.watcher.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self.data_version:
+                if self.data_version is not None:
+                    self.stats['invalidations'] += 1
+                self.results.clear()
+                self.data_version = data_version
+            return data_version
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Get a cached result or compute it and cache it. Results computed while the database changed are not cached,
+        since they may already be out of date.
+        :param key: A key identifying the query and its parameters.
+        :param compute: A function running the query.
+        :return: The result.
+        """
+
+        # Use the cached result if any
+        data_version = self.refresh()
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.stats['hits'] += 1
+                return self.results[key]
+            self.stats['misses'] += 1
+
+        # Otherwise, run the query without holding the lock and cache the result, forgetting the least recently used
+        result = compute()
+        with self.lock:
+            if self.data_version == data_version:
+                self.results[key] = result
+                self.results.move_to_end(key)
+                while len(self.results) > self.max_size:
+                    self.results.popitem(last=False)
+        return result
+
+    def close(self) -> None:
+        """
+        Close the connection used to detect changes.
+        """
+
+        # Close the watcher
+        self.watcher.close()
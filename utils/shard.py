@@ -0,0 +1,61 @@
+import argparse
+import hashlib
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parse a shard given on the command line as 'i/N', where shards are numbered from 0 to N - 1.
+    :param shard: The shard as given on the command line.
+    :return: A tuple containing the shard index and the number of shards.
+    """
+
+    # Both parts must be integers with 0 <= i < N
+    try:
+        index, count = (int(part) for part in shard.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard must be given as i/N, not {shard!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be between 0 and {count - 1}, not {index}")
+    return index, count
+
+
+def get_shard_index(pmcid: str, count: int) -> int:
+    """
+    Assign an article to a shard by hashing its PMCID, which gives the same shard on every machine and run.
+    :param pmcid: The article's PMCID.
+    :param count: The number of shards.
+    :return: The index of the article's shard.
+    """
+
+    # Python's built-in hash is randomized per process, so use SHA-256 instead
+    return int.from_bytes(hashlib.sha256(pmcid.encode()).digest()[:8], 'big') % count
+
+
+def select_shard(pmcids: list[str], shard: tuple[int, int] | None) -> list[str]:
+    """
+    Keep only the articles assigned to a shard.
+    :param pmcids: A list of PMCIDs.
+    :param shard: A tuple containing the shard index and the number of shards, or None to keep every article.
+    :return: A list of PMCIDs in the shard, in their original order.
+    """
+
+    # Keep every article if not sharding
+    if shard is None:
+        return pmcids
+    index, count = shard
+    return [pmcid for pmcid in pmcids if get_shard_index(pmcid, count) == index]
+
+
+def get_shard_batch_id(batch_id: str, shard: tuple[int, int] | None) -> str:
+    """
+    Get the identifier of a shard of a batch so that each shard has its own files.
+    :param batch_id: A unique identifier for the whole batch.
+    :param shard: A tuple containing the shard index and the number of shards, or None if not sharding.
+    :return: The identifier of the shard, or of the whole batch if not sharding.
+    """
+
+    # Add the shard to the identifier
+    if shard is None:
+        return batch_id
+    index, count = shard
+    return f'{batch_id}_shard_{index}_of_{count}'
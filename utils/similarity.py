@@ -0,0 +1,139 @@
+import numpy as np
+
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.instrument import stage
+from utils.sql import get_query
+
+paths = get_paths()
+
+
+def get_signatures_fingerprint(con: sqlite3.Connection) -> np.ndarray:
+    """
+    Get a fingerprint of the GeneSignature table that changes whenever rows are inserted, updated, or deleted, using the
+    version kept up to date by triggers on the table, so that checking whether the index is stale takes constant time.
+    :param con: A connection to the SQLite database.
+    :return: An array containing the version of the table and its maximum row ID.
+    """
+
+    # Read the version and the last row ID
+    return np.array(con.execute(get_query('signatures_fingerprint')).fetchone(), dtype=np.int64)
+
+
+def build_signature_index(con: sqlite3.Connection) -> dict[str, np.ndarray]:
+    """
+    Build an inverted index mapping each gene to the gene signatures containing it.
+    :param con: A connection to the SQLite database.
+    :return: A dictionary of arrays making up the index. 'pmcids' and 'genes' list the articles and Ensembl IDs in
+    sorted order, 'sizes' has the number of genes in each signature, and the signatures containing the gene at index i
+    are given by 'postings'['offsets'[i]:'offsets'[i + 1]].
+    """
+
+    # Read all gene signatures
+    with stage('index_build', table='GeneSignature') as event:
+        fingerprint = get_signatures_fingerprint(con)
+        rows = con.execute('SELECT article_pmcid, gene_ensembl_id FROM GeneSignature').fetchall()
+        event['items'] = len(rows)
+        rows = np.array(rows, dtype=str).reshape(-1, 2)
+
+        # Encode articles and genes as integers
+        pmcids, pmcid_codes = np.unique(rows[:, 0], return_inverse=True)
+        genes, gene_codes = np.unique(rows[:, 1], return_inverse=True)
+
+        # Group signatures by gene
+        order = np.argsort(gene_codes, kind='stable')
+        return {
+            'fingerprint': fingerprint,
+            'pmcids': pmcids,
+            'genes': genes,
+            'sizes': np.bincount(pmcid_codes, minlength=pmcids.shape[0]),
+            'postings': pmcid_codes[order],
+            'offsets': np.searchsorted(gene_codes[order], np.arange(genes.shape[0] + 1)),
+        }
+
+
+def save_signature_index(index: dict[str, np.ndarray]) -> None:
+    """
+    Save a gene signature index to a file.
+    :param index: The index returned by build_signature_index.
+    """
+
+    # Write all arrays to a single file
+    np.savez(paths['db']['signature_index'], **index)
+
+
+def load_signature_index(con: sqlite3.Connection) -> dict[str, np.ndarray]:
+    """
+    Load the saved gene signature index, rebuilding and saving it if the GeneSignature table has changed.
+    :param con: A connection to the SQLite database.
+    :return: The index.
+    """
+
+    # Use the saved index if it is up to date
+    try:
+        with np.load(paths['db']['signature_index']) as file:
+            index = dict(file)
+        if 'fingerprint' in index and np.array_equal(index['fingerprint'], get_signatures_fingerprint(con)):
+            return index
+    except FileNotFoundError as exception:
+        print(f"{type(exception).__name__}: {exception}", file=sys.stderr)
+
+    # Rebuild the index otherwise
+    print("Rebuilding the gene signature index.", file=sys.stderr)
+    index = build_signature_index(con)
+    save_signature_index(index)
+    return index
+
+
+def search_signatures(
+    index: dict[str, np.ndarray],
+    ensembl_ids: list[str],
+    k: int,
+    metric: str
+) -> list[tuple[str, float, int]]:
+    """
+    Find the gene signatures most similar to a set of genes.
+    :param index: The index returned by build_signature_index or load_signature_index.
+    :param ensembl_ids: The Ensembl IDs of the genes in the query.
+    :param k: The maximum number of gene signatures to return.
+    :param metric: Either 'jaccard' for the Jaccard index or 'overlap' for the overlap coefficient.
+    :return: A list of tuples containing the PMCID of each signature, its similarity to the query, and the number of
+    genes shared with the query, in descending order of similarity.
+    """
+
+    # Find the genes in the query that appear in any signature
+    query = np.unique(np.array(ensembl_ids, dtype=str))
+    if query.shape[0] == 0 or index['genes'].shape[0] == 0:
+        return []
+    positions = np.minimum(np.searchsorted(index['genes'], query), index['genes'].shape[0] - 1)
+    positions = positions[index['genes'][positions] == query]
+
+    # Count the genes each signature shares with the query
+    postings = [index['postings'][index['offsets'][i]:index['offsets'][i + 1]] for i in positions]
+    if len(postings) == 0:
+        return []
+    intersections = np.bincount(np.concatenate(postings), minlength=index['pmcids'].shape[0])
+    candidates = np.nonzero(intersections)[0]
+    intersections = intersections[candidates]
+    sizes = index['sizes'][candidates]
+
+    # Calculate similarities
+    match metric:
+        case 'jaccard':
+            similarities = intersections / (query.shape[0] + sizes - intersections)
+        case 'overlap':
+            similarities = intersections / np.minimum(query.shape[0], sizes)
+        case _:
+            raise ValueError(f"Unknown metric: {metric}")
+
+    # Take the top k signatures, breaking ties by the number of shared genes
+    order = np.lexsort((-intersections, -similarities))[:k]
+    return [
+        (str(index['pmcids'][candidates[i]]), float(similarities[i]), int(intersections[i]))
+        for i in order
+    ]
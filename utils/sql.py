@@ -1,12 +1,20 @@
-import json
+from functools import cache
+import os
+import sqlite3
+import sys
 
-with open('paths.json') as file:
-    paths = json.load(file)
+sys.path.append(os.getcwd())
 
+from utils.config import get_paths
 
+paths = get_paths()
+
+
+@cache
 def get_query(query_name: str) -> str:
     """
-    Read a SQL query from a file.
+    Read a SQL query from a file. Each file is only read once per process, and the identical string returned each time
+    lets sqlite3 reuse its prepared statement.
     :query_name: The name of the query.
     :return: A SQL query.
     """
@@ -17,3 +25,36 @@ def get_query(query_name: str) -> str:
 
     # Format the query
     return ''.join(query)
+
+
+def get_ensembl_ids(gene: str, con: sqlite3.Connection) -> list[str]:
+    """
+    Get the Ensembl IDs of a gene given its name, a synonym, or its Ensembl ID.
+    :param gene: The gene name, synonym, or Ensembl ID.
+    :param con: A connection to the SQLite database.
+    :return: A list of Ensembl IDs, which is empty if the gene is not found.
+    """
+
+    # Treat the gene as a gene name first, then as a synonym
+    for query_name, param in [('gene_name', 'gene'), ('gene_synonym_name', 'synonym')]:
+        ensembl_ids = [row[0] for row in con.execute(get_query(query_name), {param: gene})]
+        if len(ensembl_ids) > 0:
+            return ensembl_ids
+
+    # Otherwise, assume the gene is given by its Ensembl ID
+    return [gene] if gene.startswith('ENSG') else []
+
+
+def connect_wal(path: str) -> sqlite3.Connection:
+    """
+    Connect to a SQLite database for writing, switching it to write-ahead logging so that readers, such as the query
+    service in db/serve.py, keep reading the last committed data instead of waiting while data is inserted. The
+    journal mode is saved in the database, so this only changes the file the first time.
+    :param path: The path to the SQLite database.
+    :return: A connection to the SQLite database.
+    """
+
+    # Connect and switch the journal mode
+    con = sqlite3.connect(path)
+    con.execute('PRAGMA journal_mode=WAL')
+    return con
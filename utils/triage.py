@@ -0,0 +1,128 @@
+import numpy as np
+
+import json
+import os
+import re
+import sqlite3
+import sys
+
+sys.path.append(os.getcwd())
+
+from utils.config import get_paths
+from utils.sql import get_query
+
+paths = get_paths()
+
+# Phrases that often accompany gene signatures
+keywords_regex = re.compile(
+    r'\b(?:signatures?|differentially expressed|DEGs?|up-?regulated|down-?regulated|fold[- ]change|hub genes?|'
+    r'gene sets?|gene panels?|prognostic|risk scores?|biomarkers?)\b',
+    re.IGNORECASE,
+)
+
+# Features used for scoring articles and the weight of each after a log transform
+feature_names = ['gene_line_percent', 'relevant_line_percent', 'longest_gene_run', 'max_genes_per_line', 'keywords']
+feature_weights = np.array([1.0, 1.0, 1.0, 1.0, 0.5])
+
+
+def get_line_gene_counts(article_lines: list[str], genes_regex: str) -> np.ndarray:
+    """
+    Count the unique gene symbols on each line of an article (excluding references). Lines are matched in the same way
+    as in get_relevant_lines.
+    :param article_lines: A list of lines in the article.
+    :param genes_regex: A regular expression that matches gene symbols.
+    :return: An array with the number of unique gene symbols on each line before the references.
+    """
+
+    # Search each line for gene symbols
+    line_gene_counts = []
+    for line in article_lines:
+        if line == '==== Refs\n':
+            break
+        line_gene_counts.append(len(set(re.findall(genes_regex, line))))
+    return np.array(line_gene_counts, dtype=np.int64)
+
+
+def get_indexed_line_gene_counts(article_pmcid: str, con: sqlite3.Connection) -> np.ndarray:
+    """
+    Count the unique gene symbols on each line of an article using the gene mention index. The result is the same as
+    get_line_gene_counts with the regular expression used for indexing.
+    :param article_pmcid: The article's PMCID.
+    :param con: A connection to the SQLite database.
+    :return: An array with the number of unique gene symbols on each line before the references.
+    """
+
+    # Place the counts of lines with gene mentions among all lines of the article
+    n_lines = con.execute('SELECT lines FROM IndexedArticle WHERE article_pmcid = ?', (article_pmcid,)).fetchone()[0]
+    rows = np.array(con.execute(get_query('line_gene_counts'), {'pmcid': article_pmcid}).fetchall(), dtype=np.int64)
+    line_gene_counts = np.zeros(n_lines, dtype=np.int64)
+    if rows.shape[0] > 0:
+        line_gene_counts[rows[:, 0]] = rows[:, 1]
+    return line_gene_counts
+
+
+def get_triage_features(line_gene_counts: np.ndarray, article_relevant: str, threshold: int) -> np.ndarray:
+    """
+    Compute features describing how likely an article is to contain a gene signature.
+    :param line_gene_counts: The number of unique gene symbols on each line before the references.
+    :param article_relevant: A string with all relevant lines from the article.
+    :param threshold: The minimum number of unique gene symbols a relevant line has.
+    :return: An array of features in the order of feature_names.
+    """
+
+    # Articles without any lines have no features
+    if line_gene_counts.shape[0] == 0:
+        return np.zeros(len(feature_names))
+
+    # Find the longest run of consecutive lines mentioning any gene, as in tables of genes
+    gene_lines = line_gene_counts > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], gene_lines.astype(np.int8), [0]))))
+    runs = edges[1::2] - edges[::2]
+
+    # Combine line-level statistics with keyword cues in the relevant lines
+    return np.array([
+        100 * gene_lines.mean(),
+        100 * (line_gene_counts >= threshold).mean(),
+        runs.max() if runs.shape[0] > 0 else 0,
+        line_gene_counts.max(),
+        len(keywords_regex.findall(article_relevant)),
+    ], dtype=np.float64)
+
+
+def score_articles(features: np.ndarray) -> np.ndarray:
+    """
+    Score articles from their features, with higher scores for articles more likely to contain a gene signature.
+    :param features: An array of features with one row per article.
+    :return: An array of scores.
+    """
+
+    # Weigh log-transformed features
+    return np.log1p(features).reshape(-1, feature_weights.shape[0]) @ feature_weights
+
+
+def load_triage_cutoff() -> float:
+    """
+    Load the calibrated score below which articles are not sent to the API.
+    :return: The cutoff score.
+    """
+
+    # Read the cutoff saved during calibration
+    with open(paths['run']['triage']) as file:
+        return json.load(file)['cutoff']
+
+
+def save_triage_cutoff(cutoff: float, calibration: dict) -> None:
+    """
+    Save a calibrated cutoff score.
+    :param cutoff: The cutoff score.
+    :param calibration: Statistics describing how the cutoff was chosen.
+    """
+
+    # Write the cutoff along with the features and weights it applies to
+    with open(paths['run']['triage'], 'w') as file:
+        json.dump({
+            'cutoff': cutoff,
+            'features': feature_names,
+            'weights': feature_weights.tolist(),
+            **calibration,
+        }, file, indent=4)